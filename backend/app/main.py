@@ -1,16 +1,61 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from .database import engine, Base
+from .database import async_engine
 from .config import settings
-from .routers import scans, printers, remote_scanner, photo_scanner, sessions
+from .services.decode_executor import decode_executor
+from .services.export_jobs import export_jobs
+from .services.print_service import print_workers
+from .services.network_printer import network_printers
+from .services.partitions import partitions
+from .services.printer_registry import printer_registry
+from .services.remote_sessions import remote_sessions
+from .services.scan_relay import relayed_scans
+from .services.scan_stats import scan_stats
+from .services.session_store import session_store
+from .routers import (
+    scans,
+    printers,
+    remote_scanner,
+    photo_scanner,
+    sessions,
+    qr_generator,
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    printer_registry.ensure_default()
+    await session_store.start(remote_scanner.manager.deliver)
+    tasks = [
+        asyncio.create_task(export_jobs.cleanup_loop()),
+        asyncio.create_task(remote_sessions.flush_loop()),
+        asyncio.create_task(remote_scanner.sweep_expired_sessions()),
+        asyncio.create_task(partitions.maintenance_loop()),
+        asyncio.create_task(scan_stats.refresh_loop()),
+    ]
+    if settings.SCAN_RELAY_PERSIST:
+        tasks.append(asyncio.create_task(relayed_scans.flush_loop()))
+    print_workers.start()
+    yield
+    for task in tasks:
+        task.cancel()
+    await remote_sessions.flush()
+    await relayed_scans.flush()
+    await session_store.stop()
+    print_workers.stop()
+    network_printers.close_all()
+    export_jobs.shutdown()
+    decode_executor.shutdown()
+    await async_engine.dispose()
 
-# Создаем таблицы при запуске
-Base.metadata.create_all(bind=engine)
 
 app = FastAPI(
     title="QR Replication System",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -19,6 +64,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 app.include_router(scans.router)
@@ -26,6 +72,7 @@ app.include_router(printers.router)
 app.include_router(remote_scanner.router)
 app.include_router(photo_scanner.router)
 app.include_router(sessions.router)
+app.include_router(qr_generator.router)
 
 
 @app.get("/")
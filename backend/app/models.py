@@ -1,25 +1,123 @@
-from sqlalchemy import String, Integer, Boolean, DateTime, Text, ForeignKey
+from sqlalchemy import (
+    BigInteger, String, Integer, Boolean, DateTime, Text, ForeignKey, Index, text
+)
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from datetime import datetime, timedelta
+import hashlib
 from .database import Base
 
 
+def qr_content_hash(content: str) -> int:
+    """First 8 bytes of the SHA-256 of the code as a signed bigint.
+
+    Migration 0004 backfills existing rows with the same value computed in SQL.
+    """
+    digest = hashlib.sha256(content.encode()).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+def _qr_hash_default(context) -> int:
+    return qr_content_hash(context.get_current_parameters()["qr_content"])
+
+
+# In Postgres the table is range-partitioned by month on scanned_at
+# (migration 0003) and its primary key is (id, scanned_at); ids still come
+# from one sequence and are unique.
 class ScanRecord(Base):
     __tablename__ = "scan_records"
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
     qr_content: Mapped[str] = mapped_column(Text, nullable=False)
+    # Exact lookups by code go through this fixed-size hash instead of the
+    # text; always compare qr_content too, hashes can collide
+    qr_hash: Mapped[int | None] = mapped_column(
+        BigInteger, nullable=True, default=_qr_hash_default
+    )
     scan_source: Mapped[str] = mapped_column(String(50), default="scanner")
     scanned_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), default=datetime.now
     )
     print_status: Mapped[str] = mapped_column(String(20), default="pending")
+    printed_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    # Uniqueness is enforced by ScanIdempotencyKey
+    idempotency_key: Mapped[str | None] = mapped_column(String(100), nullable=True)
+
+    # Keyset pagination of history and its filters
+    __table_args__ = (
+        Index("idx_scan_records_scanned_at_id", "scanned_at", "id"),
+        Index("idx_scan_records_source_scanned_at", "scan_source", "scanned_at", "id"),
+        Index("idx_scan_records_status_scanned_at", "print_status", "scanned_at", "id"),
+        # Scans whose label hasn't printed yet
+        Index(
+            "idx_scan_records_unprinted",
+            "scanned_at",
+            "id",
+            postgresql_where=text("print_status <> 'success'"),
+        ),
+        # History of one code
+        Index("idx_scan_records_qr_hash", "qr_hash", "scanned_at", "id"),
+        # Substring and prefix search (pg_trgm)
+        Index(
+            "idx_scan_records_qr_content_trgm",
+            "qr_content",
+            postgresql_using="gin",
+            postgresql_ops={"qr_content": "gin_trgm_ops"},
+        ),
+    )
+
+
+# Idempotency key -> scan. A partitioned table can't have a unique key that
+# doesn't include the partition column; scanned_at prunes the scan lookup.
+class ScanIdempotencyKey(Base):
+    __tablename__ = "scan_idempotency_keys"
+
+    idempotency_key: Mapped[str] = mapped_column(String(100), primary_key=True)
+    scan_id: Mapped[int] = mapped_column(Integer)
+    scanned_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+
+# Scans per hour/day bucket by source and print status, rebuilt per day by
+# services/scan_stats.py. Kept when the scans' partition is archived.
+class ScanStat(Base):
+    __tablename__ = "scan_stats"
+
+    period: Mapped[str] = mapped_column(String(4), primary_key=True)  # hour | day
+    bucket: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    scan_source: Mapped[str] = mapped_column(String(50), primary_key=True)
+    print_status: Mapped[str] = mapped_column(String(20), primary_key=True)
+    scans: Mapped[int] = mapped_column(Integer)
+
+
+# Per bucket totals; distinct codes don't add up across buckets
+class ScanStatTotal(Base):
+    __tablename__ = "scan_stats_totals"
+
+    period: Mapped[str] = mapped_column(String(4), primary_key=True)
+    bucket: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    scans: Mapped[int] = mapped_column(Integer)
+    unique_codes: Mapped[int] = mapped_column(Integer)
+
+
+# Single row: how far the rollup has read scan_records and print_jobs
+class ScanStatsState(Base):
+    __tablename__ = "scan_stats_state"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    last_scan_id: Mapped[int] = mapped_column(Integer, default=0)
+    last_finished_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    refreshed_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
 
 
 class Printer(Base):
     __tablename__ = "printers"
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
     name: Mapped[str] = mapped_column(String(100), unique=True)
     connection_type: Mapped[str] = mapped_column(String(50))  
     ip_address: Mapped[str | None] = mapped_column(String(45), nullable=True)
@@ -34,7 +132,7 @@ class Printer(Base):
 class RemoteSession(Base):
     __tablename__ = "remote_sessions"
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
     session_id: Mapped[str] = mapped_column(String(6), unique=True, index=True)
     host_connected: Mapped[bool] = mapped_column(Boolean, default=False)
     client_connected: Mapped[bool] = mapped_column(Boolean, default=False)
@@ -46,11 +144,22 @@ class RemoteSession(Base):
     )
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
 
+    # Only active sessions are indexed, so listing and expiring them stays
+    # proportional to the number of live sessions, not the table size
+    __table_args__ = (
+        Index(
+            "idx_remote_sessions_active_expires_at",
+            "expires_at",
+            postgresql_where=text("is_active"),
+        ),
+    )
+
 
+# Partitioned by month on created_at in Postgres, like scan_records
 class PhotoScan(Base):
     __tablename__ = "photo_scans"
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
     filename: Mapped[str] = mapped_column(String(255))
     file_path: Mapped[str] = mapped_column(String(500))
     qr_content: Mapped[str | None] = mapped_column(Text, nullable=True)
@@ -62,3 +171,95 @@ class PhotoScan(Base):
         DateTime(timezone=True), nullable=True
     )
     is_processed: Mapped[bool] = mapped_column(Boolean, default=False)
+
+    __table_args__ = (
+        Index("idx_photo_scans_created_at_id", "created_at", "id"),
+        Index("idx_photo_scans_session_created_at", "session_id", "created_at", "id"),
+        Index(
+            "idx_photo_scans_unprocessed",
+            "created_at",
+            "id",
+            postgresql_where=text("NOT is_processed"),
+        ),
+    )
+
+
+class PrintJob(Base):
+    __tablename__ = "print_jobs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    # No foreign key: scan_records is partitioned. Jobs of archived scans
+    # are deleted with their partition.
+    scan_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    printer_id: Mapped[int | None] = mapped_column(
+        ForeignKey("printers.id", ondelete="SET NULL"), nullable=True
+    )
+    qr_content: Mapped[str] = mapped_column(Text, nullable=False)
+    label_size: Mapped[str] = mapped_column(String(20), default="50x30")
+    copies: Mapped[int] = mapped_column(Integer, default=1)
+    # queued -> printing -> done | failed
+    status: Mapped[str] = mapped_column(String(20), default="queued")
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=datetime.now
+    )
+    next_attempt_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=datetime.now
+    )
+    claimed_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    finished_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+
+    # Workers only ever look at unfinished jobs
+    __table_args__ = (
+        Index(
+            "idx_print_jobs_pending",
+            "status",
+            "next_attempt_at",
+            postgresql_where=text("status IN ('queued', 'printing')"),
+        ),
+        Index("idx_print_jobs_scan_id", "scan_id"),
+        # Scan statistics pick up print results since their last run
+        Index("idx_print_jobs_finished_at", "finished_at"),
+    )
+
+
+# Background exports, shared by all workers: any of them can report progress
+# or serve the file. queued -> running -> done | failed
+class ExportJob(Base):
+    __tablename__ = "export_jobs"
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    format: Mapped[str] = mapped_column(String(10))
+    start_date: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    end_date: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    status: Mapped[str] = mapped_column(String(20), default="queued")
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    rows_processed: Mapped[int] = mapped_column(Integer, default=0)
+    total_rows: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    file_path: Mapped[str | None] = mapped_column(String(500), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=datetime.now
+    )
+    started_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    # Last progress write of a running job; a stale one lost its worker
+    updated_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    finished_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+
+    __table_args__ = (
+        Index("idx_export_jobs_status_created_at", "status", "created_at"),
+    )
@@ -1,10 +1,24 @@
-from typing import Optional
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, BackgroundTasks
-from datetime import datetime, timedelta
+from typing import List, Optional
+from fastapi import (
+    APIRouter,
+    Depends,
+    UploadFile,
+    File,
+    HTTPException,
+    BackgroundTasks,
+    Response,
+)
+from datetime import datetime
+from sqlalchemy import insert, select
+import asyncio
 import os
+from ..config import settings
 from ..services.qr_service import QRService
-from ..database import get_db
-from sqlalchemy.orm import Session
+from ..services.decode_executor import decode_executor, DecodeQueueFull
+from ..services.pagination import InvalidCursor, apply_keyset, encode_cursor
+from ..services.remote_sessions import remote_sessions
+from ..database import get_async_db
+from sqlalchemy.ext.asyncio import AsyncSession
 from .. import models
 
 router = APIRouter(prefix="/api/photo-scanner", tags=["photo-scanner"])
@@ -15,7 +29,7 @@ async def scan_qr_from_photo(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     session_id: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Scan QR code from uploaded photo"""
     try:
@@ -36,7 +50,14 @@ async def scan_qr_from_photo(
             raise HTTPException(status_code=500, detail="Ошибка сохранения файла")
 
         # Распознаем QR-код
-        qr_content = QRService.decode_qr_from_bytes(image_bytes)
+        try:
+            decoded = await decode_executor.decode(image_bytes)
+        except DecodeQueueFull:
+            QRService.delete_file(temp_file_path)
+            raise HTTPException(
+                status_code=503, detail="Сервер перегружен, повторите попытку"
+            )
+        qr_content = decoded["qr_content"]
 
         # Сохраняем запись о сканировании
         photo_scan = models.PhotoScan(
@@ -49,31 +70,23 @@ async def scan_qr_from_photo(
         )
 
         db.add(photo_scan)
-        db.commit()
-        db.refresh(photo_scan)
+        await db.commit()
 
         # Планируем удаление файла через 5 минут
         background_tasks.add_task(delete_file_later, temp_file_path)
 
         # Если найден QR-код и это сессия, проверяем ее
         if qr_content and qr_content.isdigit() and len(qr_content) == 6:
-            session = (
-                db.query(models.RemoteSession)
-                .filter(
-                    models.RemoteSession.session_id == qr_content,
-                    models.RemoteSession.is_active == True,
-                )
-                .first()
-            )
+            session = await remote_sessions.get(qr_content)
 
-            if session:
+            if session and session.get("is_active"):
                 return {
                     "success": True,
                     "type": "session_connect",
                     "session_id": qr_content,
                     "session_exists": True,
-                    "session_active": session.is_active,
-                    "host_connected": session.host_connected,
+                    "session_active": True,
+                    "host_connected": bool(session.get("host_connected")),
                     "message": "QR-код сессии найден. Подключайтесь!",
                 }
 
@@ -83,35 +96,140 @@ async def scan_qr_from_photo(
             "message": "QR-код найден" if qr_content else "QR-код не найден на фото",
             "scan_id": photo_scan.id,
             "filename": file.filename,
+            "decode_stage": decoded["stage"],
+            "decode_timings": decoded["timings"],
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка обработки фото: {str(e)}")
 
 
+@router.post("/scan-batch/")
+async def scan_qr_batch(
+    files: List[UploadFile] = File(...),
+    session_id: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Scan QR codes from several photos in one request.
+
+    Images are decoded in parallel (at most one job per decode worker, so a
+    batch can't take the whole queue), every code found on every image is
+    returned and all PhotoScan rows are written with a single INSERT.
+    """
+    if len(files) > settings.PHOTO_BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Слишком много файлов (макс. {settings.PHOTO_BATCH_MAX_FILES})",
+        )
+
+    try:
+        images = []
+        for file in files:
+            if not file.content_type or not file.content_type.startswith("image/"):
+                images.append((file.filename, None, "Файл должен быть изображением"))
+                continue
+            image_bytes = await file.read()
+            if len(image_bytes) > 10 * 1024 * 1024:
+                images.append((file.filename, None, "Файл слишком большой (макс. 10MB)"))
+                continue
+            images.append((file.filename, image_bytes, None))
+
+        limit = asyncio.Semaphore(decode_executor.workers)
+
+        async def decode_one(image_bytes: Optional[bytes]):
+            if image_bytes is None:
+                return None
+            async with limit:
+                return await decode_executor.decode(image_bytes)
+
+        decoded = await asyncio.gather(
+            *(decode_one(image_bytes) for _, image_bytes, _ in images),
+            return_exceptions=True,
+        )
+
+        now = datetime.now()
+        results = []
+        rows = []
+        for (filename, _, error), outcome in zip(images, decoded):
+            if isinstance(outcome, DecodeQueueFull):
+                error = "Сервер перегружен, повторите попытку"
+            elif isinstance(outcome, Exception):
+                error = f"Ошибка обработки фото: {str(outcome)}"
+
+            codes = outcome["codes"] if isinstance(outcome, dict) else []
+            result = {
+                "filename": filename,
+                "success": bool(codes),
+                "qr_contents": codes,
+                "error": error,
+                "scan_ids": [],
+            }
+            if isinstance(outcome, dict):
+                result["decode_stage"] = outcome["stage"]
+            results.append(result)
+
+            if error:
+                continue
+            for qr_content in codes or [None]:
+                rows.append(
+                    {
+                        "filename": filename,
+                        "file_path": "",
+                        "qr_content": qr_content,
+                        "session_id": session_id,
+                        "created_at": now,
+                        "is_processed": qr_content is not None,
+                        "processed_at": now if qr_content else None,
+                    }
+                )
+
+        if rows:
+            scan_ids = (
+                await db.scalars(
+                    insert(models.PhotoScan).returning(
+                        models.PhotoScan.id, sort_by_parameter_order=True
+                    ),
+                    rows,
+                )
+            ).all()
+            await db.commit()
+
+            ids = iter(scan_ids)
+            for result in results:
+                if not result["error"]:
+                    result["scan_ids"] = [
+                        next(ids) for _ in range(max(len(result["qr_contents"]), 1))
+                    ]
+
+        return {
+            "success": any(result["success"] for result in results),
+            "total_files": len(files),
+            "codes_found": sum(len(result["qr_contents"]) for result in results),
+            "results": results,
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Ошибка обработки фото: {str(e)}")
+
+
 @router.post("/connect/{session_id}")
-async def connect_to_session_from_qr(session_id: str, db: Session = Depends(get_db)):
+async def connect_to_session_from_qr(session_id: str):
     """Connect to session using QR code data"""
+    if not remote_sessions.is_valid_id(session_id):
+        raise HTTPException(status_code=400, detail="Некорректный Session ID")
     try:
-        session = (
-            db.query(models.RemoteSession)
-            .filter(
-                models.RemoteSession.session_id == session_id,
-                models.RemoteSession.is_active == True,
-            )
-            .first()
-        )
+        session = await remote_sessions.get(session_id)
 
-        if not session:
+        if not remote_sessions.is_live(session):
             # Создаем новую сессию
-            session = models.RemoteSession(
-                session_id=session_id,
-                is_active=True,
-                expires_at=datetime.now() + timedelta(hours=1),
-            )
-            db.add(session)
-            db.commit()
-            db.refresh(session)
+            remote_sessions.activate(session_id)
+            await remote_sessions.flush()
+            session = await remote_sessions.get(session_id)
             message = "Новая сессия создана"
         else:
             message = "Сессия найдена"
@@ -120,7 +238,7 @@ async def connect_to_session_from_qr(session_id: str, db: Session = Depends(get_
             "success": True,
             "session_id": session_id,
             "session_exists": True,
-            "host_connected": session.host_connected,
+            "host_connected": bool(session.get("host_connected")),
             "message": message,
         }
 
@@ -138,18 +256,50 @@ async def delete_file_later(file_path: str):
     QRService.delete_file(file_path)
 
 
+@router.get("/decode-stats")
+async def get_decode_stats():
+    """Decode executor load and per-job timing"""
+    return decode_executor.stats()
+
+
 @router.get("/scans/")
 async def get_photo_scans(
-    skip: int = 0, limit: int = 50, db: Session = Depends(get_db)
+    response: Response,
+    skip: int = 0,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    session_id: Optional[str] = None,
+    is_processed: Optional[bool] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db),
 ):
-    """Get photo scan history"""
-    scans = (
-        db.query(models.PhotoScan)
-        .order_by(models.PhotoScan.created_at.desc())
-        .offset(skip)
-        .limit(limit)
-        .all()
-    )
+    """Get photo scan history (offset or keyset via the X-Next-Cursor header)"""
+    query = select(models.PhotoScan)
+    if session_id:
+        query = query.filter(models.PhotoScan.session_id == session_id)
+    if is_processed is not None:
+        query = query.filter(models.PhotoScan.is_processed == is_processed)
+    if start_date:
+        query = query.filter(models.PhotoScan.created_at >= start_date)
+    if end_date:
+        query = query.filter(models.PhotoScan.created_at <= end_date)
+
+    try:
+        query = apply_keyset(
+            query, models.PhotoScan.created_at, models.PhotoScan.id, cursor
+        )
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+    if cursor is None:
+        query = query.offset(skip)
+    scans = (await db.scalars(query.limit(limit))).all()
+
+    if len(scans) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(
+            scans[-1].created_at, scans[-1].id
+        )
 
     return [
         {
@@ -172,7 +322,7 @@ async def process_photo_and_connect(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     session_id: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Обработка фото с QR-кодом и подключение к сессии"""
     try:
@@ -186,13 +336,15 @@ async def process_photo_and_connect(
         # Сохраняем временный файл
         temp_file_path = QRService.save_temp_image(image_bytes)
 
-        # Распознаем QR-код
-        qr_content = QRService.decode_qr_from_bytes(image_bytes)
-
-        if not qr_content:
-            # Пробуем улучшить изображение
-            enhanced_image = QRService.enhance_image(image_bytes)
-            qr_content = QRService.decode_qr_from_bytes(enhanced_image)
+        # Распознаем QR-код (поэтапно, вплоть до улучшенного изображения)
+        try:
+            decoded = await decode_executor.decode(image_bytes)
+        except DecodeQueueFull:
+            QRService.delete_file(temp_file_path)
+            raise HTTPException(
+                status_code=503, detail="Сервер перегружен, повторите попытку"
+            )
+        qr_content = decoded["qr_content"]
 
         if not qr_content:
             raise HTTPException(status_code=400, detail="QR-код не найден на фото")
@@ -213,33 +365,20 @@ async def process_photo_and_connect(
             raise HTTPException(
                 status_code=400, detail="Session ID не найден в QR-коде"
             )
+        if not remote_sessions.is_valid_id(target_session_id):
+            raise HTTPException(status_code=400, detail="Некорректный Session ID")
 
         # Проверяем существование сессии
-        session = (
-            db.query(models.RemoteSession)
-            .filter(
-                models.RemoteSession.session_id == target_session_id,
-                models.RemoteSession.is_active == True,
-            )
-            .first()
-        )
+        session = await remote_sessions.get(target_session_id)
 
-        if not session:
+        if not (session and session.get("is_active")):
             # Создаем сессию если её нет
-            session = models.RemoteSession(
-                session_id=target_session_id,
-                client_connected=True,
-                is_active=True,
-                expires_at=datetime.now() + timedelta(hours=1),
-            )
-            db.add(session)
-            db.commit()
+            remote_sessions.activate(target_session_id, client_connected=True)
+            await remote_sessions.flush()
             message = "Новая сессия создана"
         else:
-            # Обновляем сессию
-            session.client_connected = True
-            session.expires_at = datetime.now() + timedelta(hours=1)
-            db.commit()
+            # Обновляем сессию (запись в БД выполняется пакетно)
+            remote_sessions.activate(target_session_id, client_connected=True)
             message = "Подключено к существующей сессии"
 
         # Сохраняем запись о сканировании
@@ -253,7 +392,7 @@ async def process_photo_and_connect(
         )
 
         db.add(photo_scan)
-        db.commit()
+        await db.commit()
 
         # Планируем удаление файла
         background_tasks.add_task(QRService.delete_file, temp_file_path)
@@ -265,7 +404,11 @@ async def process_photo_and_connect(
             "qr_content": qr_content,
             "session_exists": True,
             "connected": True,
+            "decode_stage": decoded["stage"],
+            "decode_timings": decoded["timings"],
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка обработки фото: {str(e)}")
@@ -1,10 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+import asyncio
 import json
 
 from ..database import get_db
 from .. import models, schemas
+from ..services.label_service import LabelError, LabelService
+from ..services.network_printer import network_printers
+from ..services.print_service import PrintService, print_workers
+from ..services.printer_discovery import DiscoveryError, printer_discovery
+from ..services.printer_registry import printer_registry
 
 router = APIRouter(prefix="/api/printers", tags=["printers"])
 
@@ -40,6 +46,7 @@ def create_printer(printer: schemas.PrinterCreate, db: Session = Depends(get_db)
         db.add(db_printer)
         db.commit()
         db.refresh(db_printer)
+        printer_registry.reload(db)
 
         return db_printer
 
@@ -54,44 +61,68 @@ def create_printer(printer: schemas.PrinterCreate, db: Session = Depends(get_db)
 
 
 @router.get("/", response_model=List[schemas.PrinterResponse])
-def get_printers(db: Session = Depends(get_db)):
+def get_printers():
     """Get all printers"""
-    return db.query(models.Printer).filter(models.Printer.is_active == True).all()
+    return printer_registry.all()
 
 
-@router.get("/default")
-def get_default_printer(db: Session = Depends(get_db)):
-    """Get default printer"""
-    printer = (
-        db.query(models.Printer)
-        .filter(models.Printer.is_default == True)
-        .filter(models.Printer.is_active == True)
-        .first()
-    )
-
-    if not printer:
-        # Создаем браузерный принтер по умолчанию, если нет других
-        browser_printer = models.Printer(
-            name="Браузерная печать",
-            connection_type="browser",
-            is_default=True,
-            is_active=True,
+@router.get("/default", response_model=schemas.PrinterResponse)
+def get_default_printer():
+    """Get default printer (the browser fallback is created at startup)"""
+    printer = printer_registry.default()
+    if printer is None:
+        raise HTTPException(
+            status_code=404, detail="Принтер по умолчанию не настроен"
         )
-        db.add(browser_printer)
-        db.commit()
-        db.refresh(browser_printer)
-        printer = browser_printer
-
     return printer
 
 
 @router.post("/test/{printer_id}")
 async def test_printer(printer_id: int, db: Session = Depends(get_db)):
-    """Test printer connection - для браузерной печати просто возвращаем успех"""
+    """Test printer connection: network printers get a real TCP/status probe"""
     printer = db.query(models.Printer).filter(models.Printer.id == printer_id).first()
     if not printer:
         raise HTTPException(status_code=404, detail="Printer not found")
 
+    if printer.connection_type == "network":
+        if not printer.ip_address:
+            return {
+                "status": "error",
+                "message": f"У принтера '{printer.name}' не задан IP-адрес",
+                "printer": printer.name,
+            }
+
+        probe = await asyncio.to_thread(
+            network_printers.probe, printer.ip_address, printer.port or 9100
+        )
+        if not probe["reachable"]:
+            return {
+                "status": "error",
+                "message": f"Принтер '{printer.name}' недоступен: {probe['error']}",
+                "printer": printer.name,
+                "probe": probe,
+            }
+
+        printer_status = probe.get("status") or {}
+        ready = not printer_status.get("paper_out") and not printer_status.get("paused")
+        return {
+            "status": "success" if ready else "warning",
+            "message": (
+                f"Сетевой принтер '{printer.name}' готов к работе"
+                if ready
+                else f"Сетевой принтер '{printer.name}' доступен, но не готов"
+            ),
+            "printer": printer.name,
+            "probe": probe,
+        }
+
+    if printer.connection_type != "browser":
+        return {
+            "status": "error",
+            "message": f"Тип подключения '{printer.connection_type}' не поддерживается сервером",
+            "printer": printer.name,
+        }
+
     return {
         "status": "success",
         "message": f"Браузерный принтер '{printer.name}' готов к работе",
@@ -99,6 +130,43 @@ async def test_printer(printer_id: int, db: Session = Depends(get_db)):
     }
 
 
+@router.post("/print")
+def print_label(request: schemas.PrintRequest, db: Session = Depends(get_db)):
+    """Queue a label; copies are repeated by the printer, not re-sent"""
+    printer = PrintService.resolve_printer(request.printer_id)
+    if printer is None:
+        raise HTTPException(status_code=404, detail="Printer not found")
+    try:
+        # Render once up front so bad sizes/payloads fail here, not in the worker
+        LabelService.render(request.qr_content, request.label_size, request.copies)
+    except LabelError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    job = PrintService.enqueue(
+        db,
+        None,
+        request.qr_content,
+        printer_id=printer.id,
+        copies=request.copies,
+        label_size=request.label_size or "50x30",
+    )
+    db.commit()
+    print_workers.notify()
+    return {"status": "queued", "job_id": job.id, "printer": printer.name}
+
+
+@router.post("/label-preview")
+def preview_label(request: schemas.PrintRequest):
+    """Printer-native label that would be sent for this request"""
+    try:
+        label = LabelService.render(
+            request.qr_content, request.label_size, request.copies
+        )
+    except LabelError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(content=label, media_type="application/vnd.zebra.zpl")
+
+
 @router.put("/{printer_id}", response_model=schemas.PrinterResponse)
 def update_printer(
     printer_id: int,
@@ -118,6 +186,7 @@ def update_printer(
 
     db.commit()
     db.refresh(printer)
+    printer_registry.reload(db)
     return printer
 
 
@@ -140,31 +209,110 @@ def delete_printer(printer_id: int, db: Session = Depends(get_db)):
 
     db.delete(printer)
     db.commit()
+    printer_registry.reload(db)
 
     return {"status": "success", "message": "Printer deleted"}
 
 
+BROWSER_PRINTER = {
+    "name": "Браузерная печать",
+    "type": "browser",
+    "status": "available",
+    "description": "Печать через диалог браузера",
+}
+
+
+def discovered_printer(printer: dict) -> dict:
+    return {
+        "name": f"Сетевой принтер {printer['ip']}",
+        "type": "network",
+        "status": "available",
+        "ip": printer["ip"],
+        "port": printer["port"],
+        "ports": printer["ports"],
+        "protocols": printer["protocols"],
+        "latency_ms": printer["latency_ms"],
+        "description": f"{printer['ip']}:{printer['port']}",
+    }
+
+
 @router.post("/scan/")
-async def scan_network():
-    """Упрощенное сканирование - возвращает только браузерный принтер"""
+async def scan_network(subnet: Optional[str] = None, refresh: bool = False):
+    """Сканирование подсети на порты принтеров (9100/631), результат кэшируется"""
+    try:
+        result = await printer_discovery.scan(subnet, refresh)
+    except DiscoveryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    discovered = [discovered_printer(p) for p in result["printers"]]
     return {
         "status": "success",
-        "message": "Используется браузерная печать по умолчанию",
-        "discovered": [
-            {
-                "name": "Браузерная печать",
-                "type": "browser",
-                "status": "available",
-                "description": "Печать через диалог браузера",
-            }
-        ],
+        "message": (
+            f"Найдено сетевых принтеров: {len(discovered)} в {result['subnet']}"
+            if discovered
+            else "Сетевые принтеры не найдены, используется браузерная печать"
+        ),
+        "subnet": result["subnet"],
+        "hosts_scanned": result["hosts_scanned"],
+        "duration_ms": result["duration_ms"],
+        "cached": result["cached"],
+        "discovered": [BROWSER_PRINTER] + discovered,
     }
 
 
+def register_discovered(db: Session, printers: List[dict]) -> List[models.Printer]:
+    """Add raw-TCP printers that are not registered yet (committed by the caller)"""
+    raw = [p for p in printers if 9100 in p["ports"]]
+    if not raw:
+        return []
+    known = set(
+        db.query(models.Printer.ip_address, models.Printer.port)
+        .filter(models.Printer.connection_type == "network")
+        .all()
+    )
+    added = []
+    for printer in raw:
+        if (printer["ip"], 9100) in known:
+            continue
+        db_printer = models.Printer(
+            name=f"Сетевой принтер {printer['ip']}",
+            connection_type="network",
+            ip_address=printer["ip"],
+            port=9100,
+            is_default=False,
+            is_active=True,
+        )
+        db.add(db_printer)
+        added.append(db_printer)
+    return added
+
+
 @router.post("/auto-configure")
-async def auto_configure_printers(db: Session = Depends(get_db)):
-    """Автоматическая настройка - только браузерный принтер"""
+async def auto_configure_printers(
+    subnet: Optional[str] = None,
+    discover: bool = True,
+    db: Session = Depends(get_db),
+):
+    """Автоматическая настройка: браузерный принтер и найденные сетевые принтеры"""
     try:
+        registered = []
+        if discover:
+            result = await printer_discovery.scan(subnet)
+            registered = register_discovered(db, result["printers"])
+            if registered:
+                db.commit()
+                printer_registry.reload(db)
+        registered_info = [
+            {
+                "id": printer.id,
+                "name": printer.name,
+                "ip": printer.ip_address,
+                "port": printer.port,
+                "connection_type": "network",
+            }
+            for printer in registered
+        ]
+
         # Проверяем, есть ли уже браузерный принтер
         existing_browser_printer = (
             db.query(models.Printer)
@@ -179,10 +327,12 @@ async def auto_configure_printers(db: Session = Depends(get_db)):
             if not existing_browser_printer.is_default:
                 existing_browser_printer.is_default = True
                 db.commit()
+                printer_registry.reload(db)
 
             return {
                 "status": "success",
                 "message": "Браузерная печать уже настроена",
+                "registered": registered_info,
                 "default_printer": {
                     "id": existing_browser_printer.id,
                     "name": existing_browser_printer.name,
@@ -202,10 +352,12 @@ async def auto_configure_printers(db: Session = Depends(get_db)):
         db.add(browser_printer)
         db.commit()
         db.refresh(browser_printer)
+        printer_registry.reload(db)
 
         return {
             "status": "success",
             "message": "Браузерная печать настроена по умолчанию",
+            "registered": registered_info,
             "default_printer": {
                 "id": browser_printer.id,
                 "name": browser_printer.name,
@@ -215,7 +367,10 @@ async def auto_configure_printers(db: Session = Depends(get_db)):
             },
         }
 
+    except DiscoveryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
+        db.rollback()
         return {
             "status": "error",
             "message": f"Ошибка настройки: {str(e)}",
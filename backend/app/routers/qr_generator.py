@@ -1,7 +1,7 @@
-from fastapi import APIRouter
-from fastapi.responses import StreamingResponse
-import qrcode
-import io
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
+
+from ..services.qr_service import QRService
 
 router = APIRouter(prefix="/api/qr", tags=["qr-generator"])
 
@@ -10,23 +10,34 @@ router = APIRouter(prefix="/api/qr", tags=["qr-generator"])
 async def generate_qr(data: str, size: int = 250):
     """Generate QR code"""
     try:
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(data)
-        qr.make(fit=True)
+        png = QRService.render_qr_png(data)
+        return Response(content=png, media_type="image/png")
 
-        img = qr.make_image(fill_color="black", back_color="white")
+    except Exception as e:
+        return {"error": str(e)}
 
-        # Convert to bytes
-        img_bytes = io.BytesIO()
-        img.save(img_bytes, format="PNG")
-        img_bytes.seek(0)
 
-        return StreamingResponse(img_bytes, media_type="image/png")
+@router.get("/image/{digest}.png")
+async def get_qr_image_by_digest(digest: str, data: str, request: Request):
+    """Content-addressed QR image: immutable, served with a strong ETag"""
+    if QRService.image_digest(data) != digest:
+        raise HTTPException(status_code=400, detail="Digest does not match content")
 
-    except Exception as e:
-        return {"error": str(e)}
+    etag = f'"{digest}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match == "*":
+        return Response(status_code=304, headers=headers)
+
+    png = QRService.render_qr_png(data)
+    return Response(content=png, media_type="image/png", headers=headers)
+
+
+@router.get("/cache-stats")
+async def qr_cache_stats():
+    """QR image cache statistics"""
+    return QRService.cache_stats()
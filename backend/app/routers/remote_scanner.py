@@ -1,118 +1,203 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
-from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from datetime import datetime
 from typing import Dict
 import asyncio
-from ..database import get_db
-from .. import models
+from ..config import settings
+from ..services.qr_service import QRService
+from ..services.remote_sessions import remote_sessions
+from ..services.scan_relay import OutboundQueue, create_outbound_queue, relayed_scans
+from ..services.session_store import session_store
 
 router = APIRouter(prefix="/ws", tags=["remote-scanner"])
 
 
 class ConnectionManager:
+    """WebSocket connections of this worker.
+
+    Sockets are local to the process; presence flags live in session_store
+    and messages for a device connected to another worker are relayed
+    through it. No database session is held by a connection: the session
+    row is read through remote_sessions and changes are written behind.
+    Everything sent to a socket goes through its OutboundQueue, so a slow
+    peer never blocks the device that is sending to it.
+    """
+
     def __init__(self):
         self.active_connections: Dict[str, WebSocket] = {}
-        self.session_data: Dict[str, Dict] = {}  # Данные сессий
+        self.outboxes: Dict[str, OutboundQueue] = {}
 
     async def connect(
-        self, websocket: WebSocket, session_id: str, device_type: str, db: Session
+        self, websocket: WebSocket, session_id: str, device_type: str
     ):
-        """Подключаем устройство и сохраняем в БД"""
+        """Подключаем устройство; запись в БД выполняется пакетно в фоне"""
         await websocket.accept()
 
-        # Находим сессию в БД
-        session = (
-            db.query(models.RemoteSession)
-            .filter(
-                models.RemoteSession.session_id == session_id,
-                models.RemoteSession.is_active == True,
-            )
-            .first()
-        )
+        # Проверяем сессию по кэшу таблицы сессий
+        session = await remote_sessions.get(session_id)
+        if not remote_sessions.is_live(session):
+            print(f"Сессия {session_id} не найдена или истекла, создаём новую")
 
-        if not session:
-            # Создаем новую сессию если её нет
-            session = models.RemoteSession(
-                session_id=session_id,
-                is_active=True,
-                expires_at=datetime.now() + timedelta(hours=1),
-            )
-            db.add(session)
+        # Активируем сессию, обновляем статус подключения и время жизни
+        remote_sessions.activate(session_id, **{f"{device_type}_connected": True})
 
-        # Обновляем статус подключения
-        if device_type == "host":
-            session.host_connected = True
-            session.host_websocket_id = f"{session_id}_host"
-        else:
-            session.client_connected = True
-            session.client_websocket_id = f"{session_id}_client"
+        # Сохраняем соединение и его очередь отправки
+        connection_id = f"{session_id}_{device_type}"
+        outbox = create_outbound_queue(websocket)
+        self.active_connections[connection_id] = websocket
+        self.outboxes[connection_id] = outbox
 
-        # Обновляем время жизни сессии
-        session.expires_at = datetime.now() + timedelta(hours=1)
+        # Сохраняем данные сессии (видны всем воркерам)
+        await session_store.update(session_id, **{f"{device_type}_connected": True})
 
-        db.commit()
+        print(f"✅ {device_type} подключен к сессии {session_id}")
+        return outbox
 
-        # Сохраняем соединение
+    async def disconnect(
+        self, websocket: WebSocket, session_id: str, device_type: str
+    ):
+        """Отключаем устройство и уведомляем другую сторону"""
         connection_id = f"{session_id}_{device_type}"
-        self.active_connections[connection_id] = websocket
+        # Сокет мог быть уже заменён повторным подключением того же устройства
+        if self.active_connections.get(connection_id) is not websocket:
+            return
+        del self.active_connections[connection_id]
+        self.outboxes.pop(connection_id, None)
 
-        # Сохраняем данные сессии
-        if session_id not in self.session_data:
-            self.session_data[session_id] = {
-                "host_connected": device_type == "host",
-                "client_connected": device_type == "client",
-                "last_activity": datetime.now(),
-                "scans": [],
-            }
-        else:
-            self.session_data[session_id][f"{device_type}_connected"] = True
-            self.session_data[session_id]["last_activity"] = datetime.now()
+        await session_store.update(session_id, **{f"{device_type}_connected": False})
+        remote_sessions.set(session_id, **{f"{device_type}_connected": False})
 
-        print(f"✅ {device_type} подключен к сессии {session_id}")
-        return connection_id
+        await self.send_to_other_device(
+            session_id,
+            device_type,
+            {
+                "type": "status",
+                "status": f"{device_type}_disconnected",
+                "message": f"{device_type}_disconnected",
+                "timestamp": datetime.now().isoformat(),
+            },
+        )
+        print(f"❎ {device_type} отключен от сессии {session_id}")
 
     def get_session_status(self, session_id: str):
         """Получить статус сессии"""
-        if session_id in self.session_data:
-            return self.session_data[session_id]
-        return None
+        return session_store.get(session_id)
+
+    async def deliver(self, session_id: str, device_type: str, message: dict) -> bool:
+        """Поставить сообщение в очередь устройства на этом воркере"""
+        outbox = self.outboxes.get(f"{session_id}_{device_type}")
+        if outbox is None:
+            return False
+        return outbox.put(message)
+
+    def session_ids(self) -> set:
+        """Сессии, у которых есть сокет на этом воркере"""
+        return {
+            connection_id.rsplit("_", 1)[0] for connection_id in self.active_connections
+        }
+
+    async def expire(self, session_id: str):
+        """Закрыть сокеты истёкшей сессии и удалить её состояние"""
+        for device_type in ("host", "client"):
+            connection_id = f"{session_id}_{device_type}"
+            websocket = self.active_connections.pop(connection_id, None)
+            if websocket is None:
+                continue
+            outbox = self.outboxes.pop(connection_id, None)
+            if outbox is not None:
+                await outbox.close()
+            try:
+                await websocket.send_json(
+                    {"type": "session_expired", "timestamp": datetime.now().isoformat()}
+                )
+                await websocket.close(code=1000, reason="Сессия истекла")
+            except Exception:
+                pass
+        await session_store.remove(session_id)
+        print(f"⌛ Сессия {session_id} истекла")
 
     async def send_to_other_device(
         self, session_id: str, from_device: str, message: dict
     ):
-        """Отправить сообщение другому устройству в сессии"""
+        """Отправить сообщение другому устройству в сессии (на любом воркере)"""
         other_type = "client" if from_device == "host" else "host"
-        other_connection_id = f"{session_id}_{other_type}"
-
-        if other_connection_id in self.active_connections:
-            try:
-                await self.active_connections[other_connection_id].send_json(message)
-                return True
-            except Exception as e:
-                print(f"Ошибка отправки сообщения: {e}")
-                return False
-        return False
+        return await session_store.relay(session_id, other_type, message)
 
 
 manager = ConnectionManager()
 
 
+async def sweep_expired_sessions():
+    """Фоновая задача: деактивирует истёкшие сессии и закрывает их сокеты"""
+    while True:
+        await asyncio.sleep(settings.REMOTE_SESSION_SWEEP_INTERVAL)
+        try:
+            expired = set(await remote_sessions.sweep())
+            # Сессии, истёкшие на других воркерах, видны через кэш
+            for session_id in manager.session_ids() - expired:
+                if not remote_sessions.is_live(await remote_sessions.get(session_id)):
+                    expired.add(session_id)
+            for session_id in expired:
+                await manager.expire(session_id)
+            session_store.prune(
+                remote_sessions.lifetime.total_seconds(), manager.session_ids()
+            )
+        except Exception as e:
+            print(f"Ошибка очистки сессий: {e}")
+
+
+@router.get("/sessions/{session_id}/status")
+async def get_session_status(session_id: str):
+    """Статус сессии для опроса с хоста (без запроса к БД при попадании в кэш)"""
+    session = await remote_sessions.get(session_id)
+    presence = manager.get_session_status(session_id) or {}
+    if session is None and not presence:
+        return {"exists": False, "active": False, "message": "Сессия не найдена"}
+
+    session = session or {}
+    return {
+        "exists": True,
+        "active": remote_sessions.is_live(session),
+        "host_connected": presence.get(
+            "host_connected", bool(session.get("host_connected"))
+        ),
+        "client_connected": presence.get(
+            "client_connected", bool(session.get("client_connected"))
+        ),
+        "expires_at": (
+            session["expires_at"].isoformat() if session.get("expires_at") else None
+        ),
+    }
+
+
+@router.get("/stats")
+async def get_relay_stats():
+    """Очереди отправки WebSocket-соединений этого воркера"""
+    return {
+        "connections": {
+            connection_id: outbox.stats()
+            for connection_id, outbox in manager.outboxes.items()
+        },
+        "persisted_scans": relayed_scans.written,
+    }
+
+
 @router.websocket("/remote-scanner/{session_id}/{device_type}")
 async def websocket_endpoint(
-    websocket: WebSocket,
-    session_id: str,
-    device_type: str,
-    db: Session = Depends(get_db),
+    websocket: WebSocket, session_id: str, device_type: str
 ):
     if device_type not in ["host", "client"]:
         await websocket.close(code=1008, reason="Неверный тип устройства")
         return
+    if not remote_sessions.is_valid_id(session_id):
+        await websocket.close(code=1008, reason="Неверный идентификатор сессии")
+        return
 
+    outbox = None
     try:
-        connection_id = await manager.connect(websocket, session_id, device_type, db)
+        outbox = await manager.connect(websocket, session_id, device_type)
 
         # Отправляем подтверждение
-        await websocket.send_json(
+        outbox.put(
             {
                 "type": "connected",
                 "session_id": session_id,
@@ -122,20 +207,16 @@ async def websocket_endpoint(
         )
 
         # Уведомляем другую сторону, если она подключена
-        other_type = "client" if device_type == "host" else "host"
-        other_connection_id = f"{session_id}_{other_type}"
-
-        if other_connection_id in manager.active_connections:
-            try:
-                await manager.active_connections[other_connection_id].send_json(
-                    {
-                        "type": "status",
-                        "message": f"{device_type}_connected",
-                        "timestamp": datetime.now().isoformat(),
-                    }
-                )
-            except:
-                pass
+        await manager.send_to_other_device(
+            session_id,
+            device_type,
+            {
+                "type": "status",
+                "status": f"{device_type}_connected",
+                "message": f"{device_type}_connected",
+                "timestamp": datetime.now().isoformat(),
+            },
+        )
 
         # Главный цикл обработки сообщений
         while True:
@@ -144,40 +225,66 @@ async def websocket_endpoint(
                     websocket.receive_json(), timeout=300
                 )  # 5 минут таймаут
 
+                remote_sessions.extend(session_id)
+
                 if data.get("type") == "scan":
-                    # Пересылаем сканирование другой стороне
-                    if other_connection_id in manager.active_connections:
-                        try:
-                            await manager.active_connections[
-                                other_connection_id
-                            ].send_json(
-                                {
-                                    "type": "scan",
-                                    "qr_content": data.get("qr_content"),
-                                    "from_device": device_type,
-                                    "timestamp": datetime.now().isoformat(),
-                                }
+                    qr_content = data.get("qr_content")
+                    # Некорректный скан не пересылаем и не сохраняем
+                    valid = isinstance(qr_content, str)
+                    if not valid or not QRService.validate_qr_content(qr_content):
+                        if data.get("id") is not None:
+                            outbox.put(
+                                {"type": "ack", "id": data["id"], "status": "invalid"}
                             )
-                        except:
-                            pass
+                        continue
+
+                    # Сохраняем сканирование на сервере (пакетно), если включено;
+                    # повторы в окне дедупликации не сохраняются повторно
+                    persisted = settings.SCAN_RELAY_PERSIST and relayed_scans.add(
+                        qr_content
+                    )
+                    repeated = settings.SCAN_RELAY_PERSIST and not persisted
+
+                    # Пересылаем сканирование другой стороне (без ожидания)
+                    delivered = await manager.send_to_other_device(
+                        session_id,
+                        device_type,
+                        {
+                            "type": "scan",
+                            "qr_content": qr_content,
+                            "from_device": device_type,
+                            "persisted": persisted,
+                            "timestamp": datetime.now().isoformat(),
+                        },
+                    )
+
+                    # Подтверждение отправителю, если он передал id сообщения
+                    if data.get("id") is not None:
+                        if delivered:
+                            status = "queued"
+                        elif persisted:
+                            status = "stored"
+                        elif repeated:
+                            # Повтор в окне дедупликации: скан уже сохранён
+                            status = "duplicate"
+                        else:
+                            status = "dropped"
+                        outbox.put({"type": "ack", "id": data["id"], "status": status})
 
                 elif data.get("type") == "ping":
                     # Ответ на пинг
-                    await websocket.send_json(
-                        {"type": "pong", "timestamp": datetime.now().isoformat()}
-                    )
+                    outbox.put({"type": "pong", "timestamp": datetime.now().isoformat()})
 
                 elif data.get("type") == "disconnect":
                     break
 
             except asyncio.TimeoutError:
                 # Таймаут - отправляем пинг
-                try:
-                    await websocket.send_json(
-                        {"type": "ping", "timestamp": datetime.now().isoformat()}
-                    )
-                except:
+                if outbox.closed:
                     break
+                outbox.put({"type": "ping", "timestamp": datetime.now().isoformat()})
+            except WebSocketDisconnect:
+                raise
             except Exception as e:
                 print(f"Ошибка обработки сообщения: {e}")
                 break
@@ -187,4 +294,6 @@ async def websocket_endpoint(
     except Exception as e:
         print(f"Ошибка WebSocket: {e}")
     finally:
-        await manager.disconnect(connection_id, db)
+        await manager.disconnect(websocket, session_id, device_type)
+        if outbox is not None:
+            await outbox.close()
@@ -1,60 +1,428 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, UploadFile, File
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Header, Request, Response
+from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
+from pydantic import ValidationError
+from sqlalchemy import and_, func, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Literal, Optional
 from datetime import datetime, timedelta
-import io
+import json
 
-from ..database import get_db
+from ..config import settings
+
+from ..database import get_async_db, get_db
 from .. import models, schemas
 from ..services.qr_service import QRService
-from ..services.print_service import PrintService, print_qr_background
+from ..services.print_service import PrintService, print_workers
+from ..services.printer_registry import printer_registry
+from ..services.partitions import partitions
 from ..services.excel_service import ExcelService
+from ..services.export_service import ExportService
+from ..services.export_jobs import export_jobs, ExportQueueFull
+from ..services.decode_executor import decode_executor, DecodeQueueFull
+from ..services.dedup import recent_scans
+from ..services.pagination import (
+    InvalidCursor,
+    apply_keyset,
+    encode_cursor,
+    escape_like,
+)
 
 router = APIRouter(prefix="/api/scans", tags=["scans"])
 
+STATS_PERIODS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+STATS_DEFAULT_RANGE = {"hour": timedelta(hours=24), "day": timedelta(days=30)}
+STATS_MAX_BUCKETS = 1000
+
+def scan_by_key(key: str):
+    """The scan stored under an idempotency key"""
+    keys = models.ScanIdempotencyKey
+    return (
+        select(models.ScanRecord)
+        .join(
+            keys,
+            and_(
+                keys.scan_id == models.ScanRecord.id,
+                keys.scanned_at == models.ScanRecord.scanned_at
+            )
+        )
+        .where(keys.idempotency_key == key)
+    )
+
+def stored_keys(keys: set):
+    """Scans stored under any of the keys, with their code and source
+
+    Outer join: the scan of an old key may be archived with its partition.
+    """
+    key_table = models.ScanIdempotencyKey
+    return (
+        select(
+            key_table.idempotency_key,
+            key_table.scan_id,
+            key_table.scanned_at,
+            models.ScanRecord.qr_content,
+            models.ScanRecord.scan_source
+        )
+        .outerjoin(
+            models.ScanRecord,
+            and_(
+                key_table.scan_id == models.ScanRecord.id,
+                key_table.scanned_at == models.ScanRecord.scanned_at
+            )
+        )
+        .where(key_table.idempotency_key.in_(keys))
+    )
+
+def key_reused(original: dict, qr_content: str, source: str) -> bool:
+    """Whether a stored key belongs to a scan of another code or source"""
+    if original.get("qr_content") is None:
+        # Scan archived, nothing left to compare with
+        return False
+    return (original["qr_content"], original["scan_source"]) != (qr_content, source)
+
+KEY_REUSED = "Idempotency key reused with a different payload"
+
+def by_code(code: str):
+    """Exact match on a code, looked up through the qr_hash index"""
+    return and_(
+        models.ScanRecord.qr_hash == models.qr_content_hash(code),
+        models.ScanRecord.qr_content == code
+    )
+
+def key_conflict(error: IntegrityError) -> bool:
+    """Whether an insert failed on the idempotency key table's primary key
+
+    Other integrity errors (a printer deleted meanwhile, ...) are not
+    duplicates and must not be answered as such.
+    """
+    return "scan_idempotency_keys" in str(error.orig)
+
+def unknown_printer(printer_id: Optional[int]) -> bool:
+    return printer_id is not None and printer_registry.get(printer_id) is None
+
+def bounded_scanned_at(scanned_at: Optional[datetime]) -> Optional[datetime]:
+    """The client's scanned_at as it can be stored
+
+    A timestamp ahead of the server by more than SCAN_MAX_CLOCK_SKEW_SECONDS
+    is capped at now: a skewed scanner clock must not date scans into months
+    that have no partition yet. Timestamps before the retention cutoff
+    belong to archived months and raise ValueError.
+    """
+    if scanned_at is None:
+        return None
+    value = scanned_at.astimezone()
+    now = datetime.now()
+    if value > now.astimezone() + timedelta(
+        seconds=settings.SCAN_MAX_CLOCK_SKEW_SECONDS
+    ):
+        return now
+    cutoff = partitions.retention_cutoff()
+    if cutoff is not None and value < cutoff:
+        raise ValueError("scanned_at is older than the retention period")
+    return scanned_at
+
+def scan_to_dict(db_scan: models.ScanRecord) -> dict:
+    return {
+        "id": db_scan.id,
+        "qr_content": db_scan.qr_content,
+        "scan_source": db_scan.scan_source,
+        "scanned_at": db_scan.scanned_at,
+        "printed_at": db_scan.printed_at,
+        "print_status": db_scan.print_status,
+    }
+
 @router.post("/", response_model=schemas.ScanResponse)
 async def create_scan(
     scan: schemas.ScanCreate,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    idempotency_key: Optional[str] = Header(None, max_length=100),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Register new scan and trigger print"""
+    """Register new scan and trigger print
+
+    A retry carrying the same idempotency key (body field or
+    Idempotency-Key header) returns the original scan with duplicate=true
+    and prints nothing; so does a repeat of the same code from the same
+    source inside SCAN_DUPLICATE_WINDOW_SECONDS. A key already used for
+    another code or source is rejected with 422.
+    """
     if not QRService.validate_qr_content(scan.qr_content):
         raise HTTPException(status_code=400, detail="Invalid QR content")
-    
+    if unknown_printer(scan.printer_id):
+        raise HTTPException(status_code=400, detail="Unknown or inactive printer")
+    try:
+        scanned_at = bounded_scanned_at(scan.scanned_at)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    key = scan.idempotency_key or idempotency_key
+    source = scan.scan_source or "scanner"
+    qr_image = QRService.generate_qr_code(scan.qr_content)
+
+    if key:
+        existing = await db.scalar(scan_by_key(key))
+        if existing:
+            if key_reused(scan_to_dict(existing), scan.qr_content, source):
+                raise HTTPException(status_code=422, detail=KEY_REUSED)
+            return {**scan_to_dict(existing), "qr_image": qr_image, "duplicate": True}
+
+    recent = recent_scans.get(source, scan.qr_content)
+    if recent:
+        return {**recent, "qr_image": qr_image, "duplicate": True}
+
     db_scan = models.ScanRecord(
         qr_content=scan.qr_content,
-        scan_source=scan.scan_source or "scanner"
+        scan_source=source,
+        scanned_at=scanned_at or datetime.now(),
+        idempotency_key=key
     )
     db.add(db_scan)
-    db.commit()
-    db.refresh(db_scan)
-    
-    qr_image = QRService.generate_qr_code(scan.qr_content)
-    
-    background_tasks.add_task(print_qr_background, db_scan.id, scan.printer_id)
-    
+    try:
+        await db.flush()
+        if key:
+            db.add(models.ScanIdempotencyKey(
+                idempotency_key=key,
+                scan_id=db_scan.id,
+                scanned_at=db_scan.scanned_at
+            ))
+        PrintService.enqueue(db, db_scan.id, scan.qr_content, scan.printer_id)
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if not key or not key_conflict(e):
+            raise
+        # A concurrent request with the same key won the insert
+        existing = await db.scalar(scan_by_key(key))
+        if not existing:
+            raise
+        if key_reused(scan_to_dict(existing), scan.qr_content, source):
+            raise HTTPException(status_code=422, detail=KEY_REUSED)
+        return {**scan_to_dict(existing), "qr_image": qr_image, "duplicate": True}
+    await db.refresh(db_scan)
+
+    result = scan_to_dict(db_scan)
+    recent_scans.add(source, scan.qr_content, result)
+
+    print_workers.notify()
+
+    return {**result, "qr_image": qr_image}
+
+def parse_bulk_body(body: bytes, content_type: str) -> list:
+    """Items of a bulk request: a JSON array or NDJSON (one object per line)"""
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        return [json.loads(line) for line in body.splitlines() if line.strip()]
+    items = json.loads(body)
+    if not isinstance(items, list):
+        raise ValueError("Expected a JSON array")
+    return items
+
+@router.post("/bulk/", response_model=schemas.ScanBulkResponse)
+async def create_scans_bulk(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Register many scans and their print jobs in one transaction
+
+    Accepts a JSON array of ScanCreate or an NDJSON stream
+    (Content-Type: application/x-ndjson). Valid items are written with a
+    single INSERT ... RETURNING; invalid ones are reported per item.
+    Items whose idempotency key is already stored (or repeated in the same
+    batch), or that fall inside the duplicate window (including a repeat of
+    an earlier item of the batch), are reported as "duplicate" with the id
+    of the original scan.
+    """
+    try:
+        items = parse_bulk_body(
+            await request.body(), request.headers.get("content-type", "")
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Malformed body: {e}")
+
+    if len(items) > settings.SCAN_BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many items (max {settings.SCAN_BULK_MAX_ITEMS})"
+        )
+
+    scans = []
+    results = []
+    for index, item in enumerate(items):
+        try:
+            scan = schemas.ScanCreate.model_validate(item)
+        except ValidationError as e:
+            results.append({"index": index, "status": "invalid", "error": str(e)})
+            continue
+        if not QRService.validate_qr_content(scan.qr_content):
+            results.append({
+                "index": index,
+                "status": "invalid",
+                "qr_content": scan.qr_content,
+                "error": "Invalid QR content"
+            })
+            continue
+        if unknown_printer(scan.printer_id):
+            results.append({
+                "index": index,
+                "status": "invalid",
+                "qr_content": scan.qr_content,
+                "error": "Unknown or inactive printer"
+            })
+            continue
+        try:
+            scan.scanned_at = bounded_scanned_at(scan.scanned_at)
+        except ValueError as e:
+            results.append({
+                "index": index,
+                "status": "invalid",
+                "qr_content": scan.qr_content,
+                "error": str(e)
+            })
+            continue
+        result = {"index": index, "status": "created", "qr_content": scan.qr_content}
+        results.append(result)
+        scans.append((result, scan))
+
+    keys = {scan.idempotency_key for _, scan in scans if scan.idempotency_key}
+    stored = {}
+    if keys:
+        stored = {
+            row.idempotency_key: {
+                "id": row.scan_id,
+                "scanned_at": row.scanned_at,
+                "qr_content": row.qr_content,
+                "scan_source": row.scan_source
+            }
+            for row in await db.execute(stored_keys(keys))
+        }
+
+    now = datetime.now()
+    rows = []
+    accepted = []
+    batch_keys = {}
+    batch_codes = {}
+    for result, scan in scans:
+        source = scan.scan_source or "scanner"
+        key = scan.idempotency_key
+        original = stored.get(key) if key else None
+        if original is None and key in batch_keys:
+            original = batch_keys[key][0]
+        if original is not None and key_reused(original, scan.qr_content, source):
+            result["status"] = "invalid"
+            result["error"] = KEY_REUSED
+            continue
+        if key and key in batch_keys:
+            result["status"] = "duplicate"
+            batch_keys[key][1].append(result)
+            continue
+        if original is None:
+            original = recent_scans.get(source, scan.qr_content)
+        if original is not None:
+            result["status"] = "duplicate"
+            result["id"] = original["id"]
+            result["qr_content"] = original["qr_content"] or scan.qr_content
+            result["scanned_at"] = original["scanned_at"]
+            continue
+        code = (source, scan.qr_content)
+        if recent_scans.enabled and code in batch_codes:
+            result["status"] = "duplicate"
+            batch_codes[code].append(result)
+            continue
+        if key:
+            batch_keys[key] = (
+                {"qr_content": scan.qr_content, "scan_source": source}, []
+            )
+        batch_codes[code] = []
+
+        accepted.append((result, scan))
+        rows.append({
+            "qr_content": scan.qr_content,
+            "scan_source": source,
+            "scanned_at": scan.scanned_at or now,
+            "print_status": "pending",
+            "idempotency_key": key
+        })
+
+    if rows:
+        table = models.ScanRecord
+        try:
+            inserted = (await db.execute(
+                insert(table).returning(
+                    table.id,
+                    table.scan_source,
+                    table.scanned_at,
+                    table.print_status,
+                    sort_by_parameter_order=True
+                ),
+                rows
+            )).all()
+            await PrintService.enqueue_many_async(db, [
+                {
+                    "scan_id": row.id,
+                    "qr_content": scan.qr_content,
+                    "printer_id": scan.printer_id
+                }
+                for (_, scan), row in zip(accepted, inserted)
+            ])
+            key_rows = [
+                {
+                    "idempotency_key": scan.idempotency_key,
+                    "scan_id": row.id,
+                    "scanned_at": row.scanned_at
+                }
+                for (_, scan), row in zip(accepted, inserted)
+                if scan.idempotency_key
+            ]
+            if key_rows:
+                await db.execute(insert(models.ScanIdempotencyKey), key_rows)
+            await db.commit()
+        except IntegrityError as e:
+            await db.rollback()
+            if not key_conflict(e):
+                raise
+            raise HTTPException(
+                status_code=409,
+                detail="Idempotency key used by a concurrent request, retry"
+            )
+
+        for (result, scan), row in zip(accepted, inserted):
+            result["id"] = row.id
+            result["scanned_at"] = row.scanned_at
+            duplicates = batch_keys.get(scan.idempotency_key, (None, []))[1]
+            duplicates = duplicates + batch_codes[(row.scan_source, scan.qr_content)]
+            for duplicate in duplicates:
+                duplicate["id"] = row.id
+                duplicate["scanned_at"] = row.scanned_at
+            recent_scans.add(row.scan_source, scan.qr_content, {
+                "id": row.id,
+                "qr_content": scan.qr_content,
+                "scan_source": row.scan_source,
+                "scanned_at": row.scanned_at,
+                "printed_at": None,
+                "print_status": row.print_status,
+            })
+
+        print_workers.notify()
+
     return {
-        "id": db_scan.id,
-        "qr_content": db_scan.qr_content,
-        "scan_source": db_scan.scan_source,
-        "scanned_at": db_scan.scanned_at,
-        "printed_at": db_scan.printed_at,
-        "print_status": db_scan.print_status,
-        "qr_image": qr_image
+        "total": len(items),
+        "created": len(rows),
+        "failed": sum(1 for result in results if result["status"] == "invalid"),
+        "results": results
     }
 
 @router.post("/scan-image/", response_model=schemas.ScanResponse)
 async def scan_from_image(
-    background_tasks: BackgroundTasks,
     image: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Scan QR code from uploaded image (camera photo)"""
     image_bytes = await image.read()
     
-    qr_content = QRService.decode_qr_from_image(image_bytes)
+    try:
+        decoded = await decode_executor.decode(image_bytes)
+    except DecodeQueueFull:
+        raise HTTPException(status_code=503, detail="Decoder is busy, retry later")
+    qr_content = decoded["qr_content"]
     
     if not qr_content:
         raise HTTPException(status_code=400, detail="No QR code found in image")
@@ -64,13 +432,14 @@ async def scan_from_image(
         scan_source="camera"
     )
     db.add(db_scan)
-    db.commit()
-    db.refresh(db_scan)
+    await db.flush()
+    PrintService.enqueue(db, db_scan.id, qr_content)
+    await db.commit()
+    await db.refresh(db_scan)
+    print_workers.notify()
     
     qr_image = QRService.generate_qr_code(qr_content)
     
-    background_tasks.add_task(print_qr_background, db_scan.id)
-    
     return {
         "id": db_scan.id,
         "qr_content": db_scan.qr_content,
@@ -83,15 +452,56 @@ async def scan_from_image(
 
 @router.get("/", response_model=List[schemas.ScanResponse])
 def get_scans(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    include_images: bool = True,
+    cursor: Optional[str] = None,
+    source: Optional[str] = None,
+    print_status: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    content_prefix: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """Get scan history"""
-    scans = db.query(models.ScanRecord)\
-        .order_by(models.ScanRecord.scanned_at.desc())\
-        .offset(skip).limit(limit).all()
-    
+    """Get scan history
+
+    With include_images=false only qr_image_url is returned for each record,
+    so the images themselves can be cached by nginx and the browser.
+
+    Pass the X-Next-Cursor response header back as cursor to fetch the next
+    page by keyset on (scanned_at, id); skip is ignored in that case. An
+    empty cursor starts keyset paging from the newest scan.
+    """
+    query = db.query(models.ScanRecord)
+    if source:
+        query = query.filter(models.ScanRecord.scan_source == source)
+    if print_status:
+        query = query.filter(models.ScanRecord.print_status == print_status)
+    if start_date:
+        query = query.filter(models.ScanRecord.scanned_at >= start_date)
+    if end_date:
+        query = query.filter(models.ScanRecord.scanned_at <= end_date)
+    if content_prefix:
+        pattern = f"{escape_like(content_prefix)}%"
+        query = query.filter(models.ScanRecord.qr_content.like(pattern, escape="\\"))
+
+    try:
+        query = apply_keyset(
+            query, models.ScanRecord.scanned_at, models.ScanRecord.id, cursor
+        )
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if cursor is None:
+        query = query.offset(skip)
+    scans = query.limit(limit).all()
+
+    if len(scans) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(
+            scans[-1].scanned_at, scans[-1].id
+        )
+
     result = []
     for scan in scans:
         scan_dict = {
@@ -101,33 +511,275 @@ def get_scans(
             "scanned_at": scan.scanned_at,
             "printed_at": scan.printed_at,
             "print_status": scan.print_status,
-            "qr_image": QRService.generate_qr_code(scan.qr_content)
+            "qr_image": (
+                QRService.generate_qr_code(scan.qr_content) if include_images else None
+            ),
+            "qr_image_url": QRService.image_url(scan.qr_content),
         }
         result.append(scan_dict)
     
     return result
 
+@router.get("/by-code/", response_model=List[schemas.ScanResponse])
+def get_scans_by_code(
+    response: Response,
+    code: str,
+    limit: int = 100,
+    include_images: bool = False,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """All scans of one code, newest first
+
+    Pages continue with the X-Next-Cursor header, like GET /.
+    """
+    query = db.query(models.ScanRecord).filter(by_code(code))
+    try:
+        query = apply_keyset(
+            query, models.ScanRecord.scanned_at, models.ScanRecord.id, cursor
+        )
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    scans = query.limit(limit).all()
+
+    if len(scans) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(
+            scans[-1].scanned_at, scans[-1].id
+        )
+
+    return [
+        {
+            **scan_to_dict(scan),
+            "qr_image": (
+                QRService.generate_qr_code(scan.qr_content) if include_images else None
+            ),
+            "qr_image_url": QRService.image_url(scan.qr_content),
+        }
+        for scan in scans
+    ]
+
+@router.get("/by-code/summary/", response_model=schemas.CodeSummary)
+def get_code_summary(code: str, db: Session = Depends(get_db)):
+    """How often a code was scanned, when first and last, last print status"""
+    count, first_seen, last_seen = (
+        db.query(
+            func.count(),
+            func.min(models.ScanRecord.scanned_at),
+            func.max(models.ScanRecord.scanned_at)
+        )
+        .filter(by_code(code))
+        .one()
+    )
+    if not count:
+        raise HTTPException(status_code=404, detail="Code not found")
+
+    last_print_status = (
+        db.query(models.ScanRecord.print_status)
+        .filter(by_code(code))
+        .order_by(models.ScanRecord.scanned_at.desc(), models.ScanRecord.id.desc())
+        .limit(1)
+        .scalar()
+    )
+    return {
+        "qr_content": code,
+        "count": count,
+        "first_seen": first_seen,
+        "last_seen": last_seen,
+        "last_print_status": last_print_status
+    }
+
+@router.get("/search/", response_model=List[schemas.CodeMatch])
+def search_codes(q: str, limit: int = 20, db: Session = Depends(get_db)):
+    """Codes containing q, most recently scanned first
+
+    Served by the trigram index on qr_content, which needs at least
+    3 characters to narrow anything down.
+    """
+    if len(q) < 3:
+        raise HTTPException(
+            status_code=400, detail="Search needs at least 3 characters"
+        )
+
+    pattern = f"%{escape_like(q)}%"
+    last_seen = func.max(models.ScanRecord.scanned_at)
+    rows = (
+        db.query(models.ScanRecord.qr_content, func.count(), last_seen)
+        .filter(models.ScanRecord.qr_content.ilike(pattern, escape="\\"))
+        .group_by(models.ScanRecord.qr_content)
+        .order_by(last_seen.desc())
+        .limit(limit)
+        .all()
+    )
+    return [
+        {"qr_content": qr_content, "count": count, "last_seen": seen}
+        for qr_content, count, seen in rows
+    ]
+
+def failure_rate(by_status: dict) -> Optional[float]:
+    finished = by_status.get("success", 0) + by_status.get("failed", 0)
+    if not finished:
+        return None
+    return round(by_status.get("failed", 0) / finished, 4)
+
+@router.get("/stats/", response_model=schemas.ScanStatsResponse)
+def get_scan_stats(
+    period: Literal["hour", "day"] = "hour",
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    """Scans per hour or day by source and print status
+
+    Read from the scan_stats rollup, so the cost depends on the number of
+    buckets asked for, not on the size of the history. Figures are as of
+    refreshed_at (see SCAN_STATS_REFRESH_INTERVAL). Unique codes are
+    counted per bucket and don't add up across buckets. Defaults to the
+    last 24 hours by hour or the last 30 days by day.
+    """
+    # Naive datetimes are local time
+    end_date = (end_date or datetime.now()).astimezone()
+    start_date = (start_date or end_date - STATS_DEFAULT_RANGE[period]).astimezone()
+    step = STATS_PERIODS[period]
+    if (end_date - start_date) / step > STATS_MAX_BUCKETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range covers more than {STATS_MAX_BUCKETS} buckets"
+        )
+
+    # Buckets overlapping [start_date, end_date)
+    stat, total = models.ScanStat, models.ScanStatTotal
+    totals = (
+        db.query(total)
+        .filter(
+            total.period == period,
+            total.bucket > start_date - step,
+            total.bucket < end_date
+        )
+        .order_by(total.bucket)
+        .all()
+    )
+    stats = (
+        db.query(stat)
+        .filter(
+            stat.period == period,
+            stat.bucket > start_date - step,
+            stat.bucket < end_date
+        )
+        .all()
+    )
+
+    buckets = {
+        row.bucket: {
+            "bucket": row.bucket,
+            "scans": row.scans,
+            "unique_codes": row.unique_codes,
+            "by_source": {},
+            "by_status": {}
+        }
+        for row in totals
+    }
+    by_source, by_status = {}, {}
+    for row in stats:
+        bucket = buckets.get(row.bucket)
+        if bucket is None:
+            continue
+        for counts, key in (
+            (bucket["by_source"], row.scan_source),
+            (bucket["by_status"], row.print_status),
+            (by_source, row.scan_source),
+            (by_status, row.print_status)
+        ):
+            counts[key] = counts.get(key, 0) + row.scans
+    for bucket in buckets.values():
+        bucket["failure_rate"] = failure_rate(bucket["by_status"])
+
+    return {
+        "period": period,
+        "start_date": start_date,
+        "end_date": end_date,
+        "scans": sum(row.scans for row in totals),
+        "by_source": by_source,
+        "by_status": by_status,
+        "failure_rate": failure_rate(by_status),
+        "buckets": list(buckets.values()),
+        "refreshed_at": db.query(models.ScanStatsState.refreshed_at).scalar()
+    }
+
 @router.post("/export/")
-async def export_scans(
+def export_scans(
     export_request: schemas.ExportRequest,
     db: Session = Depends(get_db)
 ):
-    """Export scans to Excel"""
-    excel_service = ExcelService()
-    excel_data = excel_service.create_scan_report(
-        db,
-        export_request.start_date,
-        export_request.end_date
-    )
-    
-    filename = f"scan_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    
+    """Export scans to Excel, CSV, Parquet or Arrow IPC"""
+    media_type, extension = ExportService.FORMATS[export_request.format]
+    filename = f"scan_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+
+    if export_request.format == "csv":
+        return StreamingResponse(
+            ExportService.iter_csv(export_request.start_date, export_request.end_date),
+            media_type=media_type,
+            headers=headers
+        )
+
+    if export_request.format == "xlsx":
+        report = ExcelService.create_scan_report(
+            db,
+            export_request.start_date,
+            export_request.end_date
+        )
+    else:
+        try:
+            report = ExportService.create_columnar_report(
+                db,
+                export_request.start_date,
+                export_request.end_date,
+                export_request.format
+            )
+        except ImportError:
+            raise HTTPException(
+                status_code=501, detail="pyarrow is required for this export format"
+            )
+
     return StreamingResponse(
-        io.BytesIO(excel_data.getvalue()),
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+        ExcelService.iter_file(report),
+        media_type=media_type,
+        headers=headers
     )
 
+@router.post("/export/jobs/")
+def create_export_job(export_request: schemas.ExportRequest):
+    """Start a background export and return its job id"""
+    try:
+        job = export_jobs.submit(
+            export_request.format,
+            export_request.start_date,
+            export_request.end_date
+        )
+    except ExportQueueFull:
+        raise HTTPException(status_code=503, detail="Too many export jobs queued")
+    return job.to_dict()
+
+@router.get("/export/jobs/{job_id}")
+def get_export_job(job_id: str):
+    """Export job status: rows processed / total and ETA"""
+    job = export_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return job.to_dict()
+
+@router.get("/export/jobs/{job_id}/download")
+def download_export_job(job_id: str):
+    """Download the file of a finished export job"""
+    job = export_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Export job is {job.status}")
+
+    media_type, _ = ExportService.FORMATS[job.format]
+    return FileResponse(job.file_path, media_type=media_type, filename=job.filename)
+
 @router.get("/qr-image/{qr_content:path}")
 async def get_qr_image(qr_content: str):
     """Generate QR code image"""
@@ -1,35 +1,35 @@
 from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 from typing import Dict, List
 import json
 
-from ..database import get_db
+from ..database import get_async_db
 from .. import models
+from ..services.remote_sessions import remote_sessions
+from ..services.session_store import session_store
 
 router = APIRouter(prefix="/api/sessions", tags=["sessions"])
 
-# Хранилище активных сессий
-active_sessions: Dict[str, Dict] = {}
-
 
 @router.post("/create")
-async def create_session(session_data: dict, db: Session = Depends(get_db)):
+async def create_session(session_data: dict):
     """Создание новой сессии"""
-    try:
-        session_id = session_data.get("session_id")
+    session_id = session_data.get("session_id")
+    if not remote_sessions.is_valid_id(session_id):
+        raise HTTPException(
+            status_code=400,
+            detail="Некорректный идентификатор сессии (1-6 символов)",
+        )
 
+    try:
         # Проверяем, существует ли уже сессия
-        existing_session = (
-            db.query(models.RemoteSession)
-            .filter(models.RemoteSession.session_id == session_id)
-            .first()
-        )
+        existing_session = await remote_sessions.get(session_id)
 
-        if existing_session and existing_session.is_active:
+        if remote_sessions.is_live(existing_session):
             # Обновляем время жизни существующей сессии
-            existing_session.expires_at = datetime.now() + timedelta(hours=1)
-            db.commit()
+            remote_sessions.activate(session_id)
 
             return {
                 "success": True,
@@ -38,26 +38,27 @@ async def create_session(session_data: dict, db: Session = Depends(get_db)):
                 "existing": True,
             }
 
-        # Создаем новую сессию
-        new_session = models.RemoteSession(
-            session_id=session_id,
+        # Создаем новую сессию и сразу записываем её, чтобы её видели другие воркеры
+        remote_sessions.activate(
+            session_id,
             host_connected=True,
+            client_connected=False,
             created_at=datetime.now(),
-            expires_at=datetime.now() + timedelta(hours=1),
-            is_active=True,
         )
-
-        db.add(new_session)
-        db.commit()
-        db.refresh(new_session)
-
-        # Сохраняем в активных сессиях
-        active_sessions[session_id] = {
-            "host_connected": True,
-            "client_connected": False,
-            "created_at": datetime.now(),
-            "scans": [],
-        }
+        await remote_sessions.flush()
+        error = remote_sessions.write_error(session_id)
+        if error:
+            raise HTTPException(
+                status_code=503, detail=f"Сессия не сохранена: {error}"
+            )
+
+        # Сохраняем в общем хранилище сессий
+        await session_store.update(
+            session_id,
+            host_connected=True,
+            client_connected=False,
+            created_at=datetime.now().isoformat(),
+        )
 
         return {
             "success": True,
@@ -66,95 +67,77 @@ async def create_session(session_data: dict, db: Session = Depends(get_db)):
             "created": True,
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка создания сессии: {str(e)}")
 
 
 @router.get("/{session_id}/status")
-async def get_session_status(session_id: str, db: Session = Depends(get_db)):
+async def get_session_status(session_id: str):
     """Получить статус сессии"""
-    session = (
-        db.query(models.RemoteSession)
-        .filter(models.RemoteSession.session_id == session_id)
-        .first()
-    )
+    session = await remote_sessions.get(session_id)
 
     if not session:
         return {"exists": False, "active": False, "message": "Сессия не найдена"}
 
+    created_at = session.get("created_at")
+    expires_at = session.get("expires_at")
     return {
         "exists": True,
-        "active": session.is_active,
-        "host_connected": session.host_connected,
-        "client_connected": session.client_connected,
-        "created_at": session.created_at.isoformat() if session.created_at else None,
-        "expires_at": session.expires_at.isoformat() if session.expires_at else None,
+        "active": remote_sessions.is_live(session),
+        "host_connected": bool(session.get("host_connected")),
+        "client_connected": bool(session.get("client_connected")),
+        "created_at": created_at.isoformat() if created_at else None,
+        "expires_at": expires_at.isoformat() if expires_at else None,
     }
 
 
 @router.post("/{session_id}/connect-client")
-async def connect_client_to_session(session_id: str, db: Session = Depends(get_db)):
+async def connect_client_to_session(session_id: str):
     """Подключение клиента (телефона) к сессии"""
-    session = (
-        db.query(models.RemoteSession)
-        .filter(
-            models.RemoteSession.session_id == session_id,
-            models.RemoteSession.is_active == True,
-        )
-        .first()
-    )
+    session = await remote_sessions.get(session_id)
 
-    if not session:
+    if not remote_sessions.is_live(session):
         return {"success": False, "message": "Сессия не найдена или не активна"}
 
-    # Обновляем статус подключения клиента
-    session.client_connected = True
-    session.expires_at = datetime.now() + timedelta(hours=1)  # Обновляем время жизни
-    db.commit()
+    # Обновляем статус подключения клиента и время жизни
+    remote_sessions.activate(session_id, client_connected=True)
 
     # Обновляем активную сессию
-    if session_id in active_sessions:
-        active_sessions[session_id]["client_connected"] = True
+    if session_store.get(session_id) is not None:
+        await session_store.update(session_id, client_connected=True)
 
     return {
         "success": True,
         "message": "Клиент подключен",
-        "host_connected": session.host_connected,
+        "host_connected": bool(session.get("host_connected")),
     }
 
 
 @router.post("/{session_id}/disconnect")
-async def disconnect_session(session_id: str, db: Session = Depends(get_db)):
+async def disconnect_session(session_id: str):
     """Отключение сессии"""
-    session = (
-        db.query(models.RemoteSession)
-        .filter(models.RemoteSession.session_id == session_id)
-        .first()
+    remote_sessions.set(
+        session_id, is_active=False, host_connected=False, client_connected=False
     )
 
-    if session:
-        session.is_active = False
-        session.host_connected = False
-        session.client_connected = False
-        db.commit()
-
     # Удаляем из активных сессий
-    if session_id in active_sessions:
-        del active_sessions[session_id]
+    await session_store.remove(session_id)
 
     return {"success": True, "message": "Сессия отключена"}
 
 
 @router.get("/active/list")
-async def list_active_sessions(db: Session = Depends(get_db)):
-    """Список активных сессий"""
-    active = (
-        db.query(models.RemoteSession)
-        .filter(
+async def list_active_sessions(db: AsyncSession = Depends(get_async_db)):
+    """Список активных сессий (по частичному индексу активных сессий)"""
+    active = await db.scalars(
+        select(models.RemoteSession)
+        .where(
             models.RemoteSession.is_active == True,
             models.RemoteSession.expires_at > datetime.now(),
         )
-        .all()
+        .order_by(models.RemoteSession.expires_at)
     )
 
     return [
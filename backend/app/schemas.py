@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional, List
+from typing import Dict, Optional, List, Literal
 
 
 class ScanBase(BaseModel):
@@ -10,20 +10,78 @@ class ScanBase(BaseModel):
 
 class ScanCreate(ScanBase):
     printer_id: Optional[int] = None
+    # Set by scanners replaying codes buffered while offline
+    scanned_at: Optional[datetime] = None
+    # Client-generated key; retries with the same key return the first scan
+    idempotency_key: Optional[str] = Field(default=None, max_length=100)
+
+
+class ScanBulkItemResult(BaseModel):
+    index: int
+    status: str
+    id: Optional[int] = None
+    qr_content: Optional[str] = None
+    scanned_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+
+class ScanBulkResponse(BaseModel):
+    total: int
+    created: int
+    failed: int
+    results: List[ScanBulkItemResult]
 
 
 class ScanResponse(ScanBase):
     id: int
-    user_id: Optional[int]
+    user_id: Optional[int] = None
     scanned_at: datetime
-    printed_at: Optional[datetime]
+    printed_at: Optional[datetime] = None
     print_status: str
     qr_image: Optional[str] = None 
+    qr_image_url: Optional[str] = None
+    duplicate: bool = False
 
     class Config:
         from_attributes = True
 
 
+class CodeSummary(BaseModel):
+    qr_content: str
+    count: int
+    first_seen: datetime
+    last_seen: datetime
+    last_print_status: str
+
+
+class CodeMatch(BaseModel):
+    qr_content: str
+    count: int
+    last_seen: datetime
+
+
+class ScanStatsBucket(BaseModel):
+    bucket: datetime
+    scans: int
+    unique_codes: int
+    by_source: Dict[str, int]
+    by_status: Dict[str, int]
+    failure_rate: Optional[float] = None
+
+
+class ScanStatsResponse(BaseModel):
+    period: Literal["hour", "day"]
+    start_date: datetime
+    end_date: datetime
+    scans: int
+    by_source: Dict[str, int]
+    by_status: Dict[str, int]
+    # failed / (success + failed); None until something has finished printing
+    failure_rate: Optional[float] = None
+    buckets: List[ScanStatsBucket]
+    refreshed_at: Optional[datetime] = None
+
+
 class PrinterBase(BaseModel):
     name: str
     connection_type: str
@@ -56,5 +114,4 @@ class ExportRequest(BaseModel):
     start_date: Optional[datetime] = None
     end_date: Optional[datetime] = None
     user_id: Optional[int] = None
-
-
+    format: Literal["xlsx", "csv", "parquet", "arrow"] = "xlsx"
@@ -0,0 +1,114 @@
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from ..config import settings
+from .qr_service import QRService
+
+
+class DecodeQueueFull(Exception):
+    """Raised when the decode executor has no free slot for a new job"""
+
+
+class DecodeExecutor:
+    """Runs CPU-bound image decoding off the event loop.
+
+    Jobs go to a process pool (or a thread pool when configured) sized to the
+    number of cores. The number of jobs waiting or running is bounded;
+    submitting beyond that raises DecodeQueueFull so callers can answer 503
+    instead of piling up work.
+    """
+
+    def __init__(self, kind: str, workers: int, max_pending: int):
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.stage_hits: Dict[str, int] = {}
+        self.stage_time: Dict[str, float] = {}
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.max_pending
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def run(self, func: Callable, *args) -> Any:
+        """Run func(*args) in the pool and return its result"""
+        if self._pending >= self.capacity:
+            self.rejected += 1
+            raise DecodeQueueFull()
+
+        self._pending += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._get_executor(), func, *args)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._pending -= 1
+
+        elapsed = time.perf_counter() - started
+        self.completed += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        print(f"Decode job {func.__name__} finished in {elapsed * 1000:.1f} ms")
+        return result
+
+    async def decode(self, image_bytes: bytes) -> Dict[str, Any]:
+        """Run the staged QR decode pipeline and record per-stage timing"""
+        result = await self.run(QRService.decode_qr_pipeline, image_bytes)
+        for stage, ms in result["timings"].items():
+            self.stage_time[stage] = self.stage_time.get(stage, 0.0) + ms
+        hit = result["stage"] or "none"
+        self.stage_hits[hit] = self.stage_hits.get(hit, 0) + 1
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "avg_ms": (
+                round(self.total_time / self.completed * 1000, 1)
+                if self.completed
+                else 0.0
+            ),
+            "max_ms": round(self.max_time * 1000, 1),
+            "stage_hits": dict(self.stage_hits),
+            "stage_total_ms": {
+                stage: round(ms, 1) for stage, ms in self.stage_time.items()
+            },
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+decode_executor = DecodeExecutor(
+    settings.DECODE_EXECUTOR,
+    settings.DECODE_WORKERS,
+    settings.DECODE_QUEUE_SIZE,
+)
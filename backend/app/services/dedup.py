@@ -0,0 +1,61 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from ..config import settings
+
+
+class RecentScanIndex:
+    """In-memory index of recently stored scans keyed by (source, content).
+
+    Used to suppress repeats of the same code from the same source within
+    window_seconds. Entries are kept in insertion order, so expired ones are
+    always at the front and are dropped lazily on access.
+    """
+
+    def __init__(self, window_seconds: int, max_entries: int = 10000):
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Dict]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self.suppressed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_seconds > 0
+
+    def _purge(self, now: float):
+        cutoff = now - self.window_seconds
+        while self._entries:
+            key, (stored_at, _) = next(iter(self._entries.items()))
+            if stored_at >= cutoff and len(self._entries) <= self.max_entries:
+                break
+            self._entries.popitem(last=False)
+
+    def get(self, source: str, content: str) -> Optional[Dict]:
+        """Return the stored scan if the same code was seen inside the window"""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            entry = self._entries.get((source, content))
+            if entry is None:
+                return None
+            self.suppressed += 1
+            return entry[1]
+
+    def add(self, source: str, content: str, scan: Dict):
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._entries.pop((source, content), None)
+            self._entries[(source, content)] = (now, scan)
+            self._purge(now)
+
+
+recent_scans = RecentScanIndex(settings.SCAN_DUPLICATE_WINDOW_SECONDS)
@@ -1,77 +1,159 @@
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment
-import io
+from openpyxl.utils import get_column_letter
+import tempfile
 from datetime import datetime
-from typing import List
+from typing import IO, Callable, Iterator, List, Optional
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 
 class ExcelService:
+    HEADERS = [
+        "ID",
+        "QR Content",
+        "Scan Source",
+        "User ID",
+        "Scanned At",
+        "Printed At",
+        "Status",
+    ]
+    MAX_COLUMN_WIDTH = 50
+    # Rows buffered before the sheet header (with column widths) is written
+    WIDTH_SAMPLE_ROWS = 1000
+    YIELD_PER = 1000
+    SPOOL_MAX_SIZE = 8 * 1024 * 1024
+    CHUNK_SIZE = 64 * 1024
+
     @staticmethod
-    def create_scan_report(
-        db: Session, start_date: datetime = None, end_date: datetime = None
-    ):
-        """Create Excel report from scan records"""
+    def iter_scan_rows(
+        db: Session,
+        start_date: datetime = None,
+        end_date: datetime = None,
+        isoformat: bool = True,
+        progress: Optional[Callable[[int], None]] = None,
+    ) -> Iterator[list]:
+        """Stream report rows (in HEADERS order) from a server-side cursor
+
+        With isoformat=False timestamps are yielded as datetimes (or None).
+        progress, if given, is called with the number of rows read so far
+        every YIELD_PER rows and once at the end.
+        """
         from ..models import ScanRecord
 
-        query = db.query(ScanRecord)
+        query = select(ScanRecord)
 
         if start_date:
-            query = query.filter(ScanRecord.scanned_at >= start_date)
+            query = query.where(ScanRecord.scanned_at >= start_date)
         if end_date:
-            query = query.filter(ScanRecord.scanned_at <= end_date)
-
-        records = query.order_by(ScanRecord.scanned_at.desc()).all()
-
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Scan Report"
-
-        headers = [
-            "ID",
-            "QR Content",
-            "Scan Source",
-            "User ID",
-            "Scanned At",
-            "Printed At",
-            "Status",
-        ]
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = Font(bold=True)
-            cell.alignment = Alignment(horizontal="center")
-
-        for row, record in enumerate(records, 2):
-            ws.cell(row=row, column=1, value=record.id)
-            ws.cell(row=row, column=2, value=record.qr_content)
-            ws.cell(row=row, column=3, value=record.scan_source)
-            ws.cell(row=row, column=4, value=record.user_id)
-            ws.cell(
-                row=row,
-                column=5,
-                value=record.scanned_at.isoformat() if record.scanned_at else "",
-            )
-            ws.cell(
-                row=row,
-                column=6,
-                value=record.printed_at.isoformat() if record.printed_at else "",
+            query = query.where(ScanRecord.scanned_at <= end_date)
+
+        query = query.order_by(ScanRecord.scanned_at.desc()).execution_options(
+            yield_per=ExcelService.YIELD_PER
+        )
+
+        count = 0
+        for record in db.scalars(query):
+            scanned_at = record.scanned_at
+            printed_at = getattr(record, "printed_at", None)
+            if isoformat:
+                scanned_at = scanned_at.isoformat() if scanned_at else ""
+                printed_at = printed_at.isoformat() if printed_at else ""
+            yield [
+                record.id,
+                record.qr_content,
+                record.scan_source,
+                getattr(record, "user_id", None),
+                scanned_at,
+                printed_at,
+                record.print_status,
+            ]
+            count += 1
+            if progress and count % ExcelService.YIELD_PER == 0:
+                progress(count)
+
+        if progress:
+            progress(count)
+
+    @staticmethod
+    def create_scan_report(
+        db: Session,
+        start_date: datetime = None,
+        end_date: datetime = None,
+        output: Optional[IO[bytes]] = None,
+        progress: Optional[Callable[[int], None]] = None,
+    ) -> IO[bytes]:
+        """Create Excel report from scan records.
+
+        The workbook is built in write-only mode in a single pass over a
+        server-side cursor and saved to output (a spooled temp file by
+        default), which is returned rewound. Write-only sheets need column
+        widths before the first row, so widths are measured on the first
+        WIDTH_SAMPLE_ROWS rows, which are buffered until then.
+        """
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Scan Report")
+
+        widths = [len(header) for header in ExcelService.HEADERS]
+        buffered: List[list] = []
+        header_written = False
+
+        def write_header():
+            for col, width in enumerate(widths, 1):
+                ws.column_dimensions[get_column_letter(col)].width = min(
+                    width + 2, ExcelService.MAX_COLUMN_WIDTH
+                )
+            header = []
+            for title in ExcelService.HEADERS:
+                cell = WriteOnlyCell(ws, value=title)
+                cell.font = Font(bold=True)
+                cell.alignment = Alignment(horizontal="center")
+                header.append(cell)
+            ws.append(header)
+
+        rows = ExcelService.iter_scan_rows(
+            db, start_date, end_date, progress=progress
+        )
+        for row in rows:
+            if header_written:
+                ws.append(row)
+                continue
+
+            for col, value in enumerate(row):
+                if value is not None:
+                    widths[col] = max(widths[col], len(str(value)))
+            buffered.append(row)
+
+            if len(buffered) >= ExcelService.WIDTH_SAMPLE_ROWS:
+                write_header()
+                header_written = True
+                for buffered_row in buffered:
+                    ws.append(buffered_row)
+                buffered = []
+
+        if not header_written:
+            write_header()
+            for buffered_row in buffered:
+                ws.append(buffered_row)
+
+        if output is None:
+            output = tempfile.SpooledTemporaryFile(
+                max_size=ExcelService.SPOOL_MAX_SIZE
             )
-            ws.cell(row=row, column=7, value=record.print_status)
-
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
-
-        output = io.BytesIO()
         wb.save(output)
         output.seek(0)
 
         return output
+
+    @staticmethod
+    def iter_file(file: IO[bytes], chunk_size: int = None) -> Iterator[bytes]:
+        """Yield file contents in chunks and close the file afterwards"""
+        try:
+            while True:
+                chunk = file.read(chunk_size or ExcelService.CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            file.close()
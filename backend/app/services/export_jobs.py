@@ -0,0 +1,384 @@
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set
+
+from sqlalchemy import delete, func, select, text, update
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..config import settings
+from ..database import SessionLocal, engine
+from .excel_service import ExcelService
+from .export_service import ExportService
+
+# Serialises queue checks and claims of all workers (Postgres)
+ADVISORY_LOCK_ID = 0xE7907A0B5
+# Progress is written at most this often (seconds)
+PROGRESS_INTERVAL = 1.0
+# A running job without a progress write for this long lost its worker
+STALE_AFTER = timedelta(minutes=30)
+
+
+class ExportQueueFull(Exception):
+    """Raised when too many export jobs are already queued"""
+
+
+class ExportJob:
+    """Snapshot of an export_jobs row"""
+
+    def __init__(self, row: models.ExportJob):
+        self.id = row.id
+        self.format = row.format
+        self.start_date = row.start_date
+        self.end_date = row.end_date
+        self.status = row.status
+        self.error = row.error
+        self.rows_processed = row.rows_processed or 0
+        self.total_rows = row.total_rows
+        self.file_path = row.file_path
+        self.created_at = row.created_at
+        self.started_at = row.started_at
+        self.finished_at = row.finished_at
+
+    @property
+    def filename(self) -> str:
+        _, extension = ExportService.FORMATS[self.format]
+        stamp = self.created_at.strftime("%Y%m%d_%H%M%S")
+        return f"scan_report_{stamp}.{extension}"
+
+    def eta_seconds(self) -> Optional[float]:
+        if self.status != "running" or not self.total_rows or not self.rows_processed:
+            return None
+        elapsed = (
+            datetime.now(self.started_at.tzinfo) - self.started_at
+        ).total_seconds()
+        rate = self.rows_processed / elapsed if elapsed > 0 else 0
+        if not rate:
+            return None
+        return round(max(self.total_rows - self.rows_processed, 0) / rate, 1)
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "format": self.format,
+            "rows_processed": self.rows_processed,
+            "total_rows": self.total_rows,
+            "eta_seconds": self.eta_seconds(),
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "download_url": (
+                f"/api/scans/export/jobs/{self.id}/download"
+                if self.status == "done"
+                else None
+            ),
+        }
+
+
+class ExportJobManager:
+    """Renders exports in the background.
+
+    Jobs are rows of export_jobs and files are written to export_dir, so
+    with several workers any of them can report a job or serve its file;
+    export_dir must be shared by all of them. Each worker's threads claim
+    queued jobs under an advisory lock that also counts the running ones,
+    so at most max_running jobs render at once across all workers (each
+    holding one DB connection) and at most max_queued wait behind them:
+    exports can't starve scan ingestion. Finished files are kept for
+    retention_seconds and then removed together with their job.
+    """
+
+    def __init__(
+        self,
+        export_dir: str,
+        max_running: int,
+        max_queued: int,
+        retention_seconds: int,
+    ):
+        self.export_dir = export_dir
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.retention_seconds = retention_seconds
+        # Jobs rendered by this process
+        self._running: Set[str] = set()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_running, thread_name_prefix="export"
+            )
+        return self._executor
+
+    @staticmethod
+    def _lock(db: Session):
+        """Hold the export lock until the transaction ends"""
+        if db.get_bind().dialect.name == "postgresql":
+            db.execute(
+                text("SELECT pg_advisory_xact_lock(:id)"), {"id": ADVISORY_LOCK_ID}
+            )
+
+    @staticmethod
+    def _count(db: Session, status: str) -> int:
+        return db.scalar(
+            select(func.count())
+            .select_from(models.ExportJob)
+            .where(models.ExportJob.status == status)
+        )
+
+    def submit(
+        self,
+        file_format: str,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+    ) -> ExportJob:
+        db = SessionLocal()
+        try:
+            self._lock(db)
+            if self._count(db, "queued") >= self.max_queued:
+                raise ExportQueueFull()
+            row = models.ExportJob(
+                id=uuid.uuid4().hex,
+                format=file_format,
+                start_date=start_date,
+                end_date=end_date,
+                status="queued",
+                rows_processed=0,
+                created_at=datetime.now(),
+            )
+            db.add(row)
+            job = ExportJob(row)
+            db.commit()
+        finally:
+            db.rollback()
+            db.close()
+
+        self.dispatch()
+        return job
+
+    def get(self, job_id: str) -> Optional[ExportJob]:
+        db = SessionLocal()
+        try:
+            row = db.get(models.ExportJob, job_id)
+            return ExportJob(row) if row is not None else None
+        finally:
+            db.close()
+
+    def dispatch(self):
+        """Let a thread of this worker pick up queued jobs if slots are free"""
+        self._get_executor().submit(self._work)
+
+    def _claim(self) -> Optional[ExportJob]:
+        db = SessionLocal()
+        try:
+            self._lock(db)
+            if self._count(db, "running") >= self.max_running:
+                return None
+            row = db.scalars(
+                select(models.ExportJob)
+                .where(models.ExportJob.status == "queued")
+                .order_by(models.ExportJob.created_at)
+                .limit(1)
+            ).first()
+            if row is None:
+                return None
+            now = datetime.now()
+            row.status = "running"
+            row.started_at = now
+            row.updated_at = now
+            job = ExportJob(row)
+            db.commit()
+            return job
+        finally:
+            db.rollback()
+            db.close()
+
+    def _work(self):
+        while True:
+            job = self._claim()
+            if job is None:
+                return
+            self._run(job)
+
+    @staticmethod
+    def _update(job_id: str, **fields):
+        """Write job fields in a short transaction of their own"""
+        with engine.begin() as conn:
+            conn.execute(
+                update(models.ExportJob)
+                .where(models.ExportJob.id == job_id)
+                .values(**fields)
+            )
+
+    def _part_path(self, job_id: str) -> str:
+        return os.path.join(self.export_dir, f"{job_id}.part")
+
+    def _run(self, job: ExportJob):
+        self._running.add(job.id)
+        os.makedirs(self.export_dir, exist_ok=True)
+        part_path = self._part_path(job.id)
+        rows_processed = 0
+        last_write = time.monotonic()
+
+        def progress(rows: int):
+            # The job's session is busy streaming rows; progress goes
+            # through a short transaction, at most every PROGRESS_INTERVAL
+            nonlocal rows_processed, last_write
+            rows_processed = rows
+            if time.monotonic() - last_write >= PROGRESS_INTERVAL:
+                last_write = time.monotonic()
+                self._update(job.id, rows_processed=rows, updated_at=datetime.now())
+
+        db = SessionLocal()
+        try:
+            ScanRecord = models.ScanRecord
+            count_query = select(func.count()).select_from(ScanRecord)
+            if job.start_date:
+                count_query = count_query.where(ScanRecord.scanned_at >= job.start_date)
+            if job.end_date:
+                count_query = count_query.where(ScanRecord.scanned_at <= job.end_date)
+            total_rows = db.scalar(count_query)
+            db.execute(
+                update(models.ExportJob)
+                .where(models.ExportJob.id == job.id)
+                .values(total_rows=total_rows, updated_at=datetime.now())
+            )
+            db.commit()
+
+            with open(part_path, "wb") as output:
+                if job.format == "xlsx":
+                    ExcelService.create_scan_report(
+                        db, job.start_date, job.end_date, output, progress
+                    )
+                elif job.format == "csv":
+                    chunks = ExportService.iter_csv(
+                        job.start_date, job.end_date, progress, db
+                    )
+                    for chunk in chunks:
+                        output.write(chunk)
+                else:
+                    ExportService.create_columnar_report(
+                        db, job.start_date, job.end_date, job.format, output, progress
+                    )
+
+            final_path = os.path.join(self.export_dir, f"{job.id}.{job.format}")
+            os.replace(part_path, final_path)
+            db.rollback()
+            now = datetime.now()
+            db.execute(
+                update(models.ExportJob)
+                .where(models.ExportJob.id == job.id)
+                .values(
+                    status="done",
+                    file_path=final_path,
+                    rows_processed=rows_processed,
+                    updated_at=now,
+                    finished_at=now,
+                )
+            )
+            db.commit()
+
+        except Exception as e:
+            print(f"Export job {job.id} failed: {e}")
+            db.rollback()
+            self._remove_file(part_path)
+            try:
+                now = datetime.now()
+                self._update(
+                    job.id,
+                    status="failed",
+                    error=str(e),
+                    rows_processed=rows_processed,
+                    updated_at=now,
+                    finished_at=now,
+                )
+            except Exception as write_error:
+                print(f"Export job {job.id} status write failed: {write_error}")
+        finally:
+            db.close()
+            self._running.discard(job.id)
+
+    @staticmethod
+    def _remove_file(path: Optional[str]):
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Error deleting export file: {e}")
+
+    def cleanup(self) -> int:
+        """Fail jobs whose worker is gone, drop ones past the retention window"""
+        now = datetime.now()
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(models.ExportJob)
+                .where(
+                    models.ExportJob.status == "running",
+                    models.ExportJob.updated_at < now - STALE_AFTER,
+                )
+                .values(
+                    status="failed",
+                    error="Export worker stopped",
+                    finished_at=now,
+                )
+            )
+            cutoff = now - timedelta(seconds=self.retention_seconds)
+            expired = db.execute(
+                delete(models.ExportJob)
+                .where(models.ExportJob.finished_at < cutoff)
+                .returning(models.ExportJob.id, models.ExportJob.file_path)
+            ).all()
+            db.commit()
+        finally:
+            db.rollback()
+            db.close()
+
+        for job_id, file_path in expired:
+            self._remove_file(file_path)
+            self._remove_file(self._part_path(job_id))
+        return len(expired)
+
+    async def cleanup_loop(self, interval: int = 60):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = await asyncio.to_thread(self.cleanup)
+                if removed:
+                    print(f"Removed {removed} expired export jobs")
+                # Jobs queued while every slot was taken, or by a worker
+                # that has since stopped
+                self.dispatch()
+            except Exception as e:
+                print(f"Export jobs cleanup failed: {e}")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        now = datetime.now()
+        for job_id in list(self._running):
+            try:
+                self._update(
+                    job_id,
+                    status="failed",
+                    error="Export interrupted by a restart",
+                    updated_at=now,
+                    finished_at=now,
+                )
+            except Exception as e:
+                print(f"Export job {job_id} status write failed: {e}")
+
+
+export_jobs = ExportJobManager(
+    settings.EXPORT_DIR or os.path.join(tempfile.gettempdir(), "qr_exports"),
+    settings.EXPORT_MAX_RUNNING_JOBS,
+    settings.EXPORT_MAX_QUEUED_JOBS,
+    settings.EXPORT_RETENTION_MINUTES * 60,
+)
@@ -0,0 +1,132 @@
+import csv
+import io
+import tempfile
+from datetime import datetime
+from typing import IO, Callable, Iterator, Optional
+
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+from .excel_service import ExcelService
+
+
+class ExportService:
+    """Bulk export formats for scan history (CSV, Parquet, Arrow IPC)"""
+
+    FORMATS = {
+        "xlsx": (
+            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            "xlsx",
+        ),
+        "csv": ("text/csv; charset=utf-8", "csv"),
+        "parquet": ("application/vnd.apache.parquet", "parquet"),
+        "arrow": ("application/vnd.apache.arrow.file", "arrow"),
+    }
+    CSV_FLUSH_ROWS = 1000
+    ARROW_BATCH_ROWS = 50000
+
+    @staticmethod
+    def iter_csv(
+        start_date: datetime = None,
+        end_date: datetime = None,
+        progress: Optional[Callable[[int], None]] = None,
+        db: Optional[Session] = None,
+    ) -> Iterator[bytes]:
+        """Yield the CSV report in chunks.
+
+        Without db, opens its own DB session so the response can keep
+        streaming after the request's dependencies have been cleaned up;
+        a caller passing its session keeps ownership of it. Memory use is
+        bounded by CSV_FLUSH_ROWS rows.
+        """
+        own_session = db is None
+        if own_session:
+            db = SessionLocal()
+        try:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(ExcelService.HEADERS)
+
+            rows = ExcelService.iter_scan_rows(
+                db, start_date, end_date, progress=progress
+            )
+            for count, row in enumerate(rows, 1):
+                writer.writerow(row)
+                if count % ExportService.CSV_FLUSH_ROWS == 0:
+                    yield buffer.getvalue().encode("utf-8")
+                    buffer.seek(0)
+                    buffer.truncate()
+
+            yield buffer.getvalue().encode("utf-8")
+        finally:
+            if own_session:
+                db.close()
+
+    @staticmethod
+    def create_columnar_report(
+        db: Session,
+        start_date: datetime = None,
+        end_date: datetime = None,
+        file_format: str = "parquet",
+        output: Optional[IO[bytes]] = None,
+        progress: Optional[Callable[[int], None]] = None,
+    ) -> IO[bytes]:
+        """Write scan records as Parquet or Arrow IPC in record batches
+
+        Returns output (a spooled temp file by default), rewound.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema(
+            [
+                ("id", pa.int64()),
+                ("qr_content", pa.string()),
+                ("scan_source", pa.string()),
+                ("user_id", pa.int64()),
+                ("scanned_at", pa.timestamp("us", tz="UTC")),
+                ("printed_at", pa.timestamp("us", tz="UTC")),
+                ("print_status", pa.string()),
+            ]
+        )
+
+        if output is None:
+            output = tempfile.SpooledTemporaryFile(
+                max_size=ExcelService.SPOOL_MAX_SIZE
+            )
+        if file_format == "parquet":
+            writer = pq.ParquetWriter(output, schema, compression="snappy")
+        else:
+            writer = pa.ipc.new_file(output, schema)
+
+        def flush(columns):
+            arrays = [
+                pa.array(values, type=field.type)
+                for values, field in zip(columns, schema)
+            ]
+            batch = pa.RecordBatch.from_arrays(arrays, schema=schema)
+            if file_format == "parquet":
+                writer.write_batch(batch)
+            else:
+                writer.write(batch)
+
+        columns = [[] for _ in schema]
+        count = 0
+        rows = ExcelService.iter_scan_rows(
+            db, start_date, end_date, isoformat=False, progress=progress
+        )
+        for row in rows:
+            for column, value in zip(columns, row):
+                column.append(value)
+            count += 1
+            if count == ExportService.ARROW_BATCH_ROWS:
+                flush(columns)
+                columns = [[] for _ in schema]
+                count = 0
+
+        if count:
+            flush(columns)
+        writer.close()
+        output.seek(0)
+
+        return output
@@ -0,0 +1,185 @@
+import re
+from functools import lru_cache
+from typing import Optional
+
+import qrcode
+from qrcode.exceptions import DataOverflowError
+from PIL import Image
+
+from ..config import settings
+
+# Byte-mode capacity of QR versions 1-40 at error correction level M
+_QR_BYTE_CAPACITY_M = [
+    14, 26, 42, 62, 84, 106, 122, 152, 180, 213,
+    251, 287, 331, 362, 412, 450, 504, 560, 624, 666,
+    711, 779, 857, 911, 997, 1059, 1125, 1190, 1264, 1370,
+    1452, 1538, 1628, 1722, 1809, 1911, 1989, 2099, 2213, 2331,
+]
+
+MM_PER_INCH = 25.4
+_LABEL_SIZE_RE = re.compile(r"\s*(\d+(?:\.\d+)?)\s*[xх×]\s*(\d+(?:\.\d+)?)\s*")
+
+
+class LabelError(Exception):
+    """Raised for label sizes or payloads that can't be rendered"""
+
+
+class LabelTemplate:
+    """Label layout compiled once per (label size, dpi, format).
+
+    Holds the fixed ZPL header and the dot geometry; rendering only fills in
+    the payload and the ^PQ copy count, so printing the same label many
+    times never re-renders it.
+    """
+
+    def __init__(
+        self, width_mm: float, height_mm: float, dpi: int, label_format: str
+    ):
+        self.dpi = dpi
+        self.label_format = label_format
+        self.width = round(width_mm / MM_PER_INCH * dpi)
+        self.height = round(height_mm / MM_PER_INCH * dpi)
+        self.margin = max(round(dpi / 25), 4)  # ~1 mm
+        self.qr_side = min(self.width, self.height) - 2 * self.margin
+        self.header = f"^XA^CI28^PW{self.width}^LL{self.height}^LH0,0".encode()
+        self.text_x = self.margin * 2 + self.qr_side
+        self.text_height = max(round(dpi / 10), 12)
+
+    def fit(self, modules: int) -> int:
+        """Dots per module for a symbol of modules x modules on this label"""
+        dots = self.qr_side // modules
+        if dots < 1:
+            raise LabelError(
+                f"QR code of {modules}x{modules} modules doesn't fit the label "
+                f"({self.qr_side} dots available at {self.dpi} dpi)"
+            )
+        return dots
+
+    def module_size(self, content: bytes) -> int:
+        """Largest ^BQ magnification whose symbol still fits the label"""
+        for version, capacity in enumerate(_QR_BYTE_CAPACITY_M, 1):
+            if len(content) <= capacity:
+                break
+        else:
+            raise LabelError("Content too long for a QR code")
+        return min(10, self.fit(17 + 4 * version))
+
+    def render(self, content: str, copies: int) -> bytes:
+        if self.label_format == "raster":
+            return self.render_raster(content, copies)
+        return self.render_zpl(content, copies)
+
+    def render_zpl(self, content: str, copies: int) -> bytes:
+        data = content.encode("utf-8")
+        magnification = self.module_size(data)
+        escaped = _zpl_escape(data)
+        parts = [
+            self.header,
+            f"^FO{self.margin},{self.margin}^BQN,2,{magnification}".encode(),
+            b"^FH_^FDMA," + escaped + b"^FS",
+        ]
+        if self.width - self.text_x > self.text_height * 3:
+            parts.append(
+                f"^FO{self.text_x},{self.margin}"
+                f"^A0N,{self.text_height},{self.text_height}"
+                f"^FB{self.width - self.text_x - self.margin},6,0,L".encode()
+                + b"^FH_^FD"
+                + escaped
+                + b"^FS"
+            )
+        parts.append(f"^PQ{max(copies, 1)}^XZ".encode())
+        return b"".join(parts)
+
+    def render_raster(self, content: str, copies: int) -> bytes:
+        """1-bit bitmap of the whole label sent as a ZPL ^GFA graphic"""
+        qr = qrcode.QRCode(
+            error_correction=qrcode.constants.ERROR_CORRECT_M, border=0
+        )
+        qr.add_data(content)
+        try:
+            qr.make(fit=True)
+        except DataOverflowError:
+            raise LabelError("Content too long for a QR code")
+        matrix = qr.get_matrix()
+        modules = len(matrix)
+        box = self.fit(modules)
+        symbol = Image.new("1", (modules, modules), 1)
+        symbol.putdata([0 if dark else 1 for row in matrix for dark in row])
+        symbol = symbol.resize((modules * box, modules * box), Image.NEAREST)
+
+        canvas = Image.new("1", (self.width, self.height), 1)
+        canvas.paste(symbol, (self.margin, self.margin))
+        bitmap = _zpl_graphic(canvas)
+        return b"".join(
+            [
+                self.header,
+                b"^FO0,0" + bitmap + b"^FS",
+                f"^PQ{max(copies, 1)}^XZ".encode(),
+            ]
+        )
+
+
+def _zpl_escape(data: bytes) -> bytes:
+    """Hex-escape ZPL control characters for use after ^FH_"""
+    return re.sub(rb"[\^~_\x00-\x1f]", lambda m: b"_%02X" % m.group()[0], data)
+
+
+def _zpl_graphic(image: Image.Image) -> bytes:
+    """^GFA field for a 1-bit image (black dots are 1 bits)"""
+    width, height = image.size
+    bytes_per_row = (width + 7) // 8
+    # PIL mode "1" packs white as 1, ZPL expects black as 1
+    raw = bytes(b ^ 0xFF for b in image.tobytes())
+    total = bytes_per_row * height
+    header = f"^GFA,{total},{total},{bytes_per_row},".encode()
+    return header + raw.hex().upper().encode()
+
+
+class LabelService:
+    @staticmethod
+    def parse_label_size(label_size: str) -> tuple:
+        match = _LABEL_SIZE_RE.fullmatch(label_size or "")
+        if not match:
+            raise LabelError(
+                f"Invalid label size '{label_size}', expected e.g. 50x30"
+            )
+        width, height = float(match.group(1)), float(match.group(2))
+        if not (5 <= width <= 300 and 5 <= height <= 300):
+            raise LabelError(f"Label size '{label_size}' is out of range")
+        return width, height
+
+    @staticmethod
+    @lru_cache(maxsize=128)
+    def _compile(
+        width: float, height: float, dpi: int, label_format: str
+    ) -> LabelTemplate:
+        return LabelTemplate(width, height, dpi, label_format)
+
+    @staticmethod
+    def get_template(label_size: str, dpi: int, label_format: str) -> LabelTemplate:
+        """Compiled template, cached per (width, height, dpi, format)
+
+        The template doesn't depend on the printer, so all printers with the
+        same label share it; "50x30" and "50 x 30" share it too.
+        """
+        width, height = LabelService.parse_label_size(label_size)
+        return LabelService._compile(width, height, dpi, label_format)
+
+    @staticmethod
+    def render(
+        content: str,
+        label_size: str = "50x30",
+        copies: int = 1,
+        dpi: Optional[int] = None,
+        label_format: Optional[str] = None,
+    ) -> bytes:
+        """Printer-native label (ZPL or ZPL raster); copies are a ^PQ repeat
+
+        Raises LabelError for a bad size or a code that doesn't fit the label.
+        """
+        template = LabelService.get_template(
+            label_size or "50x30",
+            dpi or settings.PRINTER_DPI,
+            label_format or settings.PRINTER_LABEL_FORMAT,
+        )
+        return template.render(content, copies)
@@ -0,0 +1,186 @@
+import socket
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from ..config import settings
+
+
+class NetworkPrinterError(Exception):
+    """Raised when a raw TCP (port 9100) printer can't be reached
+
+    delivered is the number of payloads written in full before the failure.
+    """
+
+    def __init__(self, message: str, delivered: int = 0):
+        super().__init__(message)
+        self.delivered = delivered
+
+
+class NetworkPrinterPool:
+    """Persistent raw TCP connections to label printers, pooled per host.
+
+    Idle sockets are reused instead of opening a connection per label, and
+    several labels are pipelined over one connection. A send on a pooled
+    socket that turns out to be dead is retried once on a fresh connection,
+    but only if none of it was written: labels already handed to the
+    printer would print twice.
+    """
+
+    def __init__(self, max_per_printer: int, idle_timeout: float, timeout: float):
+        self.max_per_printer = max_per_printer
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle: Dict[Tuple[str, int], List[Tuple[socket.socket, float]]] = {}
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.reuses = 0
+
+    def _connect(self, host: str, port: int) -> socket.socket:
+        try:
+            conn = socket.create_connection((host, port), timeout=self.timeout)
+        except OSError as e:
+            raise NetworkPrinterError(f"{host}:{port} unreachable: {e}")
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.connects += 1
+        return conn
+
+    @staticmethod
+    def _is_alive(conn: socket.socket) -> bool:
+        """False if the printer has closed the idle connection"""
+        try:
+            conn.setblocking(False)
+            try:
+                return conn.recv(1, socket.MSG_PEEK) != b""
+            except BlockingIOError:
+                return True
+            finally:
+                conn.settimeout(None)
+        except OSError:
+            return False
+
+    def _checkout(self, host: str, port: int) -> Tuple[socket.socket, bool]:
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.get((host, port), [])
+            while idle:
+                conn, released_at = idle.pop()
+                if now - released_at < self.idle_timeout and self._is_alive(conn):
+                    conn.settimeout(self.timeout)
+                    self.reuses += 1
+                    return conn, True
+                conn.close()
+        return self._connect(host, port), False
+
+    def _checkin(self, host: str, port: int, conn: socket.socket):
+        with self._lock:
+            idle = self._idle.setdefault((host, port), [])
+            if len(idle) < self.max_per_printer:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    @staticmethod
+    def _write(conn: socket.socket, data: bytes) -> Tuple[int, Optional[OSError]]:
+        """sendall that reports how many bytes went out before an error"""
+        view = memoryview(data)
+        written = 0
+        try:
+            while written < len(data):
+                written += conn.send(view[written:])
+        except OSError as e:
+            return written, e
+        return written, None
+
+    def send(self, host: str, port: int, payloads: List[bytes]):
+        """Send all payloads back to back over one pooled connection
+
+        On failure NetworkPrinterError.delivered tells how many payloads
+        were written in full; a payload cut off midway counts as not sent.
+        """
+        data = b"".join(payloads)
+        conn, reused = self._checkout(host, port)
+        written, error = self._write(conn, data)
+        if error and reused and written == 0:
+            conn.close()
+            conn = self._connect(host, port)
+            written, error = self._write(conn, data)
+        if error:
+            conn.close()
+            delivered, end = 0, 0
+            for payload in payloads:
+                end += len(payload)
+                if end > written:
+                    break
+                delivered += 1
+            raise NetworkPrinterError(
+                f"{host}:{port} send failed after {delivered} of "
+                f"{len(payloads)} labels: {error}",
+                delivered,
+            )
+        self._checkin(host, port, conn)
+
+    def probe(self, host: str, port: int) -> Dict:
+        """Check reachability and ask for the ZPL host status (~HS).
+
+        Printers that don't speak ZPL just won't answer; they are still
+        reported as reachable.
+        """
+        started = time.perf_counter()
+        try:
+            conn = socket.create_connection((host, port), timeout=self.timeout)
+        except OSError as e:
+            return {"reachable": False, "error": str(e)}
+
+        latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        result = {"reachable": True, "latency_ms": latency_ms, "status": None}
+        try:
+            conn.settimeout(min(self.timeout, 2))
+            conn.sendall(b"~HS")
+            response = conn.recv(1024)
+            if response:
+                result["status"] = self.parse_host_status(response)
+        except OSError:
+            pass
+        finally:
+            conn.close()
+        return result
+
+    @staticmethod
+    def parse_host_status(response: bytes) -> Optional[Dict]:
+        """Pick the paper-out and pause flags from a ~HS reply"""
+        text = response.decode("ascii", errors="ignore")
+        first = text.split("\x03")[0].lstrip("\x02")
+        fields = first.split(",")
+        if len(fields) < 3:
+            return {"raw": text.strip()}
+        return {
+            "paper_out": fields[1].strip() == "1",
+            "paused": fields[2].strip() == "1",
+        }
+
+    def close_all(self):
+        with self._lock:
+            for idle in self._idle.values():
+                for conn, _ in idle:
+                    conn.close()
+            self._idle.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "connects": self.connects,
+                "reuses": self.reuses,
+                "idle": {
+                    f"{host}:{port}": len(idle)
+                    for (host, port), idle in self._idle.items()
+                },
+            }
+
+
+network_printers = NetworkPrinterPool(
+    settings.PRINTER_POOL_SIZE,
+    settings.PRINTER_IDLE_TIMEOUT,
+    settings.PRINTER_TIMEOUT,
+)
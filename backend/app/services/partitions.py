@@ -0,0 +1,289 @@
+import asyncio
+import gzip
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from ..config import settings
+from ..database import engine
+
+# Partitioned table -> partition key (see migration 0003)
+PARTITIONED = {"scan_records": "scanned_at", "photo_scans": "created_at"}
+
+# Only one worker maintains partitions at a time
+ADVISORY_LOCK_ID = 0x5CA17AB1E
+
+PARTITIONS = text(
+    r"""
+    SELECT c.relname,
+           CAST((regexp_match(pg_get_expr(c.relpartbound, c.oid),
+                              'TO \(''([^'']+)''\)'))[1] AS timestamptz)
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = CAST(:table AS regclass)
+    """
+)
+
+MONTHS = text(
+    """
+    SELECT to_char(m, '"y"YYYY"m"MM'), m, m + interval '1 month'
+    FROM generate_series(
+        date_trunc('month', now()),
+        date_trunc('month', now()) + make_interval(months => :ahead),
+        interval '1 month'
+    ) AS m
+    """
+)
+
+
+def _literal(value: datetime) -> str:
+    return f"'{value.isoformat()}'"
+
+
+class PartitionManager:
+    """Keeps monthly partitions ahead of time and archives expired ones.
+
+    Partitions for the current month and months_ahead after it are created
+    in advance (rows outside every range land in <table>_default). With a
+    retention of N months, partitions that end before the start of the
+    month N months ago are detached, written to archive_dir as
+    <partition>.csv.gz and dropped, together with the print jobs and
+    idempotency keys of their scans and the photo files still on disk.
+    Rows in <table>_default are reported as errors on every run. Queries on
+    the parent tables only read the partitions that their
+    scanned_at/created_at filter can match.
+    """
+
+    def __init__(
+        self,
+        months_ahead: int,
+        retention_months: int,
+        archive_dir: str,
+        interval: float,
+    ):
+        self.months_ahead = months_ahead
+        self.retention_months = retention_months
+        self.archive_dir = archive_dir
+        self.interval = interval
+        self.last_run: Optional[Dict] = None
+
+    @staticmethod
+    def _partitioned(conn: Connection, table: str) -> bool:
+        return (
+            conn.scalar(
+                text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"),
+                {"table": table},
+            )
+            == "p"
+        )
+
+    def partitions(self, conn: Connection, table: str) -> List[Tuple[str, datetime]]:
+        """(name, upper bound) of each partition; None for the default one"""
+        return [tuple(row) for row in conn.execute(PARTITIONS, {"table": table})]
+
+    def ensure(self, conn: Connection, table: str) -> Tuple[List[str], List[str]]:
+        """Create the partitions missing up to months_ahead.
+
+        Months are created one at a time, so a month that can't be created
+        (rows for it already sit in the default partition) doesn't hold back
+        the others. Returns the names created and the errors.
+        """
+        existing = dict(self.partitions(conn, table))
+        # The legacy partition covers everything before its upper bound
+        legacy_upper = existing.get(f"{table}_legacy")
+        created, errors = [], []
+        for suffix, lower, upper in conn.execute(
+            MONTHS, {"ahead": self.months_ahead}
+        ).all():
+            name = f"{table}_{suffix}"
+            if name in existing or (legacy_upper is not None and lower < legacy_upper):
+                continue
+            try:
+                conn.execute(
+                    text(
+                        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                        f"FOR VALUES FROM ({_literal(lower)}) TO ({_literal(upper)})"
+                    )
+                )
+                created.append(name)
+            except Exception as e:
+                errors.append(f"{name}: {e}")
+        return created, errors
+
+    @staticmethod
+    def default_rows(conn: Connection, table: str, limit: int = 10000) -> int:
+        """Rows in the default partition (counted up to limit)
+
+        Any row there blocks creating the partition for its month and is
+        never archived; it means scans were dated outside the prepared
+        months.
+        """
+        return conn.scalar(
+            text(
+                f"SELECT count(*) FROM (SELECT 1 FROM {table}_default "
+                "LIMIT :limit) AS rows"
+            ),
+            {"limit": limit},
+        )
+
+    def retention_cutoff(self) -> Optional[datetime]:
+        """Start of the oldest month that is kept, None when nothing expires"""
+        if self.retention_months <= 0:
+            return None
+        now = datetime.now().astimezone()
+        month = now.year * 12 + now.month - 1 - self.retention_months
+        return now.replace(
+            year=month // 12,
+            month=month % 12 + 1,
+            day=1,
+            hour=0,
+            minute=0,
+            second=0,
+            microsecond=0,
+        )
+
+    def expired(self, conn: Connection, table: str) -> List[str]:
+        """Attached partitions past retention, plus ones a failed run detached"""
+        cutoff = conn.scalar(
+            text(
+                "SELECT date_trunc('month', now()) "
+                "- make_interval(months => :months)"
+            ),
+            {"months": self.retention_months},
+        )
+        expired = [
+            name
+            for name, upper in self.partitions(conn, table)
+            if upper is not None and upper <= cutoff
+        ]
+        detached = conn.scalars(
+            text(
+                "SELECT relname FROM pg_class "
+                "WHERE relkind = 'r' AND NOT relispartition "
+                "AND relnamespace = CAST(current_schema() AS regnamespace) "
+                "AND relname ~ :pattern"
+            ),
+            {"pattern": f"^{table}_(legacy|y[0-9]{{4}}m[0-9]{{2}})$"},
+        ).all()
+        return expired + [name for name in detached if name not in expired]
+
+    def archive(self, conn: Connection, table: str, partition: str) -> str:
+        """Detach a partition, dump it to <archive_dir>/<partition>.csv.gz, drop it"""
+        attached = conn.scalar(
+            text("SELECT relispartition FROM pg_class WHERE oid = to_regclass(:name)"),
+            {"name": partition},
+        )
+        if attached:
+            # Takes a short exclusive lock on the parent; don't queue behind
+            # long queries, the next run retries
+            conn.execute(text("SET lock_timeout = '5s'"))
+            try:
+                conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition}"))
+            finally:
+                conn.execute(text("RESET lock_timeout"))
+
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f"{partition}.csv.gz")
+        temp_path = f"{path}.tmp"
+        cursor = conn.connection.driver_connection.cursor()
+        try:
+            with gzip.open(temp_path, "wb") as archive:
+                cursor.copy_expert(
+                    f"COPY {partition} TO STDOUT WITH (FORMAT csv, HEADER)", archive
+                )
+        finally:
+            cursor.close()
+        os.replace(temp_path, path)
+
+        if table == "photo_scans":
+            # Uploaded images still on disk (normally deleted minutes after
+            # the upload); the archive keeps only their paths
+            for file_path in conn.scalars(
+                text(f"SELECT file_path FROM {partition} WHERE file_path <> ''")
+            ):
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+        if table == "scan_records":
+            for dependent in ("print_jobs", "scan_idempotency_keys"):
+                conn.execute(
+                    text(
+                        f"DELETE FROM {dependent} "
+                        f"WHERE scan_id IN (SELECT id FROM {partition})"
+                    )
+                )
+        conn.execute(text(f"DROP TABLE {partition}"))
+        print(f"Archived partition {partition} to {path}")
+        return path
+
+    def run(self) -> Dict:
+        """One maintenance pass over all partitioned tables"""
+        result = {"created": [], "archived": [], "default_rows": {}, "errors": []}
+        if engine.dialect.name != "postgresql":
+            return result
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            if not conn.scalar(
+                text("SELECT pg_try_advisory_lock(:id)"), {"id": ADVISORY_LOCK_ID}
+            ):
+                return result
+            try:
+                for table in PARTITIONED:
+                    if not self._partitioned(conn, table):
+                        continue
+                    try:
+                        created, errors = self.ensure(conn, table)
+                        result["created"] += created
+                        result["errors"] += errors
+                        default_rows = self.default_rows(conn, table)
+                    except Exception as e:
+                        result["errors"].append(f"{table}: {e}")
+                    else:
+                        if default_rows:
+                            result["default_rows"][table] = default_rows
+                            result["errors"].append(
+                                f"{table}_default holds {default_rows} rows dated "
+                                "outside the partitioned months; move them to "
+                                "their month's partition"
+                            )
+                    if self.retention_months <= 0:
+                        continue
+                    for partition in self.expired(conn, table):
+                        try:
+                            result["archived"].append(
+                                self.archive(conn, table, partition)
+                            )
+                        except Exception as e:
+                            result["errors"].append(f"{partition}: {e}")
+            finally:
+                conn.execute(
+                    text("SELECT pg_advisory_unlock(:id)"), {"id": ADVISORY_LOCK_ID}
+                )
+        for error in result["errors"]:
+            print(f"Partition maintenance failed: {error}")
+        self.last_run = {**result, "finished_at": datetime.now().isoformat()}
+        return result
+
+    async def maintenance_loop(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.run)
+            except Exception as e:
+                print(f"Partition maintenance failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+partitions = PartitionManager(
+    settings.SCAN_PARTITION_MONTHS_AHEAD,
+    settings.SCAN_RETENTION_MONTHS,
+    settings.SCAN_ARCHIVE_DIR,
+    settings.SCAN_PARTITION_MAINTENANCE_INTERVAL,
+)
+
+
+if __name__ == "__main__":
+    # python -m app.services.partitions: one pass, e.g. from cron
+    print(partitions.run())
@@ -0,0 +1,352 @@
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import SessionLocal
+from .. import models
+from .label_service import LabelError, LabelService
+from .network_printer import NetworkPrinterError, network_printers
+from .printer_registry import PrinterInfo, printer_registry
+
+
+class PrintError(Exception):
+    """Raised when a label could not be delivered to the printer
+
+    delivered is the number of leading jobs of the batch that did reach it.
+    """
+
+    def __init__(self, message: str, delivered: int = 0):
+        super().__init__(message)
+        self.delivered = delivered
+
+
+class PrintService:
+    @staticmethod
+    def enqueue(
+        db: Session,
+        scan_id: Optional[int],
+        qr_content: str,
+        printer_id: Optional[int] = None,
+        copies: int = 1,
+        label_size: str = "50x30",
+    ) -> models.PrintJob:
+        """Add a print job to the caller's transaction (committed by the caller)
+
+        Only calls db.add, so it works with a Session or an AsyncSession.
+        """
+        job = models.PrintJob(
+            scan_id=scan_id,
+            qr_content=qr_content,
+            printer_id=printer_id,
+            copies=copies,
+            label_size=label_size,
+            status="queued",
+            next_attempt_at=datetime.now(),
+        )
+        db.add(job)
+        return job
+
+    @staticmethod
+    def _job_rows(jobs: List[Dict]) -> List[Dict]:
+        now = datetime.now()
+        return [
+            {
+                "scan_id": job["scan_id"],
+                "qr_content": job["qr_content"],
+                "printer_id": job.get("printer_id"),
+                "copies": job.get("copies", 1),
+                "label_size": job.get("label_size", "50x30"),
+                "status": "queued",
+                "attempts": 0,
+                "created_at": now,
+                "next_attempt_at": now,
+            }
+            for job in jobs
+        ]
+
+    @staticmethod
+    def enqueue_many(db: Session, jobs: List[Dict]):
+        """Insert many print jobs with one statement (committed by the caller)
+
+        Each item needs scan_id and qr_content; printer_id, copies and
+        label_size are optional.
+        """
+        if not jobs:
+            return
+        db.execute(insert(models.PrintJob), PrintService._job_rows(jobs))
+
+    @staticmethod
+    async def enqueue_many_async(db: AsyncSession, jobs: List[Dict]):
+        """enqueue_many for an AsyncSession"""
+        if not jobs:
+            return
+        await db.execute(insert(models.PrintJob), PrintService._job_rows(jobs))
+
+    @staticmethod
+    def resolve_printer(printer_id: Optional[int]) -> Optional[PrinterInfo]:
+        """Active printer by id, or the default printer (no database query)"""
+        return printer_registry.resolve(printer_id)
+
+    @staticmethod
+    def render_label(printer: PrinterInfo, job: models.PrintJob) -> bytes:
+        """Printer-native label; copies are printed by the printer (^PQ)"""
+        return LabelService.render(job.qr_content, job.label_size, job.copies)
+
+    @staticmethod
+    def send_to_printer(printer: PrinterInfo, jobs: List[models.PrintJob]):
+        """Deliver jobs to the printer or raise PrintError
+
+        Jobs for a network printer are pipelined over one pooled connection;
+        when that fails midway, PrintError.delivered counts the jobs sent.
+        """
+        if printer.connection_type == "browser":
+            # Labels for browser printers are printed by the client's print dialog
+            return
+        if printer.connection_type == "network":
+            if not printer.ip_address:
+                raise PrintError(f"Printer '{printer.name}' has no IP address")
+            try:
+                labels = [PrintService.render_label(printer, job) for job in jobs]
+            except LabelError as e:
+                raise PrintError(f"Printer '{printer.name}': {e}")
+            try:
+                network_printers.send(
+                    printer.ip_address, printer.port or 9100, labels
+                )
+            except NetworkPrinterError as e:
+                raise PrintError(f"Printer '{printer.name}': {e}", e.delivered)
+            return
+        raise PrintError(
+            f"Connection type '{printer.connection_type}' is not supported by the server"
+        )
+
+    @staticmethod
+    def claim(
+        db: Session,
+        busy_printer_ids: List[int],
+        limit: int = 1,
+        printer_id: Optional[int] = None,
+    ) -> List[models.PrintJob]:
+        """Claim up to limit due jobs, skipping rows locked by other workers.
+
+        With printer_id only jobs for that printer are claimed, so a batch
+        can be sent over one connection. Jobs left in "printing" longer than
+        PRINT_JOB_TIMEOUT (their worker died) are claimed again, so nothing
+        is lost across restarts.
+        """
+        now = datetime.now()
+        stale = now - timedelta(seconds=settings.PRINT_JOB_TIMEOUT)
+        query = (
+            select(models.PrintJob)
+            .where(
+                or_(
+                    and_(
+                        models.PrintJob.status == "queued",
+                        models.PrintJob.next_attempt_at <= now,
+                    ),
+                    and_(
+                        models.PrintJob.status == "printing",
+                        models.PrintJob.claimed_at < stale,
+                    ),
+                )
+            )
+            .order_by(models.PrintJob.next_attempt_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        if printer_id is not None:
+            query = query.where(models.PrintJob.printer_id == printer_id)
+        elif busy_printer_ids:
+            query = query.where(
+                or_(
+                    models.PrintJob.printer_id.is_(None),
+                    models.PrintJob.printer_id.not_in(busy_printer_ids),
+                )
+            )
+
+        jobs = list(db.scalars(query))
+        if not jobs:
+            db.rollback()
+            return []
+
+        for job in jobs:
+            job.status = "printing"
+            job.claimed_at = now
+        db.commit()
+        return jobs
+
+    @staticmethod
+    def complete(db: Session, job: models.PrintJob):
+        now = datetime.now()
+        job.status = "done"
+        job.finished_at = now
+        job.last_error = None
+        if job.scan_id is not None:
+            db.execute(
+                update(models.ScanRecord)
+                .where(models.ScanRecord.id == job.scan_id)
+                .values(print_status="success", printed_at=now)
+            )
+        db.commit()
+
+    @staticmethod
+    def fail(db: Session, job: models.PrintJob, error: str):
+        """Schedule a retry with exponential backoff, or give up"""
+        now = datetime.now()
+        job.attempts += 1
+        job.last_error = error
+        if job.attempts >= settings.PRINT_MAX_ATTEMPTS:
+            job.status = "failed"
+            job.finished_at = now
+            if job.scan_id is not None:
+                db.execute(
+                    update(models.ScanRecord)
+                    .where(models.ScanRecord.id == job.scan_id)
+                    .values(print_status="failed")
+                )
+        else:
+            delay = min(
+                settings.PRINT_RETRY_BASE_SECONDS * 2 ** (job.attempts - 1),
+                settings.PRINT_RETRY_MAX_SECONDS,
+            )
+            job.status = "queued"
+            job.next_attempt_at = now + timedelta(seconds=delay)
+        db.commit()
+
+    @staticmethod
+    def release(db: Session, job: models.PrintJob, delay: float):
+        """Put a claimed job back without counting an attempt"""
+        job.status = "queued"
+        job.next_attempt_at = datetime.now() + timedelta(seconds=delay)
+        db.commit()
+
+
+class PrintWorkerPool:
+    """Worker threads that drain the print_jobs table.
+
+    Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so several
+    processes can run workers side by side. Each printer gets at most
+    per_printer_limit jobs in flight in this process.
+    """
+
+    def __init__(self, workers: int, per_printer_limit: int, poll_interval: float):
+        self.workers = workers
+        self.per_printer_limit = per_printer_limit
+        self.poll_interval = poll_interval
+        self._threads: List[threading.Thread] = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._in_flight: Dict[int, int] = {}
+        self.printed = 0
+        self.failed = 0
+
+    def start(self):
+        self._stopping.clear()
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, name=f"print-worker-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def notify(self):
+        """Wake idle workers after new jobs were committed"""
+        self._wakeup.set()
+
+    def _busy_printers(self) -> List[int]:
+        with self._lock:
+            return [
+                printer_id
+                for printer_id, count in self._in_flight.items()
+                if count >= self.per_printer_limit
+            ]
+
+    def _acquire(self, printer_id: int) -> bool:
+        with self._lock:
+            count = self._in_flight.get(printer_id, 0)
+            if count >= self.per_printer_limit:
+                return False
+            self._in_flight[printer_id] = count + 1
+            return True
+
+    def _release(self, printer_id: int):
+        with self._lock:
+            self._in_flight[printer_id] -= 1
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                worked = self.process_one()
+            except Exception as e:
+                print(f"Print worker error: {e}")
+                worked = False
+            if not worked:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def process_one(self) -> bool:
+        """Claim and print a batch of jobs; returns False when nothing was due"""
+        db = SessionLocal()
+        try:
+            jobs = PrintService.claim(db, self._busy_printers())
+            if not jobs:
+                return False
+
+            job = jobs[0]
+            printer = PrintService.resolve_printer(job.printer_id)
+            if printer is None:
+                PrintService.fail(db, job, "Printer not found")
+                self.failed += 1
+                return True
+
+            if not self._acquire(printer.id):
+                PrintService.release(db, job, self.poll_interval)
+                return True
+
+            try:
+                if job.printer_id is not None and settings.PRINT_BATCH_SIZE > 1:
+                    jobs += PrintService.claim(
+                        db, [], settings.PRINT_BATCH_SIZE - 1, job.printer_id
+                    )
+                try:
+                    PrintService.send_to_printer(printer, jobs)
+                except PrintError as e:
+                    # Jobs already written to the printer are done; retrying
+                    # them would print their labels twice
+                    sent, unsent = jobs[: e.delivered], jobs[e.delivered :]
+                    print(f"Print jobs {[job.id for job in unsent]} failed: {e}")
+                    for job in sent:
+                        PrintService.complete(db, job)
+                    for job in unsent:
+                        PrintService.fail(db, job, str(e))
+                    self.printed += len(sent)
+                    self.failed += len(unsent)
+                else:
+                    for job in jobs:
+                        PrintService.complete(db, job)
+                    self.printed += len(jobs)
+            finally:
+                self._release(printer.id)
+            return True
+        finally:
+            db.close()
+
+
+print_workers = PrintWorkerPool(
+    settings.PRINT_WORKERS,
+    settings.PRINT_PER_PRINTER_CONCURRENCY,
+    settings.PRINT_POLL_INTERVAL,
+)
@@ -0,0 +1,187 @@
+import asyncio
+import ipaddress
+import socket
+import time
+from typing import Dict, List, Optional, Tuple
+
+from ..config import settings
+
+# Port -> protocol reported for hosts that accept a connection on it
+PROTOCOLS = {9100: "raw", 631: "ipp"}
+
+# Networks callers may ask to scan: RFC 1918 and link-local
+ALLOWED_NETWORKS = [
+    ipaddress.ip_network("10.0.0.0/8"),
+    ipaddress.ip_network("172.16.0.0/12"),
+    ipaddress.ip_network("192.168.0.0/16"),
+    ipaddress.ip_network("169.254.0.0/16"),
+]
+
+
+class DiscoveryError(Exception):
+    """Raised for subnets that can't or shouldn't be scanned"""
+
+
+class PrinterDiscovery:
+    """Concurrent TCP connect scan of a subnet for printer ports.
+
+    Every (host, port) pair is probed with asyncio.open_connection under a
+    semaphore, so a /24 takes roughly timeout * hosts / concurrency seconds
+    instead of a timeout per host. Results are cached per subnet for
+    ttl_seconds, and concurrent callers share one running scan.
+    """
+
+    def __init__(
+        self,
+        ports: List[int],
+        concurrency: int,
+        timeout: float,
+        ttl_seconds: float,
+        max_hosts: int,
+    ):
+        self.ports = ports
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.ttl_seconds = ttl_seconds
+        self.max_hosts = max_hosts
+        self._cache: Dict[str, Tuple[float, Dict]] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def _allowed(network: ipaddress.IPv4Network) -> bool:
+        configured = settings.PRINTER_DISCOVERY_SUBNET
+        if configured and network == ipaddress.ip_network(configured, strict=False):
+            return True
+        return any(network.subnet_of(allowed) for allowed in ALLOWED_NETWORKS)
+
+    @staticmethod
+    def local_subnet() -> str:
+        """The /24 of the interface that routes outside (no packets are sent)"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.connect(("10.255.255.255", 1))
+            address = sock.getsockname()[0]
+        except OSError:
+            address = "127.0.0.1"
+        finally:
+            sock.close()
+        return str(ipaddress.ip_network(f"{address}/24", strict=False))
+
+    def resolve_subnet(self, subnet: Optional[str]) -> ipaddress.IPv4Network:
+        """The network to scan; subnets passed by callers must be private.
+
+        The endpoints are unauthenticated, so a caller may only pick an
+        RFC 1918 or link-local network (or the configured subnet), never
+        make the server scan public addresses.
+        """
+        requested = subnet
+        subnet = subnet or settings.PRINTER_DISCOVERY_SUBNET or self.local_subnet()
+        try:
+            network = ipaddress.ip_network(subnet, strict=False)
+        except ValueError as e:
+            raise DiscoveryError(str(e))
+        if network.version != 4:
+            raise DiscoveryError("Only IPv4 subnets can be scanned")
+        if requested and not self._allowed(network):
+            raise DiscoveryError(
+                f"Subnet {network} is not a private network and can't be scanned"
+            )
+        if network.num_addresses > self.max_hosts:
+            raise DiscoveryError(
+                f"Subnet {network} has {network.num_addresses} addresses, "
+                f"the limit is {self.max_hosts}"
+            )
+        return network
+
+    async def _probe(
+        self, semaphore: asyncio.Semaphore, host: str, port: int
+    ) -> Optional[Dict]:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                _, writer = await asyncio.wait_for(
+                    asyncio.open_connection(host, port), self.timeout
+                )
+            except (OSError, asyncio.TimeoutError):
+                return None
+            latency_ms = round((time.perf_counter() - started) * 1000, 1)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+            return {"host": host, "port": port, "latency_ms": latency_ms}
+
+    async def _scan(self, network: ipaddress.IPv4Network) -> Dict:
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        hosts = [str(host) for host in network.hosts()] or [
+            str(network.network_address)
+        ]
+        results = await asyncio.gather(
+            *(
+                self._probe(semaphore, host, port)
+                for host in hosts
+                for port in self.ports
+            )
+        )
+
+        found: Dict[str, Dict] = {}
+        for result in results:
+            if result is None:
+                continue
+            printer = found.setdefault(
+                result["host"],
+                {
+                    "ip": result["host"],
+                    "ports": [],
+                    "latency_ms": result["latency_ms"],
+                },
+            )
+            printer["ports"].append(result["port"])
+            printer["latency_ms"] = min(printer["latency_ms"], result["latency_ms"])
+
+        printers = []
+        for ip in sorted(found, key=ipaddress.ip_address):
+            printer = found[ip]
+            printer["ports"].sort(key=self.ports.index)
+            printer["port"] = printer["ports"][0]
+            printer["protocols"] = [
+                PROTOCOLS.get(port, "tcp") for port in printer["ports"]
+            ]
+            printers.append(printer)
+
+        return {
+            "subnet": str(network),
+            "hosts_scanned": len(hosts),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            "scanned_at": time.time(),
+            "printers": printers,
+        }
+
+    async def scan(self, subnet: Optional[str] = None, refresh: bool = False) -> Dict:
+        """Printers listening on the discovery ports, cached for ttl_seconds"""
+        network = self.resolve_subnet(subnet)
+        key = str(network)
+        cached = self._cache.get(key)
+        fresh = cached and time.monotonic() - cached[0] < self.ttl_seconds
+        if fresh and not refresh:
+            return {**cached[1], "cached": True}
+
+        task = self._running.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._scan(network))
+            self._running[key] = task
+            task.add_done_callback(lambda _: self._running.pop(key, None))
+        result = await asyncio.shield(task)
+        self._cache[key] = (time.monotonic(), result)
+        return {**result, "cached": False}
+
+
+printer_discovery = PrinterDiscovery(
+    settings.PRINTER_DISCOVERY_PORTS,
+    settings.PRINTER_DISCOVERY_CONCURRENCY,
+    settings.PRINTER_DISCOVERY_TIMEOUT,
+    settings.PRINTER_DISCOVERY_TTL_SECONDS,
+    settings.PRINTER_DISCOVERY_MAX_HOSTS,
+)
@@ -0,0 +1,140 @@
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import SessionLocal
+from .. import models
+
+DEFAULT_PRINTER_NAME = "Браузерная печать"
+
+
+class PrinterInfo:
+    """Detached copy of a printers row, safe to share between threads"""
+
+    FIELDS = (
+        "id",
+        "name",
+        "connection_type",
+        "ip_address",
+        "port",
+        "is_default",
+        "is_active",
+        "created_at",
+    )
+
+    def __init__(self, printer: models.Printer):
+        self.id: int = printer.id
+        self.name: str = printer.name
+        self.connection_type: str = printer.connection_type
+        self.ip_address: Optional[str] = printer.ip_address
+        self.port: Optional[int] = printer.port
+        self.is_default: bool = printer.is_default
+        self.is_active: bool = printer.is_active
+        self.created_at: datetime = printer.created_at
+
+
+class PrinterRegistry:
+    """In-process cache of the active printers and the default printer.
+
+    Loaded at startup and reloaded right after every write in the printers
+    router, so resolving a printer on the scan -> print path is a dict
+    lookup. Writes made by other processes are picked up after ttl_seconds.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._printers: Dict[int, PrinterInfo] = {}
+        self._default_id: Optional[int] = None
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def reload(self, db: Optional[Session] = None):
+        """Replace the cache with the active printers from the database"""
+        own_session = db is None
+        db = db or SessionLocal()
+        try:
+            rows = (
+                db.query(models.Printer)
+                .filter(models.Printer.is_active == True)
+                .order_by(models.Printer.id)
+                .all()
+            )
+            printers = {row.id: PrinterInfo(row) for row in rows}
+        finally:
+            if own_session:
+                db.close()
+
+        default_id = next((p.id for p in printers.values() if p.is_default), None)
+        with self._lock:
+            self._printers = printers
+            self._default_id = default_id
+            self._loaded_at = time.monotonic()
+            self.loads += 1
+
+    def _ensure_loaded(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.ttl_seconds:
+            self.reload()
+
+    def get(self, printer_id: int) -> Optional[PrinterInfo]:
+        self._ensure_loaded()
+        return self._printers.get(printer_id)
+
+    def default(self) -> Optional[PrinterInfo]:
+        self._ensure_loaded()
+        with self._lock:
+            if self._default_id is None:
+                return None
+            return self._printers.get(self._default_id)
+
+    def resolve(self, printer_id: Optional[int]) -> Optional[PrinterInfo]:
+        """The given active printer, or the default one when printer_id is None"""
+        if printer_id is not None:
+            return self.get(printer_id)
+        return self.default()
+
+    def all(self) -> List[PrinterInfo]:
+        self._ensure_loaded()
+        return list(self._printers.values())
+
+    def ensure_default(self):
+        """Create the browser printer if there is no active default printer.
+
+        Run once at startup, so reads never have to insert rows.
+        """
+        db = SessionLocal()
+        try:
+            has_default = (
+                db.query(models.Printer.id)
+                .filter(models.Printer.is_default == True)
+                .filter(models.Printer.is_active == True)
+                .first()
+            )
+            if has_default is None:
+                printer = (
+                    db.query(models.Printer)
+                    .filter(models.Printer.name == DEFAULT_PRINTER_NAME)
+                    .first()
+                )
+                if printer is None:
+                    printer = models.Printer(
+                        name=DEFAULT_PRINTER_NAME, connection_type="browser"
+                    )
+                    db.add(printer)
+                printer.is_default = True
+                printer.is_active = True
+                db.commit()
+            self.reload(db)
+        except Exception as e:
+            db.rollback()
+            print(f"Default printer setup failed: {e}")
+        finally:
+            db.close()
+
+
+printer_registry = PrinterRegistry(settings.PRINTER_REGISTRY_TTL_SECONDS)
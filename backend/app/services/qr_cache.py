@@ -0,0 +1,96 @@
+import base64
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+
+class _CacheEntry:
+    __slots__ = ("png", "data_uri")
+
+    def __init__(self, png: bytes):
+        self.png = png
+        self.data_uri: Optional[str] = None
+
+    @property
+    def size(self) -> int:
+        return len(self.png) + (len(self.data_uri) if self.data_uri else 0)
+
+
+class QRImageCache:
+    """LRU cache of rendered QR images bounded by total size in bytes.
+
+    Raw PNG bytes are stored on first render; the base64 data URI is built
+    lazily and kept alongside them only once a caller actually asks for it.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_png(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.png
+
+    def put(self, key: Hashable, png: bytes, data_uri: Optional[str] = None):
+        entry = _CacheEntry(png)
+        entry.data_uri = data_uri
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._evict()
+
+    def get_data_uri(self, key: Hashable) -> Optional[str]:
+        """Return the cached data URI, building it from the PNG if needed"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if entry.data_uri is None:
+                encoded = base64.b64encode(entry.png).decode()
+                entry.data_uri = f"data:image/png;base64,{encoded}"
+                self._bytes += len(entry.data_uri)
+                data_uri = entry.data_uri
+                self._evict()
+                return data_uri
+            return entry.data_uri
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -1,7 +1,10 @@
 import qrcode
 import io
 import base64
-from typing import Optional
+import hashlib
+import time
+from urllib.parse import quote
+from typing import Dict, Iterator, List, Optional, Tuple
 from PIL import Image
 import json
 import os
@@ -11,63 +14,185 @@ import cv2
 from pyzbar.pyzbar import decode
 import numpy as np
 
+from ..config import settings
+from .qr_cache import QRImageCache
+
+qr_image_cache = QRImageCache(settings.QR_CACHE_MAX_BYTES)
+
 
 class QRService:
     @staticmethod
-    def generate_qr_code(content: str, size: int = 200) -> str:
+    def _render_png(
+        content: str, box_size: int, error_correction: int, border: int
+    ) -> bytes:
+        qr = qrcode.QRCode(
+            version=1,
+            error_correction=error_correction,
+            box_size=box_size,
+            border=border,
+        )
+        qr.add_data(content)
+        qr.make(fit=True)
+
+        img = qr.make_image(fill_color="black", back_color="white")
+
+        buffered = io.BytesIO()
+        img.save(buffered, format="PNG")
+        return buffered.getvalue()
+
+    @staticmethod
+    def render_qr_png(
+        content: str,
+        box_size: int = 10,
+        error_correction: int = qrcode.constants.ERROR_CORRECT_L,
+        border: int = 4,
+    ) -> bytes:
+        """Render QR code to PNG bytes, reusing the shared image cache"""
+        key = (content, box_size, error_correction, border)
+        png = qr_image_cache.get_png(key)
+        if png is None:
+            png = QRService._render_png(content, box_size, error_correction, border)
+            qr_image_cache.put(key, png)
+        return png
+
+    @staticmethod
+    def generate_qr_code(
+        content: str,
+        size: int = 200,
+        box_size: int = 10,
+        error_correction: int = qrcode.constants.ERROR_CORRECT_L,
+        border: int = 4,
+    ) -> str:
         """Generate QR code and return base64 encoded image"""
         try:
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(content)
-            qr.make(fit=True)
+            key = (content, box_size, error_correction, border)
+            data_uri = qr_image_cache.get_data_uri(key)
+            if data_uri is not None:
+                return data_uri
 
-            img = qr.make_image(fill_color="black", back_color="white")
+            png = QRService._render_png(content, box_size, error_correction, border)
+            img_str = base64.b64encode(png).decode()
+            data_uri = f"data:image/png;base64,{img_str}"
+            qr_image_cache.put(key, png, data_uri)
 
-            buffered = io.BytesIO()
-            img.save(buffered, format="PNG")
-            img_str = base64.b64encode(buffered.getvalue()).decode()
-
-            return f"data:image/png;base64,{img_str}"
+            return data_uri
 
         except Exception as e:
             print(f"QR generation error: {e}")
             return ""
 
     @staticmethod
-    def decode_qr_from_bytes(image_bytes: bytes) -> Optional[str]:
-        """Decode QR code from image bytes using OpenCV and pyzbar"""
+    def image_digest(
+        content: str,
+        box_size: int = 10,
+        error_correction: int = qrcode.constants.ERROR_CORRECT_L,
+        border: int = 4,
+    ) -> str:
+        """Content address of a rendered QR image (content + render params)"""
+        key = f"{box_size}:{error_correction}:{border}:{content}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+    @staticmethod
+    def image_url(content: str) -> str:
+        """URL of the cacheable PNG for the given content"""
+        digest = QRService.image_digest(content)
+        return f"/api/qr/image/{digest}.png?data={quote(content, safe='')}"
+
+    @staticmethod
+    def cache_stats() -> dict:
+        """Hit/miss counters and memory usage of the QR image cache"""
+        return qr_image_cache.stats()
+
+    @staticmethod
+    def _decode_symbols(img: np.ndarray) -> List[str]:
+        codes = []
+        for obj in decode(img):
+            qr_data = obj.data.decode("utf-8")
+            if qr_data not in codes:
+                codes.append(qr_data)
+        return codes
+
+    @staticmethod
+    def _stage_images(gray: np.ndarray) -> Iterator[Tuple[str, np.ndarray]]:
+        """Yield (stage, image) variants lazily, each derived from the same
+        grayscale array so nothing is decoded or re-encoded twice"""
+        cache: Dict[str, np.ndarray] = {}
+
+        def clahe() -> np.ndarray:
+            if "clahe" not in cache:
+                cache["clahe"] = cv2.createCLAHE(
+                    clipLimit=2.0, tileGridSize=(8, 8)
+                ).apply(gray)
+            return cache["clahe"]
+
+        for stage in settings.DECODE_STAGES:
+            if stage == "downscaled":
+                height, width = gray.shape[:2]
+                scale = settings.DECODE_DOWNSCALE_MAX_SIDE / max(height, width)
+                if scale >= 1:
+                    continue
+                yield stage, cv2.resize(
+                    gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+                )
+            elif stage == "full":
+                yield stage, gray
+            elif stage == "equalized":
+                yield stage, cv2.equalizeHist(gray)
+            elif stage == "clahe":
+                yield stage, clahe()
+            elif stage == "otsu":
+                blurred = cv2.GaussianBlur(clahe(), (3, 3), 0)
+                _, binary = cv2.threshold(
+                    blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU
+                )
+                yield stage, binary
+
+    @staticmethod
+    def decode_qr_pipeline(image_bytes: bytes) -> Dict:
+        """Staged QR decoding with early exit.
+
+        The image is decoded once to grayscale, then pyzbar is tried on the
+        variants from settings.DECODE_STAGES in order (downscaled, full-res,
+        equalized, CLAHE, Otsu) until one yields codes. Returns the first
+        code, every code found at that stage, the stage name and per-stage
+        timings in milliseconds.
+        """
+        result = {"qr_content": None, "codes": [], "stage": None, "timings": {}}
         try:
-            # Convert bytes to numpy array
+            started = time.perf_counter()
             nparr = np.frombuffer(image_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
+            gray = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
+            result["timings"]["imdecode"] = round(
+                (time.perf_counter() - started) * 1000, 1
+            )
 
-            if img is None:
+            if gray is None:
                 print("Failed to decode image")
-                return None
-
-            # Enhance contrast
-            img = cv2.equalizeHist(img)
+                return result
 
-            # Decode QR codes
-            decoded_objects = decode(img)
+            stage_started = time.perf_counter()
+            for stage, img in QRService._stage_images(gray):
+                codes = QRService._decode_symbols(img)
+                now = time.perf_counter()
+                result["timings"][stage] = round((now - stage_started) * 1000, 1)
+                stage_started = now
 
-            if decoded_objects:
-                for obj in decoded_objects:
-                    qr_data = obj.data.decode("utf-8")
-                    print(f"Found QR code: {qr_data}")
-                    return qr_data
+                if codes:
+                    print(f"Found QR code at stage {stage}: {codes[0]}")
+                    result.update(qr_content=codes[0], codes=codes, stage=stage)
+                    return result
 
             print("No QR code found in image")
-            return None
+            return result
 
         except Exception as e:
             print(f"QR decoding error: {e}")
-            return None
+            return result
+
+    @staticmethod
+    def decode_qr_from_bytes(image_bytes: bytes) -> Optional[str]:
+        """Decode QR code from image bytes using OpenCV and pyzbar"""
+        return QRService.decode_qr_pipeline(image_bytes)["qr_content"]
 
     @staticmethod
     def decode_qr_from_file(file_path: str) -> Optional[str]:
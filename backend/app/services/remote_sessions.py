@@ -0,0 +1,288 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import OperationalError
+
+from ..config import settings
+from ..database import SessionLocal
+from .. import models
+
+FIELDS = (
+    "session_id",
+    "host_connected",
+    "client_connected",
+    "created_at",
+    "expires_at",
+    "is_active",
+)
+
+# remote_sessions.session_id is VARCHAR(6)
+SESSION_ID_MAX_LENGTH = 6
+
+
+def _naive(value: Optional[datetime]) -> Optional[datetime]:
+    """Local naive datetime, comparable with datetime.now()"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+class RemoteSessionCache:
+    """Cached view of remote_sessions with write-behind for connection changes.
+
+    WebSocket connects, disconnects and expiry extensions only touch the
+    cached row and queue the changed fields; flush_loop writes everything
+    queued in one short transaction every flush_interval seconds. Reads are
+    served from the cache and loaded with a short-lived session on a miss,
+    so no pooled connection is held while a socket sits idle. Rows written
+    by other processes are re-read after ttl_seconds. Should the batch
+    fail, it is retried row by row: rows the database rejects are dropped
+    (see write_error), so one bad row can't hold back the others.
+    """
+
+    def __init__(
+        self, ttl_seconds: float, flush_interval: float, lifetime: timedelta
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.flush_interval = flush_interval
+        self.lifetime = lifetime
+        # session_id -> (loaded_at, row or None when there is no such session)
+        self._rows: Dict[str, Tuple[float, Optional[Dict]]] = {}
+        self._pending: Dict[str, Dict] = {}
+        # session_id -> why its last change was dropped
+        self._rejected: Dict[str, str] = {}
+        self._flush_lock = asyncio.Lock()
+        self.loads = 0
+        self.flushes = 0
+        self.rejected = 0
+
+    @staticmethod
+    def is_valid_id(session_id) -> bool:
+        """session_id fits the remote_sessions column"""
+        return (
+            isinstance(session_id, str)
+            and 0 < len(session_id) <= SESSION_ID_MAX_LENGTH
+        )
+
+    def _load(self, session_id: str) -> Optional[Dict]:
+        db = SessionLocal()
+        try:
+            session = (
+                db.query(models.RemoteSession)
+                .filter(models.RemoteSession.session_id == session_id)
+                .first()
+            )
+            if session is None:
+                return None
+            row = {field: getattr(session, field) for field in FIELDS}
+        finally:
+            db.close()
+        row["created_at"] = _naive(row["created_at"])
+        row["expires_at"] = _naive(row["expires_at"])
+        return row
+
+    async def get(self, session_id: str) -> Optional[Dict]:
+        """Session row as a dict (cached), None if it doesn't exist"""
+        cached = self._rows.get(session_id)
+        if cached is not None and time.monotonic() - cached[0] < self.ttl_seconds:
+            return dict(cached[1]) if cached[1] is not None else None
+
+        row = await asyncio.to_thread(self._load, session_id)
+        self.loads += 1
+        pending = self._pending.get(session_id)
+        if pending:
+            # Queued changes are newer than what is in the database
+            row = {**(row or {"session_id": session_id}), **pending}
+        self._rows[session_id] = (time.monotonic(), row)
+        return dict(row) if row is not None else None
+
+    @staticmethod
+    def is_live(row: Optional[Dict]) -> bool:
+        return bool(
+            row
+            and row.get("is_active")
+            and (row.get("expires_at") is None or row["expires_at"] > datetime.now())
+        )
+
+    def _change(self, session_id: str, fields: Dict):
+        cached = self._rows.get(session_id)
+        row = dict(cached[1]) if cached and cached[1] else {"session_id": session_id}
+        row.update(fields)
+        loaded_at = cached[0] if cached else time.monotonic()
+        self._rows[session_id] = (loaded_at, row)
+        self._pending.setdefault(session_id, {}).update(fields)
+        self._rejected.pop(session_id, None)
+
+    def write_error(self, session_id: str) -> Optional[str]:
+        """Why the session's queued changes aren't in the database, or None"""
+        if session_id in self._pending:
+            return "database unavailable, will retry"
+        return self._rejected.get(session_id)
+
+    def activate(self, session_id: str, **fields):
+        """Mark the session active and extend its lifetime (written behind)"""
+        now = datetime.now()
+        cached = self._rows.get(session_id)
+        if not (cached and cached[1] and cached[1].get("created_at")):
+            fields.setdefault("created_at", now)
+        fields.update(is_active=True, expires_at=now + self.lifetime)
+        self._change(session_id, fields)
+
+    def set(self, session_id: str, **fields):
+        """Change fields of the session (written behind)"""
+        self._change(session_id, fields)
+
+    def extend(self, session_id: str):
+        """Push expires_at forward; skipped while most of the lifetime is left"""
+        cached = self._rows.get(session_id)
+        row = cached[1] if cached else None
+        now = datetime.now()
+        expires_at = row.get("expires_at") if row else None
+        if expires_at and expires_at - now > self.lifetime * 0.75:
+            return
+        self._change(session_id, {"expires_at": now + self.lifetime})
+
+    def invalidate(self, session_id: str):
+        """Forget the cached row after a direct database write"""
+        self._rows.pop(session_id, None)
+
+    def _upsert(self, batch: Dict[str, Dict]):
+        db = SessionLocal()
+        try:
+            existing = dict(
+                db.execute(
+                    select(
+                        models.RemoteSession.session_id, models.RemoteSession.id
+                    ).where(models.RemoteSession.session_id.in_(list(batch)))
+                ).all()
+            )
+            updates: List[Dict] = []
+            inserts: List[Dict] = []
+            for session_id, fields in batch.items():
+                if session_id in existing:
+                    updates.append({"id": existing[session_id], **fields})
+                elif fields.get("is_active"):
+                    inserts.append({"session_id": session_id, **fields})
+            if updates:
+                db.execute(update(models.RemoteSession), updates)
+            if inserts:
+                db.execute(insert(models.RemoteSession), inserts)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _write(self, batch: Dict[str, Dict]) -> Tuple[Dict[str, Dict], Dict[str, str]]:
+        """Write the batch; returns the changes to retry and the rejected ids
+
+        Changes are only kept for a retry when the database is unavailable;
+        rows it rejects are dropped.
+        """
+        try:
+            self._upsert(batch)
+            return {}, {}
+        except OperationalError:
+            raise
+        except Exception as e:
+            print(f"Remote session flush failed, writing one by one: {e}")
+
+        rejected = {}
+        items = list(batch.items())
+        for index, (session_id, fields) in enumerate(items):
+            try:
+                self._upsert({session_id: fields})
+            except OperationalError as e:
+                print(f"Remote session flush failed: {e}")
+                return dict(items[index:]), rejected
+            except Exception as e:
+                print(f"Remote session {str(session_id)[:20]!r} dropped: {e}")
+                rejected[session_id] = str(e).splitlines()[0]
+        return {}, rejected
+
+    async def flush(self):
+        """Write all queued changes in one transaction"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            try:
+                retry, rejected = await asyncio.to_thread(self._write, batch)
+                self.flushes += 1
+            except Exception as e:
+                print(f"Remote session flush failed: {e}")
+                retry, rejected = batch, {}
+            # Keep changes made since the swap, they are newer
+            for session_id, fields in retry.items():
+                self._pending[session_id] = {
+                    **fields,
+                    **self._pending.get(session_id, {}),
+                }
+            for session_id, error in rejected.items():
+                self.rejected += 1
+                if session_id not in self._pending:
+                    self._rows.pop(session_id, None)
+                    self._rejected[session_id] = error
+            # Only recent failures matter to callers of write_error
+            while len(self._rejected) > 1000:
+                del self._rejected[next(iter(self._rejected))]
+
+    def _expire(self, now: datetime) -> List[str]:
+        db = SessionLocal()
+        try:
+            expired = db.scalars(
+                update(models.RemoteSession)
+                .where(
+                    models.RemoteSession.is_active == True,
+                    models.RemoteSession.expires_at <= now,
+                )
+                .values(is_active=False, host_connected=False, client_connected=False)
+                .returning(models.RemoteSession.session_id)
+                .execution_options(synchronize_session=False)
+            ).all()
+            db.commit()
+            return list(expired)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def sweep(self) -> List[str]:
+        """Deactivate expired sessions in one statement; returns their ids.
+
+        Queued extensions are flushed first so live sessions aren't expired.
+        Cache entries that are stale anyway are dropped, so the cache only
+        holds recently used sessions.
+        """
+        await self.flush()
+        now = datetime.now()
+        expired = await asyncio.to_thread(self._expire, now)
+        for session_id in expired:
+            cached = self._rows.get(session_id)
+            if cached and cached[1]:
+                cached[1].update(
+                    is_active=False, host_connected=False, client_connected=False
+                )
+
+        cutoff = time.monotonic() - self.ttl_seconds
+        for session_id, (loaded_at, _) in list(self._rows.items()):
+            if loaded_at < cutoff and session_id not in self._pending:
+                del self._rows[session_id]
+        return expired
+
+    async def flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+remote_sessions = RemoteSessionCache(
+    settings.REMOTE_SESSION_CACHE_TTL_SECONDS,
+    settings.REMOTE_SESSION_FLUSH_INTERVAL,
+    timedelta(minutes=settings.REMOTE_SESSION_LIFETIME_MINUTES),
+)
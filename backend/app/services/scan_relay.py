@@ -0,0 +1,263 @@
+import asyncio
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Set, Tuple
+
+from fastapi import WebSocket
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+
+from ..config import settings
+from ..database import SessionLocal
+from .. import models
+from .dedup import recent_scans
+from .print_service import PrintService, print_workers
+
+
+class OutboundQueue:
+    """Bounded outgoing message queue of one WebSocket connection.
+
+    put() never waits, so a slow peer can't stall the connection that
+    produces the messages. A sender task drains the queue: scans that
+    arrive within batch_window seconds are coalesced into one scan_batch
+    frame, other messages go out one by one and in order. When the queue
+    is full new scans are refused (the producer acks them as dropped);
+    a peer that doesn't take a frame within send_timeout is disconnected.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        max_size: int,
+        batch_window: float,
+        batch_max: int,
+        send_timeout: float,
+    ):
+        self.websocket = websocket
+        self.max_size = max_size
+        self.batch_window = batch_window
+        self.batch_max = batch_max
+        self.send_timeout = send_timeout
+        self._queue: Deque[Dict] = deque()
+        self._ready = asyncio.Event()
+        self.closed = False
+        self.sent = 0
+        self.frames = 0
+        self.dropped = 0
+        self._task = asyncio.create_task(self._run())
+
+    def put(self, message: Dict) -> bool:
+        """Queue a message; False if it was dropped"""
+        if self.closed:
+            return False
+        # Control messages may exceed the limit, scans may not
+        if message.get("type") == "scan" and len(self._queue) >= self.max_size:
+            self.dropped += 1
+            return False
+        self._queue.append(message)
+        self._ready.set()
+        return True
+
+    def _next_frame(self) -> Dict:
+        if self._queue[0].get("type") != "scan":
+            return self._queue.popleft()
+        scans = []
+        while self._queue and self._queue[0].get("type") == "scan":
+            scans.append(self._queue.popleft())
+            if len(scans) >= self.batch_max:
+                break
+        if len(scans) == 1:
+            return scans[0]
+        return {
+            "type": "scan_batch",
+            "count": len(scans),
+            "scans": scans,
+            "timestamp": datetime.now().isoformat(),
+        }
+
+    async def _run(self):
+        try:
+            while True:
+                await self._ready.wait()
+                if not self._queue:
+                    self._ready.clear()
+                    continue
+                if self._queue[0].get("type") == "scan" and self.batch_window > 0:
+                    # Let a burst accumulate into one frame
+                    await asyncio.sleep(self.batch_window)
+                frame = self._next_frame()
+                await asyncio.wait_for(
+                    self.websocket.send_json(frame), self.send_timeout
+                )
+                self.frames += 1
+                self.sent += frame.get("count", 1)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            print("WebSocket peer too slow, closing the connection")
+            self.closed = True
+            try:
+                await self.websocket.close(code=1013, reason="Peer too slow")
+            except Exception:
+                pass
+        except Exception as e:
+            print(f"WebSocket send failed: {e}")
+            self.closed = True
+
+    async def close(self):
+        self.closed = True
+        self._task.cancel()
+        try:
+            await self._task
+        except (asyncio.CancelledError, Exception):
+            pass
+
+    def stats(self) -> Dict:
+        return {
+            "queued": len(self._queue),
+            "sent": self.sent,
+            "frames": self.frames,
+            "dropped": self.dropped,
+        }
+
+
+def create_outbound_queue(websocket: WebSocket) -> OutboundQueue:
+    return OutboundQueue(
+        websocket,
+        settings.WS_SEND_QUEUE_SIZE,
+        settings.WS_BATCH_WINDOW_MS / 1000,
+        settings.WS_BATCH_MAX_SCANS,
+        settings.WS_SEND_TIMEOUT,
+    )
+
+
+class RelayedScanWriter:
+    """Stores relayed remote-scanner scans as ScanRecords in batches.
+
+    Scans are buffered and inserted with one INSERT ... RETURNING (plus
+    their print jobs) every flush_interval seconds, or as soon as
+    batch_size scans are waiting. Repeats of a code stored or buffered
+    inside SCAN_DUPLICATE_WINDOW_SECONDS are skipped. Callers validate the
+    content; should a batch still fail, it is retried row by row so one
+    bad row can't hold back the others.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer: List[Dict] = []
+        # (source, content) of scans buffered or being written
+        self._pending: Set[Tuple[str, str]] = set()
+        self._full = asyncio.Event()
+        self.written = 0
+        self.rejected = 0
+
+    def add(self, qr_content: str, scan_source: str = "remote_phone") -> bool:
+        """Buffer a scan; False if it repeats one inside the duplicate window"""
+        if recent_scans.enabled and (
+            (scan_source, qr_content) in self._pending
+            or recent_scans.get(scan_source, qr_content) is not None
+        ):
+            return False
+        self._buffer.append(
+            {
+                "qr_content": qr_content,
+                "scan_source": scan_source,
+                "scanned_at": datetime.now(),
+                "print_status": "pending",
+            }
+        )
+        if recent_scans.enabled:
+            self._pending.add((scan_source, qr_content))
+        if len(self._buffer) >= self.batch_size:
+            self._full.set()
+        return True
+
+    def _insert(self, rows: List[Dict]):
+        db = SessionLocal()
+        try:
+            table = models.ScanRecord
+            ids = db.scalars(
+                insert(table).returning(table.id, sort_by_parameter_order=True),
+                rows,
+            ).all()
+            PrintService.enqueue_many(
+                db,
+                [
+                    {"scan_id": scan_id, "qr_content": row["qr_content"]}
+                    for scan_id, row in zip(ids, rows)
+                ],
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        for scan_id, row in zip(ids, rows):
+            recent_scans.add(
+                row["scan_source"],
+                row["qr_content"],
+                {**row, "id": scan_id, "printed_at": None},
+            )
+
+    def _write(self, rows: List[Dict]) -> Tuple[int, List[Dict]]:
+        """Insert rows; returns how many were written and the ones to retry
+
+        Rows are only kept for a retry when the database is unavailable;
+        rows it rejects are dropped.
+        """
+        try:
+            self._insert(rows)
+            return len(rows), []
+        except OperationalError:
+            raise
+        except Exception as e:
+            print(f"Relayed scans batch failed, writing one by one: {e}")
+
+        written = 0
+        for index, row in enumerate(rows):
+            try:
+                self._insert([row])
+                written += 1
+            except OperationalError as e:
+                print(f"Relayed scans write failed: {e}")
+                return written, rows[index:]
+            except Exception as e:
+                self.rejected += 1
+                print(f"Relayed scan {str(row['qr_content'])[:50]!r} dropped: {e}")
+        return written, []
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+        self._full.clear()
+        try:
+            written, retry = await asyncio.to_thread(self._write, rows)
+        except Exception as e:
+            print(f"Relayed scans write failed: {e}")
+            written, retry = 0, rows
+        if retry:
+            # Retry with the next flush, but don't grow without bound
+            self._buffer = (retry + self._buffer)[-self.batch_size * 10 :]
+        if recent_scans.enabled:
+            self._pending = {
+                (row["scan_source"], row["qr_content"]) for row in self._buffer
+            }
+        if written:
+            self.written += written
+            print_workers.notify()
+
+    async def flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+
+relayed_scans = RelayedScanWriter(
+    settings.SCAN_RELAY_PERSIST_BATCH, settings.SCAN_RELAY_PERSIST_INTERVAL
+)
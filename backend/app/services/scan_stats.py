@@ -0,0 +1,212 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, insert, text
+from sqlalchemy.engine import Connection
+
+from .. import models
+from ..config import settings
+from ..database import engine
+
+# Only one worker refreshes the rollup at a time
+ADVISORY_LOCK_ID = 0x5CA457A75
+
+# Ids are taken from the sequence before commit, and finished_at is set
+# before the print result commits: look back a little so rows that became
+# visible late still mark their day
+ID_OVERLAP = 1000
+FINISHED_OVERLAP = "5 minutes"
+
+NEW_SCAN_DAYS = text(
+    """
+    SELECT DISTINCT date_trunc('day', scanned_at)
+    FROM scan_records
+    WHERE id > :after AND id <= :upto
+    """
+)
+
+PRINTED_SCAN_DAYS = text(
+    f"""
+    SELECT DISTINCT date_trunc('day', s.scanned_at)
+    FROM print_jobs j
+    JOIN scan_records s ON s.id = j.scan_id
+    WHERE j.finished_at > coalesce(
+        CAST(:since AS timestamptz) - interval '{FINISHED_OVERLAP}', '-infinity'
+    )
+    """
+)
+
+# Every bucket of one day in a single pass over its scans: grouping set 1
+# is the hourly breakdown, 2 the hourly totals, 3 and 4 the same per day
+DAY_ROLLUP = text(
+    """
+    SELECT date_trunc('hour', scanned_at),
+           scan_source,
+           print_status,
+           GROUPING(date_trunc('hour', scanned_at)) = 1,
+           GROUPING(scan_source) = 1,
+           count(*),
+           count(DISTINCT qr_hash)
+    FROM scan_records
+    WHERE scanned_at >= :day AND scanned_at < :end
+    GROUP BY GROUPING SETS (
+        (date_trunc('hour', scanned_at), scan_source, print_status),
+        (date_trunc('hour', scanned_at)),
+        (scan_source, print_status),
+        ()
+    )
+    """
+)
+
+
+class ScanStatsRollup:
+    """Keeps scan_stats and scan_stats_totals up to date.
+
+    Every run finds the days that got new scans (ids past the last run) or
+    print results (print_jobs finished since the last run) and rebuilds
+    all buckets of those days from scan_records in one grouped query. The
+    cost of a run follows the volume of the changed days, usually just
+    today; the stats endpoint only reads the rollup. Days already archived
+    with their partition keep their figures.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.last_run: Optional[Dict] = None
+
+    def dirty_days(
+        self,
+        conn: Connection,
+        last_scan_id: int,
+        last_finished_at: Optional[datetime],
+        upto: int,
+    ) -> List[datetime]:
+        """Days with scans or print results the rollup hasn't seen yet"""
+        days = set(
+            conn.scalars(
+                NEW_SCAN_DAYS, {"after": last_scan_id - ID_OVERLAP, "upto": upto}
+            )
+        )
+        days.update(conn.scalars(PRINTED_SCAN_DAYS, {"since": last_finished_at}))
+        if settings.SCAN_RETENTION_MONTHS > 0:
+            # Scans of these days may be archived already; a late scan landing
+            # there must not replace the day's figures with its own
+            cutoff = conn.scalar(
+                text(
+                    "SELECT date_trunc('month', now()) "
+                    "- make_interval(months => :months)"
+                ),
+                {"months": settings.SCAN_RETENTION_MONTHS},
+            )
+            days = {day for day in days if day >= cutoff}
+        return sorted(days)
+
+    def refresh_day(self, conn: Connection, day: datetime):
+        """Replace every bucket of the day with figures from scan_records"""
+        end = conn.scalar(
+            text("SELECT CAST(:day AS timestamptz) + interval '1 day'"), {"day": day}
+        )
+        stats, totals = [], []
+        rows = conn.execute(DAY_ROLLUP, {"day": day, "end": end})
+        for hour, source, status, whole_day, all_sources, scans, codes in rows:
+            if whole_day:
+                bucket = {"period": "day", "bucket": day}
+            else:
+                bucket = {"period": "hour", "bucket": hour}
+            if all_sources:
+                totals.append({**bucket, "scans": scans, "unique_codes": codes})
+            else:
+                stats.append(
+                    {
+                        **bucket,
+                        "scan_source": source,
+                        "print_status": status,
+                        "scans": scans,
+                    }
+                )
+
+        for model, rows in ((models.ScanStat, stats), (models.ScanStatTotal, totals)):
+            conn.execute(delete(model).where(model.bucket >= day, model.bucket < end))
+            if rows:
+                conn.execute(insert(model), rows)
+
+    def run(self) -> Dict:
+        """Rebuild the days changed since the last run"""
+        result = {"days": [], "errors": []}
+        if engine.dialect.name != "postgresql":
+            return result
+        with engine.connect() as conn:
+            if not conn.scalar(
+                text("SELECT pg_try_advisory_lock(:id)"), {"id": ADVISORY_LOCK_ID}
+            ):
+                conn.rollback()
+                return result
+            try:
+                state = conn.execute(
+                    text(
+                        "SELECT last_scan_id, last_finished_at "
+                        "FROM scan_stats_state WHERE id = 1"
+                    )
+                ).first()
+                last_scan_id, last_finished_at = state or (0, None)
+                upto = conn.scalar(
+                    text("SELECT coalesce(max(id), 0) FROM scan_records")
+                )
+                finished = conn.scalar(text("SELECT max(finished_at) FROM print_jobs"))
+
+                days = self.dirty_days(conn, last_scan_id, last_finished_at, upto)
+                for day in days:
+                    try:
+                        self.refresh_day(conn, day)
+                        conn.commit()
+                        result["days"].append(day.date().isoformat())
+                    except Exception as e:
+                        conn.rollback()
+                        result["errors"].append(f"{day.date()}: {e}")
+
+                if not result["errors"]:
+                    conn.execute(
+                        text(
+                            """
+                            INSERT INTO scan_stats_state
+                                (id, last_scan_id, last_finished_at, refreshed_at)
+                            VALUES (1, :upto, :finished, now())
+                            ON CONFLICT (id) DO UPDATE SET
+                                last_scan_id = EXCLUDED.last_scan_id,
+                                last_finished_at = coalesce(
+                                    EXCLUDED.last_finished_at,
+                                    scan_stats_state.last_finished_at
+                                ),
+                                refreshed_at = EXCLUDED.refreshed_at
+                            """
+                        ),
+                        {"upto": upto, "finished": finished},
+                    )
+                    conn.commit()
+            finally:
+                conn.rollback()
+                conn.execute(
+                    text("SELECT pg_advisory_unlock(:id)"), {"id": ADVISORY_LOCK_ID}
+                )
+                conn.commit()
+        for error in result["errors"]:
+            print(f"Scan stats refresh failed: {error}")
+        self.last_run = {**result, "finished_at": datetime.now().isoformat()}
+        return result
+
+    async def refresh_loop(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.run)
+            except Exception as e:
+                print(f"Scan stats refresh failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+scan_stats = ScanStatsRollup(settings.SCAN_STATS_REFRESH_INTERVAL)
+
+
+if __name__ == "__main__":
+    # python -m app.services.scan_stats: one refresh, e.g. after a restore
+    print(scan_stats.run())
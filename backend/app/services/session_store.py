@@ -0,0 +1,291 @@
+import asyncio
+import json
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional
+
+from ..config import settings
+
+# Delivers a relayed message to a locally connected device; True if sent
+RelayHandler = Callable[[str, str, Dict], Awaitable[bool]]
+
+
+class SessionStore:
+    """Presence state of remote-scanner sessions, in this process only.
+
+    Holds one dict of fields per session (host_connected, client_connected,
+    last_activity, ...). Values must be JSON-serializable so that shared
+    backends can replicate them. relay() hands a message to the device on
+    the other end of a session, wherever it is connected.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, Dict] = {}
+        self._handler: Optional[RelayHandler] = None
+
+    async def start(self, handler: RelayHandler):
+        self._handler = handler
+
+    async def stop(self):
+        self._handler = None
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        session = self._sessions.get(session_id)
+        return dict(session) if session is not None else None
+
+    def all(self) -> Dict[str, Dict]:
+        return {session_id: dict(data) for session_id, data in self._sessions.items()}
+
+    def _apply(self, session_id: str, fields: Optional[Dict]):
+        if fields is None:
+            self._sessions.pop(session_id, None)
+        else:
+            self._sessions.setdefault(session_id, {}).update(fields)
+
+    async def update(self, session_id: str, **fields):
+        """Merge fields into the session, creating it if needed"""
+        fields.setdefault("last_activity", time.time())
+        self._apply(session_id, fields)
+
+    async def remove(self, session_id: str):
+        self._apply(session_id, None)
+
+    def prune(self, max_idle_seconds: float, keep) -> int:
+        """Drop this replica's entries idle for longer than max_idle_seconds.
+
+        Sessions in keep (e.g. with a socket on this worker) are never
+        dropped. Every worker prunes its own replica, nothing is broadcast.
+        """
+        cutoff = time.time() - max_idle_seconds
+        stale = [
+            session_id
+            for session_id, data in self._sessions.items()
+            if session_id not in keep and data.get("last_activity", 0) < cutoff
+        ]
+        for session_id in stale:
+            del self._sessions[session_id]
+        return len(stale)
+
+    async def _deliver(self, session_id: str, device_type: str, message: Dict) -> bool:
+        if self._handler is None:
+            return False
+        return await self._handler(session_id, device_type, message)
+
+    async def relay(self, session_id: str, device_type: str, message: Dict) -> bool:
+        """Send message to the session's device_type connection"""
+        return await self._deliver(session_id, device_type, message)
+
+
+class PostgresSessionStore(SessionStore):
+    """Session store shared by all workers through Postgres LISTEN/NOTIFY.
+
+    Every worker keeps a full replica of the presence dict; updates are
+    applied locally and broadcast on the channel, and other workers apply
+    them when the notification arrives. A relay that can't be delivered to
+    a local socket is broadcast too, and the worker holding the target
+    connection sends it. The listening connection is a dedicated one
+    outside the SQLAlchemy pool, read from the event loop with add_reader.
+
+    Once listening (at start and after a reconnect) the replica is seeded
+    with the active sessions in remote_sessions, so a worker that starts
+    after sessions exist knows them before the next update arrives.
+    """
+
+    # Postgres rejects NOTIFY payloads of 8000 bytes or more
+    MAX_PAYLOAD = 7900
+
+    def __init__(self, dsn: str, channel: str):
+        super().__init__()
+        self.dsn = dsn
+        self.channel = channel
+        self.worker_id = uuid.uuid4().hex
+        self._listener = None
+        self._publisher = None
+        self._publish_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+
+    def _connect(self):
+        import psycopg2
+        import psycopg2.extensions
+
+        conn = psycopg2.connect(self.dsn)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return conn
+
+    async def start(self, handler: RelayHandler):
+        await super().start(handler)
+        self._loop = asyncio.get_running_loop()
+        await self._listen()
+
+    async def _listen(self):
+        conn = await asyncio.to_thread(self._connect)
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+        self._listener = conn
+        self._loop.add_reader(conn.fileno(), self._on_readable)
+        await self._load_snapshot()
+
+    def _snapshot(self) -> Dict[str, Dict]:
+        """Active sessions as last written to remote_sessions"""
+        conn = self._connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT session_id, host_connected, client_connected, created_at "
+                    "FROM remote_sessions WHERE is_active AND expires_at > now()"
+                )
+                rows = cursor.fetchall()
+        finally:
+            conn.close()
+        now = time.time()
+        return {
+            session_id: {
+                "host_connected": host_connected,
+                "client_connected": client_connected,
+                "created_at": created_at.astimezone().replace(tzinfo=None).isoformat(),
+                "last_activity": now,
+            }
+            for session_id, host_connected, client_connected, created_at in rows
+        }
+
+    async def _load_snapshot(self):
+        try:
+            snapshot = await asyncio.to_thread(self._snapshot)
+        except Exception as e:
+            print(f"Session store snapshot failed: {e}")
+            return
+        # Listening started first: a notification applied meanwhile is newer
+        # than the table, which lags by the remote_sessions flush interval
+        for session_id, fields in snapshot.items():
+            self._sessions.setdefault(session_id, fields)
+
+    async def _reconnect(self):
+        delay = 1
+        while self._handler is not None:
+            try:
+                await self._listen()
+                print(f"Session store reconnected to channel {self.channel}")
+                return
+            except Exception as e:
+                print(f"Session store reconnect failed: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    def _drop_listener(self):
+        if self._listener is None:
+            return
+        try:
+            self._loop.remove_reader(self._listener.fileno())
+        except (ValueError, OSError):
+            pass
+        try:
+            self._listener.close()
+        except Exception:
+            pass
+        self._listener = None
+
+    async def stop(self):
+        await super().stop()
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        self._drop_listener()
+        with self._publish_lock:
+            if self._publisher is not None:
+                self._publisher.close()
+                self._publisher = None
+
+    def _on_readable(self):
+        conn = self._listener
+        if conn is None:
+            return
+        try:
+            conn.poll()
+        except Exception as e:
+            print(f"Session store listener lost: {e}")
+            self._drop_listener()
+            self._reconnect_task = self._loop.create_task(self._reconnect())
+            return
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            try:
+                event = json.loads(notify.payload)
+            except ValueError:
+                continue
+            if event.get("origin") == self.worker_id:
+                continue
+            if event["op"] == "update":
+                self._apply(event["session_id"], event["fields"])
+            elif event["op"] == "relay":
+                self._loop.create_task(
+                    self._deliver(
+                        event["session_id"], event["device_type"], event["message"]
+                    )
+                )
+
+    def _notify(self, payload: str):
+        with self._publish_lock:
+            for attempt in range(2):
+                if self._publisher is None or self._publisher.closed:
+                    self._publisher = self._connect()
+                try:
+                    with self._publisher.cursor() as cursor:
+                        cursor.execute(
+                            "SELECT pg_notify(%s, %s)", (self.channel, payload)
+                        )
+                    return
+                except Exception:
+                    self._publisher.close()
+                    self._publisher = None
+                    if attempt:
+                        raise
+
+    async def _publish(self, event: Dict) -> bool:
+        payload = json.dumps({**event, "origin": self.worker_id}, default=str)
+        if len(payload.encode()) > self.MAX_PAYLOAD:
+            print(f"Session store: {event['op']} event too large to publish")
+            return False
+        try:
+            await asyncio.to_thread(self._notify, payload)
+            return True
+        except Exception as e:
+            print(f"Session store publish failed: {e}")
+            return False
+
+    async def update(self, session_id: str, **fields):
+        fields.setdefault("last_activity", time.time())
+        await super().update(session_id, **fields)
+        await self._publish(
+            {"op": "update", "session_id": session_id, "fields": fields}
+        )
+
+    async def remove(self, session_id: str):
+        await super().remove(session_id)
+        await self._publish({"op": "update", "session_id": session_id, "fields": None})
+
+    async def relay(self, session_id: str, device_type: str, message: Dict) -> bool:
+        if await self._deliver(session_id, device_type, message):
+            return True
+        return await self._publish(
+            {
+                "op": "relay",
+                "session_id": session_id,
+                "device_type": device_type,
+                "message": message,
+            }
+        )
+
+
+def create_session_store() -> SessionStore:
+    if settings.SESSION_STORE == "postgres":
+        from sqlalchemy.engine import make_url
+
+        url = make_url(settings.DATABASE_URL).set(drivername="postgresql")
+        return PostgresSessionStore(
+            url.render_as_string(hide_password=False), settings.SESSION_STORE_CHANNEL
+        )
+    return SessionStore()
+
+
+session_store = create_session_store()
@@ -0,0 +1,53 @@
+from alembic import context
+from sqlalchemy import create_engine, pool
+
+from app.config import settings
+from app.database import Base
+from app import models  # noqa: F401  (registers the tables on Base.metadata)
+
+target_metadata = Base.metadata
+
+LEFT_ALONE = ("table", "column", "index", "foreign_key_constraint")
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    # Leftovers of the old init script (users, scan_records.user_id, its
+    # index and foreign key) are not mapped; leave them alone instead of
+    # proposing to drop them
+    if reflected and compare_to is None and type_ in LEFT_ALONE:
+        return False
+    return True
+
+
+def run_migrations_offline():
+    context.configure(
+        url=settings.DATABASE_URL,
+        target_metadata=target_metadata,
+        include_object=include_object,
+        literal_binds=True,
+        transaction_per_migration=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    engine = create_engine(settings.DATABASE_URL, poolclass=pool.NullPool)
+    with engine.connect() as connection:
+        # One transaction per revision, so autocommit_block() (used for
+        # CREATE INDEX CONCURRENTLY) only commits that revision's own work
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_object=include_object,
+            transaction_per_migration=True,
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+    engine.dispose()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,65 @@
+"""Online index changes for migrations.
+
+CREATE/DROP INDEX CONCURRENTLY can't run inside a transaction, so these
+run in an autocommit block: writes to the table keep going while the
+index is built. An interrupted concurrent build leaves an INVALID index
+behind, which is dropped and rebuilt on the next run.
+"""
+from alembic import op
+from sqlalchemy import text
+
+
+def _invalid(name: str) -> bool:
+    if op.get_context().as_sql:
+        # Offline (--sql) mode, nothing to inspect
+        return False
+    return bool(
+        op.get_bind().scalar(
+            text(
+                "SELECT NOT indisvalid FROM pg_index "
+                "WHERE indexrelid = to_regclass(:name)"
+            ),
+            {"name": name},
+        )
+    )
+
+
+def create_index_concurrently(name: str, table: str, definition: str, unique=False):
+    """CREATE [UNIQUE] INDEX CONCURRENTLY name ON table definition"""
+    with op.get_context().autocommit_block():
+        if _invalid(name):
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        op.execute(
+            f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY IF NOT EXISTS "
+            f"{name} ON {table} {definition}"
+        )
+
+
+def drop_index_concurrently(name: str):
+    with op.get_context().autocommit_block():
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+def create_partitioned_index(name: str, table: str, definition: str):
+    """Index a partitioned table without blocking writes.
+
+    CREATE INDEX CONCURRENTLY doesn't work on a partitioned table, so the
+    parent index is created ON ONLY the parent (invalid and empty), every
+    partition is indexed concurrently and attached to it; the parent index
+    turns valid once all partitions are attached. Partitions created later
+    get the index automatically.
+    """
+    op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY {table} {definition}")
+    partitions = op.get_bind().scalars(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = CAST(:table AS regclass)"
+        ),
+        {"table": table},
+    ).all()
+    suffix = name.removeprefix(f"idx_{table}_")
+    for partition in partitions:
+        partition_index = f"{partition}_{suffix}"
+        create_index_concurrently(partition_index, partition, definition)
+        op.execute(f"ALTER INDEX {name} ATTACH PARTITION {partition_index}")
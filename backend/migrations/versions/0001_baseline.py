@@ -0,0 +1,162 @@
+"""Baseline schema
+
+Brings any existing database to the tables and columns of models.py:
+an empty one, one created by the old init_postgres.sql (no photo_scans,
+remote_sessions or print_jobs; a printed_at trigger) or one created by
+Base.metadata.create_all at startup (no printed_at/idempotency_key on
+scan_records if it predates them). Every statement is idempotent.
+Columns the old init script left nullable are made NOT NULL through a
+validated CHECK constraint, so writes aren't blocked while the table is
+checked. Indexes are built in the next revision, concurrently.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Nullable in tables made by init_postgres.sql: column -> value for NULLs
+NOT_NULL = {
+    "scan_records": {
+        "scan_source": "'scanner'",
+        "scanned_at": "now()",
+        "print_status": "'pending'",
+    },
+    "printers": {"is_default": "FALSE", "is_active": "TRUE", "created_at": "now()"},
+}
+
+
+def _nullable(table: str, column: str) -> bool:
+    return (
+        op.get_bind().scalar(
+            text(
+                "SELECT is_nullable FROM information_schema.columns "
+                "WHERE table_schema = current_schema() "
+                "AND table_name = :table AND column_name = :column"
+            ),
+            {"table": table, "column": column},
+        )
+        == "YES"
+    )
+
+
+def _set_not_null(table: str, column: str, fill: str):
+    # SET NOT NULL alone scans the table holding an ACCESS EXCLUSIVE lock;
+    # with a validated CHECK it skips the scan, and VALIDATE doesn't block
+    # writes. Each statement commits on its own.
+    check = f"{table}_{column}_not_null"
+    with op.get_context().autocommit_block():
+        op.execute(f"UPDATE {table} SET {column} = {fill} WHERE {column} IS NULL")
+        op.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {check} "
+            f"CHECK ({column} IS NOT NULL) NOT VALID"
+        )
+        op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {check}")
+        op.execute(f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL")
+        op.execute(f"ALTER TABLE {table} DROP CONSTRAINT {check}")
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS scan_records (
+            id SERIAL PRIMARY KEY,
+            qr_content TEXT NOT NULL,
+            scan_source VARCHAR(50) NOT NULL DEFAULT 'scanner',
+            scanned_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            print_status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            printed_at TIMESTAMP WITH TIME ZONE,
+            idempotency_key VARCHAR(100)
+        )
+        """
+    )
+    # Adding a nullable column without a default doesn't rewrite the table
+    op.execute(
+        """
+        ALTER TABLE scan_records
+            ADD COLUMN IF NOT EXISTS printed_at TIMESTAMP WITH TIME ZONE,
+            ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(100)
+        """
+    )
+    # printed_at is set by the print workers now
+    op.execute("DROP TRIGGER IF EXISTS trigger_update_printed_at ON scan_records")
+    op.execute("DROP FUNCTION IF EXISTS update_printed_at()")
+
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS printers (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(100) NOT NULL UNIQUE,
+            connection_type VARCHAR(50) NOT NULL,
+            ip_address VARCHAR(45),
+            port INTEGER,
+            is_default BOOLEAN NOT NULL DEFAULT FALSE,
+            is_active BOOLEAN NOT NULL DEFAULT TRUE,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+        )
+        """
+    )
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS remote_sessions (
+            id SERIAL PRIMARY KEY,
+            session_id VARCHAR(6) NOT NULL,
+            host_connected BOOLEAN NOT NULL DEFAULT FALSE,
+            client_connected BOOLEAN NOT NULL DEFAULT FALSE,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+                DEFAULT now() + INTERVAL '1 hour',
+            is_active BOOLEAN NOT NULL DEFAULT TRUE
+        )
+        """
+    )
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS photo_scans (
+            id SERIAL PRIMARY KEY,
+            filename VARCHAR(255) NOT NULL,
+            file_path VARCHAR(500) NOT NULL,
+            qr_content TEXT,
+            session_id VARCHAR(6),
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            processed_at TIMESTAMP WITH TIME ZONE,
+            is_processed BOOLEAN NOT NULL DEFAULT FALSE
+        )
+        """
+    )
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS print_jobs (
+            id SERIAL PRIMARY KEY,
+            scan_id INTEGER REFERENCES scan_records(id) ON DELETE CASCADE,
+            printer_id INTEGER REFERENCES printers(id) ON DELETE SET NULL,
+            qr_content TEXT NOT NULL,
+            label_size VARCHAR(20) NOT NULL DEFAULT '50x30',
+            copies INTEGER NOT NULL DEFAULT 1,
+            status VARCHAR(20) NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            next_attempt_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            claimed_at TIMESTAMP WITH TIME ZONE,
+            finished_at TIMESTAMP WITH TIME ZONE
+        )
+        """
+    )
+
+    if not op.get_context().as_sql:
+        for table, columns in NOT_NULL.items():
+            for column, fill in columns.items():
+                if _nullable(table, column):
+                    _set_not_null(table, column, fill)
+
+
+def downgrade() -> None:
+    # The baseline adopts existing data; it is never torn down
+    pass
@@ -0,0 +1,121 @@
+"""Indexes for the hot queries, built concurrently
+
+Every index is created with CREATE INDEX CONCURRENTLY, so upgrading a
+live database doesn't block scans from being written. Indexes the old
+init script created that are covered by a composite index here, and the
+ix_*_id duplicates of the primary keys, are dropped the same way.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from migrations.helpers import create_index_concurrently, drop_index_concurrently
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+# name, table, definition, unique
+INDEXES = [
+    (
+        "scan_records_idempotency_key_key",
+        "scan_records",
+        "(idempotency_key)",
+        True,
+    ),
+    ("ix_remote_sessions_session_id", "remote_sessions", "(session_id)", True),
+    # History by time, and filtered by source / print status (keyset order)
+    ("idx_scan_records_scanned_at_id", "scan_records", "(scanned_at, id)", False),
+    (
+        "idx_scan_records_source_scanned_at",
+        "scan_records",
+        "(scan_source, scanned_at, id)",
+        False,
+    ),
+    (
+        "idx_scan_records_status_scanned_at",
+        "scan_records",
+        "(print_status, scanned_at, id)",
+        False,
+    ),
+    # Scans whose label hasn't printed yet: a small slice of the table
+    (
+        "idx_scan_records_unprinted",
+        "scan_records",
+        "(scanned_at, id) WHERE print_status <> 'success'",
+        False,
+    ),
+    (
+        "idx_scan_records_qr_content_prefix",
+        "scan_records",
+        "(qr_content text_pattern_ops)",
+        False,
+    ),
+    # Active sessions: listing and the expiry sweep
+    (
+        "idx_remote_sessions_active_expires_at",
+        "remote_sessions",
+        "(expires_at) WHERE is_active",
+        False,
+    ),
+    ("idx_photo_scans_created_at_id", "photo_scans", "(created_at, id)", False),
+    (
+        "idx_photo_scans_session_created_at",
+        "photo_scans",
+        "(session_id, created_at, id)",
+        False,
+    ),
+    (
+        "idx_photo_scans_unprocessed",
+        "photo_scans",
+        "(created_at, id) WHERE NOT is_processed",
+        False,
+    ),
+    # Print queue: workers only look at unfinished jobs
+    (
+        "idx_print_jobs_pending",
+        "print_jobs",
+        "(status, next_attempt_at) WHERE status IN ('queued', 'printing')",
+        False,
+    ),
+    # ON DELETE CASCADE from scan_records looks jobs up by scan_id
+    ("idx_print_jobs_scan_id", "print_jobs", "(scan_id)", False),
+]
+
+REDUNDANT = [
+    "idx_scan_records_scanned_at",
+    "idx_scan_records_print_status",
+    "idx_printers_name",
+    "idx_printers_connection_type",
+    "idx_printers_is_default",
+    "idx_printers_is_active",
+    "ix_scan_records_id",
+    "ix_printers_id",
+    "ix_remote_sessions_id",
+    "ix_photo_scans_id",
+    "ix_print_jobs_id",
+]
+
+
+def upgrade() -> None:
+    for name, table, definition, unique in INDEXES:
+        create_index_concurrently(name, table, definition, unique=unique)
+    for name in REDUNDANT:
+        drop_index_concurrently(name)
+
+
+def downgrade() -> None:
+    for name in (
+        "idx_scan_records_unprinted",
+        "idx_photo_scans_session_created_at",
+        "idx_photo_scans_unprocessed",
+        "idx_print_jobs_scan_id",
+    ):
+        drop_index_concurrently(name)
+    create_index_concurrently(
+        "idx_scan_records_scanned_at", "scan_records", "(scanned_at)"
+    )
+    create_index_concurrently(
+        "idx_scan_records_print_status", "scan_records", "(print_status)"
+    )
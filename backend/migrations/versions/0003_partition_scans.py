@@ -0,0 +1,239 @@
+"""Monthly range partitioning of scan_records and photo_scans
+
+scan_records is partitioned on scanned_at and photo_scans on created_at.
+The existing table isn't copied: it is renamed to <table>_legacy and
+attached as the partition covering everything up to the end of the
+current month. A validated CHECK constraint lets ATTACH skip its scan,
+and the (id, key) unique index the partitioned primary key needs is built
+concurrently beforehand. Partitions for the coming months and a DEFAULT
+partition for out-of-range timestamps are created. After that,
+app/services/partitions.py keeps partitions ahead and archives old ones.
+
+A partitioned table can't have a unique constraint without the partition
+key, and can't be the target of a foreign key. So:
+- idempotency keys move to scan_idempotency_keys (key -> scan id and
+  scanned_at, so the lookup is pruned to one partition);
+- the print_jobs.scan_id foreign key is dropped. Archiving a partition
+  deletes the print jobs of its scans instead.
+
+The old init script's scan_records.user_id is dropped; a partition can't
+have columns its parent doesn't.
+
+Downgrading copies every partition into a plain table with INSERT ...
+SELECT, under an exclusive lock on the old one: stop writers and expect
+it to take as long as a full table copy. Scans already archived (and
+their print jobs) are not brought back, nor is user_id.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+from sqlalchemy import text
+
+from migrations.helpers import create_index_concurrently
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+
+TABLES = {
+    "scan_records": {
+        "key": "scanned_at",
+        "columns": """
+            id INTEGER NOT NULL DEFAULT nextval('scan_records_id_seq'),
+            qr_content TEXT NOT NULL,
+            scan_source VARCHAR(50) NOT NULL DEFAULT 'scanner',
+            scanned_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            print_status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            printed_at TIMESTAMP WITH TIME ZONE,
+            idempotency_key VARCHAR(100)
+        """,
+        "indexes": {
+            "idx_scan_records_scanned_at_id": "(scanned_at, id)",
+            "idx_scan_records_source_scanned_at": "(scan_source, scanned_at, id)",
+            "idx_scan_records_status_scanned_at": "(print_status, scanned_at, id)",
+            "idx_scan_records_unprinted": (
+                "(scanned_at, id) WHERE print_status <> 'success'"
+            ),
+            "idx_scan_records_qr_content_prefix": "(qr_content text_pattern_ops)",
+        },
+    },
+    "photo_scans": {
+        "key": "created_at",
+        "columns": """
+            id INTEGER NOT NULL DEFAULT nextval('photo_scans_id_seq'),
+            filename VARCHAR(255) NOT NULL,
+            file_path VARCHAR(500) NOT NULL,
+            qr_content TEXT,
+            session_id VARCHAR(6),
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            processed_at TIMESTAMP WITH TIME ZONE,
+            is_processed BOOLEAN NOT NULL DEFAULT FALSE
+        """,
+        "indexes": {
+            "idx_photo_scans_created_at_id": "(created_at, id)",
+            "idx_photo_scans_session_created_at": "(session_id, created_at, id)",
+            "idx_photo_scans_unprocessed": "(created_at, id) WHERE NOT is_processed",
+        },
+    },
+}
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _prepare(table: str, key: str) -> str:
+    """Get the table ready to be attached without a scan; returns the bound"""
+    create_index_concurrently(f"{table}_id_{key}", table, f"(id, {key})", unique=True)
+
+    bound = op.get_bind().scalar(
+        text(
+            f"SELECT (date_trunc('month', greatest(now(), max({key}))) "
+            f"+ interval '1 month')::text FROM {table}"
+        )
+    )
+    check = f"{table}_legacy_bound"
+    with op.get_context().autocommit_block():
+        op.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {check}")
+        op.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {check} "
+            f"CHECK ({key} < {_literal(bound)}) NOT VALID"
+        )
+        # Doesn't block writes, unlike the scan ATTACH would do
+        op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {check}")
+    return bound
+
+
+def _partition(table: str, spec: dict, bound: str):
+    key = spec["key"]
+    legacy = f"{table}_legacy"
+
+    op.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+    # Swap the primary key for the (id, key) index built in _prepare, which
+    # ATTACH then adopts for the parent's primary key
+    op.execute(f"ALTER TABLE {legacy} DROP CONSTRAINT {table}_pkey")
+    op.execute(
+        f"ALTER TABLE {legacy} ADD CONSTRAINT {legacy}_pkey "
+        f"PRIMARY KEY USING INDEX {table}_id_{key}"
+    )
+    for name in spec["indexes"]:
+        op.execute(f"ALTER INDEX IF EXISTS {name} RENAME TO {name}_legacy")
+
+    op.execute(
+        f"CREATE TABLE {table} ({spec['columns']}, PRIMARY KEY (id, {key})) "
+        f"PARTITION BY RANGE ({key})"
+    )
+    # Dropping the legacy partition must not take the id sequence with it
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+    # No partitions yet: these are catalog entries only. ATTACH adopts the
+    # matching indexes of the legacy table instead of building new ones.
+    for name, definition in spec["indexes"].items():
+        op.execute(f"CREATE INDEX {name} ON {table} {definition}")
+
+    op.execute(
+        f"ALTER TABLE {table} ATTACH PARTITION {legacy} "
+        f"FOR VALUES FROM (MINVALUE) TO ({_literal(bound)})"
+    )
+    op.execute(f"ALTER TABLE {legacy} DROP CONSTRAINT {table}_legacy_bound")
+    op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+    months = op.get_bind().execute(
+        text(
+            "SELECT to_char(m, '\"y\"YYYY\"m\"MM'), m::text, "
+            "(m + interval '1 month')::text "
+            "FROM generate_series(CAST(:bound AS timestamptz), "
+            "CAST(:bound AS timestamptz) + make_interval(months => :ahead - 1), "
+            "interval '1 month') AS m"
+        ),
+        {"bound": bound, "ahead": MONTHS_AHEAD},
+    ).all()
+    for suffix, lower, upper in months:
+        op.execute(
+            f"CREATE TABLE {table}_{suffix} PARTITION OF {table} "
+            f"FOR VALUES FROM ({_literal(lower)}) TO ({_literal(upper)})"
+        )
+
+
+def upgrade() -> None:
+    if op.get_context().as_sql:
+        raise RuntimeError("0003 inspects the data and can't run in --sql mode")
+
+    bounds = {table: _prepare(table, spec["key"]) for table, spec in TABLES.items()}
+
+    op.execute(
+        "ALTER TABLE print_jobs DROP CONSTRAINT IF EXISTS print_jobs_scan_id_fkey"
+    )
+    op.execute("ALTER TABLE scan_records DROP COLUMN IF EXISTS user_id")
+    for table, spec in TABLES.items():
+        _partition(table, spec, bounds[table])
+
+    op.execute(
+        """
+        CREATE TABLE scan_idempotency_keys (
+            idempotency_key VARCHAR(100) PRIMARY KEY,
+            scan_id INTEGER NOT NULL,
+            scanned_at TIMESTAMP WITH TIME ZONE NOT NULL
+        )
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO scan_idempotency_keys (idempotency_key, scan_id, scanned_at)
+        SELECT idempotency_key, id, scanned_at
+        FROM scan_records
+        WHERE idempotency_key IS NOT NULL
+        ON CONFLICT DO NOTHING
+        """
+    )
+
+
+def _unpartition(table: str, spec: dict):
+    plain = f"{table}_unpartitioned"
+    columns = ", ".join(
+        line.split()[0] for line in spec["columns"].strip().splitlines()
+    )
+
+    op.execute(f"LOCK TABLE {table} IN EXCLUSIVE MODE")
+    op.execute(f"CREATE TABLE {plain} ({spec['columns']})")
+    op.execute(f"INSERT INTO {plain} ({columns}) SELECT {columns} FROM {table}")
+    # Dropping the partitioned table must not take the id sequence with it
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+    op.execute(f"DROP TABLE {table}")
+    op.execute(f"ALTER TABLE {plain} RENAME TO {table}")
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+    op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id)")
+    for name, definition in spec["indexes"].items():
+        op.execute(f"CREATE INDEX {name} ON {table} {definition}")
+
+
+def downgrade() -> None:
+    if op.get_context().as_sql:
+        raise RuntimeError("0003 downgrade copies data and can't run in --sql mode")
+
+    for table, spec in TABLES.items():
+        _unpartition(table, spec)
+
+    # Revision 0002's unique key; scan_idempotency_keys kept keys unique
+    op.execute(
+        "CREATE UNIQUE INDEX scan_records_idempotency_key_key "
+        "ON scan_records (idempotency_key)"
+    )
+    op.execute("DROP TABLE scan_idempotency_keys")
+
+    # Jobs of scans archived meanwhile point nowhere
+    op.execute(
+        """
+        UPDATE print_jobs SET scan_id = NULL
+        WHERE scan_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM scan_records s WHERE s.id = print_jobs.scan_id)
+        """
+    )
+    op.execute(
+        "ALTER TABLE print_jobs ADD CONSTRAINT print_jobs_scan_id_fkey "
+        "FOREIGN KEY (scan_id) REFERENCES scan_records(id) ON DELETE CASCADE"
+    )
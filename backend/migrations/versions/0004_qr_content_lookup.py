@@ -0,0 +1,88 @@
+"""Hash and trigram lookup of scans by code
+
+The btree on the full qr_content text the old init script created was as
+large as the column itself and useless for "contains" searches. It is
+replaced by:
+- qr_hash, the first 8 bytes of SHA-256 of the code (see
+  models.qr_content_hash), with an index on (qr_hash, scanned_at, id) for
+  exact lookups and the history of one code;
+- a pg_trgm GIN index on qr_content for substring and prefix search, which
+  also makes the text_pattern_ops prefix index redundant.
+
+The column is added without a default (no table rewrite) and backfilled in
+batches that commit on their own, so writes keep going. Indexes are built
+concurrently on each partition and attached to the parent's.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+from sqlalchemy import text
+
+from migrations.helpers import create_partitioned_index, drop_index_concurrently
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10000
+
+# Same value as models.qr_content_hash
+QR_HASH_SQL = (
+    "('x' || left(encode(sha256(convert_to(qr_content, 'UTF8')), 'hex'), 16))"
+    "::bit(64)::bigint"
+)
+
+
+def _backfill():
+    bind = op.get_bind()
+    last_id = bind.scalar(text("SELECT coalesce(max(id), 0) FROM scan_records"))
+    with op.get_context().autocommit_block():
+        for start in range(0, last_id, BATCH_SIZE):
+            op.execute(
+                f"UPDATE scan_records SET qr_hash = {QR_HASH_SQL} "
+                f"WHERE id > {start} AND id <= {start + BATCH_SIZE} "
+                "AND qr_hash IS NULL"
+            )
+
+
+def upgrade() -> None:
+    if op.get_context().as_sql:
+        raise RuntimeError("0004 backfills in batches and can't run in --sql mode")
+
+    op.execute("ALTER TABLE scan_records ADD COLUMN IF NOT EXISTS qr_hash BIGINT")
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    _backfill()
+
+    create_partitioned_index(
+        "idx_scan_records_qr_hash", "scan_records", "(qr_hash, scanned_at, id)"
+    )
+    # Rows written by instances still running the previous release while the
+    # backfill ran; cheap now that NULLs are found through the index
+    with op.get_context().autocommit_block():
+        op.execute(
+            f"UPDATE scan_records SET qr_hash = {QR_HASH_SQL} WHERE qr_hash IS NULL"
+        )
+    create_partitioned_index(
+        "idx_scan_records_qr_content_trgm",
+        "scan_records",
+        "USING gin (qr_content gin_trgm_ops)",
+    )
+
+    # Only on the legacy partition, left over from the init script
+    drop_index_concurrently("idx_scan_records_qr_content")
+    # Partitioned index: DROP INDEX CONCURRENTLY isn't supported on those
+    op.execute("DROP INDEX IF EXISTS idx_scan_records_qr_content_prefix")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS idx_scan_records_qr_content_trgm")
+    op.execute("DROP INDEX IF EXISTS idx_scan_records_qr_hash")
+    create_partitioned_index(
+        "idx_scan_records_qr_content_prefix",
+        "scan_records",
+        "(qr_content text_pattern_ops)",
+    )
+    op.execute("ALTER TABLE scan_records DROP COLUMN IF EXISTS qr_hash")
@@ -0,0 +1,67 @@
+"""Rollup tables for scan statistics
+
+scan_stats holds scans per hour and per day by scan_source and
+print_status, scan_stats_totals the per bucket totals and distinct codes,
+scan_stats_state how far app/services/scan_stats.py has read. The tables
+start empty; the first refresh aggregates the existing history once.
+print_jobs gets an index on finished_at so each refresh finds the print
+results since the previous one.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+from migrations.helpers import create_index_concurrently, drop_index_concurrently
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS scan_stats (
+            period VARCHAR(4) NOT NULL,
+            bucket TIMESTAMP WITH TIME ZONE NOT NULL,
+            scan_source VARCHAR(50) NOT NULL,
+            print_status VARCHAR(20) NOT NULL,
+            scans INTEGER NOT NULL,
+            PRIMARY KEY (period, bucket, scan_source, print_status)
+        )
+        """
+    )
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS scan_stats_totals (
+            period VARCHAR(4) NOT NULL,
+            bucket TIMESTAMP WITH TIME ZONE NOT NULL,
+            scans INTEGER NOT NULL,
+            unique_codes INTEGER NOT NULL,
+            PRIMARY KEY (period, bucket)
+        )
+        """
+    )
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS scan_stats_state (
+            id INTEGER PRIMARY KEY,
+            last_scan_id INTEGER NOT NULL DEFAULT 0,
+            last_finished_at TIMESTAMP WITH TIME ZONE,
+            refreshed_at TIMESTAMP WITH TIME ZONE
+        )
+        """
+    )
+    create_index_concurrently(
+        "idx_print_jobs_finished_at", "print_jobs", "(finished_at)"
+    )
+
+
+def downgrade() -> None:
+    drop_index_concurrently("idx_print_jobs_finished_at")
+    op.execute("DROP TABLE IF EXISTS scan_stats_state")
+    op.execute("DROP TABLE IF EXISTS scan_stats_totals")
+    op.execute("DROP TABLE IF EXISTS scan_stats")
@@ -0,0 +1,48 @@
+"""Export jobs table
+
+Background exports were tracked in a dict of the process that took the
+request, so with several uvicorn workers status and download requests
+landing on another worker got 404, and the running-jobs cap applied per
+worker. Jobs now live in export_jobs; see app/services/export_jobs.py.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS export_jobs (
+            id VARCHAR(32) PRIMARY KEY,
+            format VARCHAR(10) NOT NULL,
+            start_date TIMESTAMP WITH TIME ZONE,
+            end_date TIMESTAMP WITH TIME ZONE,
+            status VARCHAR(20) NOT NULL,
+            error TEXT,
+            rows_processed INTEGER NOT NULL,
+            total_rows INTEGER,
+            file_path VARCHAR(500),
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            started_at TIMESTAMP WITH TIME ZONE,
+            updated_at TIMESTAMP WITH TIME ZONE,
+            finished_at TIMESTAMP WITH TIME ZONE
+        )
+        """
+    )
+    # New and small: a plain index doesn't block anything
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_export_jobs_status_created_at "
+        "ON export_jobs (status, created_at)"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS export_jobs")
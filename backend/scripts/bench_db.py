@@ -0,0 +1,137 @@
+"""Requests/sec of the database-backed endpoints under concurrent clients.
+
+Runs N clients in a closed loop against a running server for a fixed time
+and reports throughput and latency per endpoint. To compare the sync
+(psycopg2) and async (asyncpg) database layers, start both builds against
+the same database and pass both URLs:
+
+    pip install httpx
+    python scripts/bench_db.py --url before=http://localhost:8001 \\
+        --url after=http://localhost:8000 --clients 50 --duration 20
+
+Endpoints written to (POST /api/scans/) create real rows and print jobs;
+point the benchmark at a throwaway database.
+"""
+import argparse
+import asyncio
+import itertools
+import statistics
+import time
+import uuid
+
+import httpx
+
+ENDPOINTS = {
+    "create-scan": ("POST", "/api/scans/"),
+    "active-sessions": ("GET", "/api/sessions/active/list"),
+    "photo-scans": ("GET", "/api/photo-scanner/scans/?limit=50"),
+}
+
+
+async def run_client(client, method, path, deadline, latencies, errors, counter):
+    while time.perf_counter() < deadline:
+        kwargs = {}
+        if method == "POST":
+            kwargs["json"] = {
+                "qr_content": f"BENCH-{next(counter)}",
+                "scan_source": "bench",
+                "idempotency_key": uuid.uuid4().hex,
+            }
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, path, **kwargs)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        if ok:
+            latencies.append(time.perf_counter() - started)
+        else:
+            errors.append(1)
+
+
+async def bench(base_url, endpoint, clients, duration):
+    method, path = ENDPOINTS[endpoint]
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    latencies = []
+    errors = []
+    counter = itertools.count()
+    async with httpx.AsyncClient(
+        base_url=base_url, limits=limits, timeout=30
+    ) as client:
+        # Warm up connections and the server's pools
+        await asyncio.gather(
+            *(client.request("GET", "/health") for _ in range(clients)),
+            return_exceptions=True,
+        )
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(
+            *(
+                run_client(client, method, path, deadline, latencies, errors, counter)
+                for _ in range(clients)
+            )
+        )
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(p):
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / elapsed,
+        "p50": percentile(0.50),
+        "p95": percentile(0.95),
+        "mean": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--url",
+        action="append",
+        help="label=base URL of a server to benchmark (repeat to compare)",
+    )
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds")
+    parser.add_argument(
+        "--endpoint",
+        action="append",
+        choices=sorted(ENDPOINTS),
+        help="endpoint to benchmark (default: all)",
+    )
+    args = parser.parse_args()
+
+    urls = []
+    for value in args.url or ["http://localhost:8000"]:
+        label, _, url = value.rpartition("=")
+        urls.append((label or url, url))
+
+    print(f"{args.clients} concurrent clients, {args.duration:g}s per run")
+    print(
+        f"{'endpoint':<16} {'server':<10} {'req/s':>9} {'p50 ms':>8} "
+        f"{'p95 ms':>8} {'errors':>7}"
+    )
+    for endpoint in args.endpoint or list(ENDPOINTS):
+        baseline = None
+        for label, url in urls:
+            result = await bench(url, endpoint, args.clients, args.duration)
+            change = ""
+            if baseline:
+                change = f"  x{result['rps'] / baseline:.2f}"
+            elif result["rps"]:
+                baseline = result["rps"]
+            print(
+                f"{endpoint:<16} {label:<10} {result['rps']:>9.1f} "
+                f"{result['p50']:>8.1f} {result['p95']:>8.1f} "
+                f"{result['errors']:>7}{change}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+"""Fake raw TCP (port 9100) label printer for local testing.
+
+Accepts persistent connections, counts the ZPL labels (^XA ... ^XZ) it
+receives and answers ~HS host status queries like a ready Zebra printer.
+
+    python scripts/fake_printer.py --port 9100
+"""
+import argparse
+import asyncio
+
+HOST_STATUS = (
+    b"\x02030,0,0,1245,000,0,0,0,000,0,0,0\x03\r\n"
+    b"\x02000,0,0,0,0,2,4,0,00000000,1,000\x03\r\n"
+    b"\x021234,0\x03\r\n"
+)
+
+
+class FakePrinter:
+    def __init__(self, paper_out: bool = False, delay: float = 0.0):
+        self.paper_out = paper_out
+        self.delay = delay
+        self.labels = 0
+        self.connections = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        peer = writer.get_extra_info("peername")
+        print(f"connection #{self.connections} from {peer}")
+        buffer = b""
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                buffer += data
+
+                if b"~HS" in buffer:
+                    buffer = buffer.replace(b"~HS", b"")
+                    status = HOST_STATUS
+                    if self.paper_out:
+                        status = status.replace(b"\x02030,0,", b"\x02030,1,", 1)
+                    writer.write(status)
+                    await writer.drain()
+
+                while b"^XZ" in buffer:
+                    label, buffer = buffer.split(b"^XZ", 1)
+                    if self.delay:
+                        await asyncio.sleep(self.delay)
+                    self.labels += 1
+                    print(f"label #{self.labels}: {label.decode(errors='replace')}^XZ")
+        finally:
+            writer.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--paper-out", action="store_true")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds per label")
+    args = parser.parse_args()
+
+    printer = FakePrinter(args.paper_out, args.delay)
+    server = await asyncio.start_server(printer.handle, args.host, args.port)
+    print(f"fake printer listening on {args.host}:{args.port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())